@@ -4,13 +4,106 @@ Diagnosis API endpoints for Smart Agriculture system.
 This module provides diagnosis submission and task status query functionality.
 """
 
-from fastapi import APIRouter, HTTPException
-from celery.result import AsyncResult
-from app.worker.celery_app import celery_app
-from app.worker.diagnosis_tasks import analyze_image
-from app.models.diagnosis import DiagnoseRequest, DiagnoseResponse, TaskStatus
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from celery import states
+from functools import lru_cache
+from typing import AsyncIterator
+import uuid
+from app.core.cache import TTLCache
+from app.core.config import SETTINGS
+from app.models.diagnosis import (
+    REPORT_STATUS_PENDING,
+    REPORT_STATUS_READY,
+    DiagnoseRequest,
+    DiagnoseResponse,
+    TaskStatus,
+)
+from app.services.report_stream import (
+    EVENT_IDLE,
+    REPORT_STREAM_BLOCK_MS,
+    iter_report_stream,
+)
 
-router = APIRouter(prefix="/api/v1/diagnose", tags=["diagnose"])
+router = APIRouter(prefix="/diagnose", tags=["diagnose"])
+
+# 任务状态缓存：客户端通常每 1-2 秒轮询一次
+# 未完成的任务只短暂缓存以吸收突发轮询；终态（SUCCESS/FAILURE/REVOKED）不会再变化，可长时间缓存
+TASK_STATUS_TTL_PENDING = 0.5  # 秒
+TASK_STATUS_TTL_READY = 300  # 秒
+# 缓存的是序列化后的 JSON 字节，命中时无需再次校验/序列化
+_task_status_cache = TTLCache(maxsize=10000, ttl=TASK_STATUS_TTL_PENDING)
+
+
+# 报告流：超过该时长没有新内容则结束 SSE 连接（任务未生成报告或报告流已过期）
+REPORT_STREAM_IDLE_TIMEOUT = 120  # 秒
+# SSE 心跳（注释行），防止代理因连接空闲而断开
+SSE_KEEPALIVE = b": keep-alive\n\n"
+
+
+# 诊断任务按名称投递（send_task），API 进程无需导入 diagnosis_tasks（会连带加载 RAG/LangChain）
+ANALYZE_IMAGE_TASK = "app.worker.diagnosis_tasks.analyze_image"
+
+
+# Celery 应用在首次使用时才导入，缩短 API 进程冷启动时间
+@lru_cache(maxsize=1)
+def _get_celery_app():
+    from app.worker.celery_app import celery_app
+    return celery_app
+
+
+def _get_task_meta(task_id: str) -> dict:
+    """
+    读取任务元数据（status/result/traceback）。
+
+    AsyncResult 在任务未完成时不缓存元数据，访问 state 和 result/info 会各查询一次结果后端；
+    直接调用 backend.get_task_meta 一次取回全部字段。
+    """
+    return _get_celery_app().backend.get_task_meta(task_id)
+
+
+def _sse_event(event: str, data: str) -> bytes:
+    """按 SSE 格式编码一个事件（多行数据拆成多个 data 行）。"""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {event}\n{lines}\n".encode("utf-8")
+
+
+def _validate_task_id(task_id: str) -> None:
+    """Celery 任务 ID 均为 UUID，格式非法的请求（扫描器、模糊测试）直接拒绝，不访问后端。"""
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid task_id")
+
+
+def _merge_report(result: dict) -> dict:
+    """
+    合并后续报告任务的结果（诊断提前返回、报告异步生成时）。
+
+    Args:
+        result: 诊断任务结果（report_status 为 PENDING）
+
+    Returns:
+        合并后的结果；报告任务未完成时原样返回
+    """
+    report_meta = _get_task_meta(result["report_task_id"])
+    report_state = report_meta["status"]
+    if report_state == states.SUCCESS:
+        report_result = report_meta["result"]
+        return {
+            **result,
+            "report": report_result["report"],
+            "report_error": report_result["report_error"],
+            "report_status": REPORT_STATUS_READY,
+        }
+    if report_state in states.READY_STATES:
+        # 报告任务失败或被撤销：诊断结果仍然有效，只记录报告错误
+        return {
+            **result,
+            "report_error": f"Report task {report_state}: {report_meta.get('result')}",
+            "report_status": REPORT_STATUS_READY,
+        }
+    return result
 
 
 @router.post("", response_model=DiagnoseResponse)
@@ -48,16 +141,20 @@ async def create_diagnosis(
         # 提取图片 URL 字符串
         image_url_str = str(request.image_url)
 
-        # 创建 Celery 异步任务
-        task = analyze_image.delay(
-            image_url=image_url_str,
-            crop_type=request.crop_type,
-            location=request.location
+        # 创建 Celery 异步任务（直接按任务名投递，跳过 Signature 构建）
+        task = _get_celery_app().send_task(
+            ANALYZE_IMAGE_TASK,
+            kwargs={
+                "image_url": image_url_str,
+                "crop_type": request.crop_type,
+                "location": request.location,
+            },
         )
 
+        # 刚投递的任务必然是 PENDING，无需再查询结果后端
         return DiagnoseResponse(
             task_id=task.id,
-            status=task.state,
+            status=states.PENDING,
             message="Diagnosis task created successfully"
         )
 
@@ -71,7 +168,7 @@ async def create_diagnosis(
 @router.get("/tasks/{task_id}", response_model=TaskStatus)
 async def get_task_status(
     task_id: str,
-) -> TaskStatus:
+) -> Response:
     """
     查询诊断任务状态和结果。
 
@@ -79,10 +176,10 @@ async def get_task_status(
         task_id: 任务 ID
 
     Returns:
-        任务状态和结果（如果完成）
+        任务状态和结果（如果完成），已序列化为 TaskStatus JSON
 
     Raises:
-        HTTPException: 当任务 ID 无效时
+        HTTPException: 当任务 ID 不是合法 UUID 时返回 400
 
     Example:
         GET /api/v1/diagnose/tasks/a1b2c3d4-5678-90ab-cdef-123456789abc
@@ -110,22 +207,96 @@ async def get_task_status(
             "error": null
         }
     """
-    # 查询 Celery 任务状态
-    task = AsyncResult(task_id, app=celery_app)
+    _validate_task_id(task_id)
+
+    # 命中缓存则直接返回，跳过结果后端查询
+    cached = _task_status_cache.get(task_id)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
 
-    # 准备响应
-    response_data = {
-        "task_id": task_id,
-        "status": task.state,
-        "result": None,
-        "error": None
-    }
+    # 查询 Celery 任务状态（一次结果后端读取）
+    meta = _get_task_meta(task_id)
+    state = meta["status"]
+    result = None
+    error = None
 
     # 如果任务成功，返回结果
-    if task.state == "SUCCESS" and task.result:
-        response_data["result"] = task.result
-    # 如果任务失败，返回错误信息
-    elif task.state == "FAILURE":
-        response_data["error"] = str(task.info)
+    if state == states.SUCCESS and meta.get("result"):
+        result = meta["result"]
+        # 报告由后续任务生成：报告完成前诊断结果先返回（report_status=PENDING）
+        if result.get("report_status") == REPORT_STATUS_PENDING:
+            result = _merge_report(result)
+    # 如果任务失败，返回错误信息（backend 已将 result 还原为异常对象）
+    elif state == states.FAILURE:
+        error = str(meta.get("result"))
+
+    # 校验一次后直接用 pydantic-core 序列化为 JSON 字节；
+    # 返回 Response 时 FastAPI 不会再按 response_model 重复校验和序列化
+    task_status = TaskStatus(task_id=task_id, status=state, result=result, error=error)
+    body = task_status.model_dump_json().encode("utf-8")
+    # 报告仍在生成时结果还会变化，按未完成任务短暂缓存
+    ready = task_status.status in states.READY_STATES and not (
+        task_status.result and task_status.result.report_status == REPORT_STATUS_PENDING
+    )
+    _task_status_cache.set(
+        task_id,
+        body,
+        ttl=TASK_STATUS_TTL_READY if ready else None,
+    )
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/tasks/{task_id}/stream")
+async def stream_task_report(
+    task_id: str,
+) -> StreamingResponse:
+    """
+    以 Server-Sent Events 实时推送诊断报告（需开启 REPORT_STREAMING）。
+
+    报告由 worker 边生成边写入 Redis Stream，客户端无需等待整份报告生成完毕。
+    事件类型：chunk（报告片段）、end（报告完成）、error（生成失败）、
+    timeout（长时间没有新内容，如该诊断不需要生成报告）。
+    完整报告仍可通过 GET /diagnose/tasks/{task_id} 获取。
+
+    Args:
+        task_id: 诊断任务 ID
+
+    Returns:
+        text/event-stream 响应
+
+    Raises:
+        HTTPException: 任务 ID 非法时返回 400，未开启报告流时返回 404
+
+    Example:
+        GET /api/v1/diagnose/tasks/a1b2c3d4-5678-90ab-cdef-123456789abc/stream
+
+        Response:
+        event: chunk
+        data: # 番茄晚疫病诊断报告
+
+        event: end
+        data:
+    """
+    if not SETTINGS.report_streaming:
+        raise HTTPException(status_code=404, detail="Report streaming is disabled")
+    _validate_task_id(task_id)
+
+    async def events() -> AsyncIterator[bytes]:
+        idle_ms = 0
+        async for event, data in iter_report_stream(task_id):
+            if event == EVENT_IDLE:
+                idle_ms += REPORT_STREAM_BLOCK_MS
+                if idle_ms >= REPORT_STREAM_IDLE_TIMEOUT * 1000:
+                    yield _sse_event("timeout", "")
+                    return
+                yield SSE_KEEPALIVE
+                continue
+            idle_ms = 0
+            yield _sse_event(event, data)
 
-    return TaskStatus(**response_data)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 禁止缓存，并关闭 nginx 的响应缓冲，片段到达即转发
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
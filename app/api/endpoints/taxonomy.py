@@ -5,7 +5,8 @@ This module provides REST API endpoints for querying taxonomy data
 including pest and disease classifications.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Response
+from pydantic import TypeAdapter
 from typing import List
 
 from app.services.taxonomy_service import (
@@ -15,19 +16,22 @@ from app.services.taxonomy_service import (
 )
 from app.core import depends_taxonomy
 
-router = APIRouter(prefix="/api/v1/taxonomy", tags=["taxonomy"])
+router = APIRouter(prefix="/taxonomy", tags=["taxonomy"])
 
+# 条目已在加载时校验过，响应直接用 pydantic-core 序列化，跳过 FastAPI 按 response_model 的重复校验
+_entry_list_adapter = TypeAdapter(List[TaxonomyEntry])
 
-@router.get("/search")
+
+@router.get("/search", response_model=List[TaxonomyEntry])
 async def search_taxonomy(
-    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词（中文名称或模型标签）"),
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词（中文名称或模型标签，以 * 结尾表示前缀匹配）"),
     taxonomy: TaxonomyService = Depends(depends_taxonomy),
-) -> List[TaxonomyEntry]:
+) -> Response:
     """
     根据中文名称或模型标签搜索分类条目。
 
     Args:
-        q: 搜索关键词，支持中文名称或模型标签
+        q: 搜索关键词，支持中文名称或模型标签；以 * 结尾时按前缀匹配（如 powdery*）
         taxonomy: TaxonomyService 依赖注入
 
     Returns:
@@ -54,23 +58,7 @@ async def search_taxonomy(
             }
         ]
     """
-    results = []
-
-    # 尝试按中文名称搜索
-    try:
-        result = taxonomy.get_by_name(q)
-        results.append(result)
-    except TaxonomyNotFoundError:
-        pass
-
-    # 尝试按模型标签搜索
-    try:
-        result = taxonomy.get_by_model_label(q)
-        # 避免重复（如果同一条目同时匹配名称和标签）
-        if result not in results:
-            results.append(result)
-    except TaxonomyNotFoundError:
-        pass
+    results = taxonomy.lookup(q)
 
     if not results:
         raise HTTPException(
@@ -78,14 +66,14 @@ async def search_taxonomy(
             detail=f"Taxonomy entry not found for query: '{q}'"
         )
 
-    return results
+    return Response(content=_entry_list_adapter.dump_json(results), media_type="application/json")
 
 
-@router.get("/{id}")
+@router.get("/{id}", response_model=TaxonomyEntry)
 async def get_taxonomy_entry(
     id: int = Path(..., ge=0, le=1000, description="分类 ID (0-1000)"),
     taxonomy: TaxonomyService = Depends(depends_taxonomy),
-) -> TaxonomyEntry:
+) -> Response:
     """
     根据 ID 查询分类条目。
 
@@ -116,6 +104,8 @@ async def get_taxonomy_entry(
         }
     """
     try:
-        return taxonomy.get_by_id(id)
+        entry = taxonomy.get_by_id(id)
     except TaxonomyNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+    return Response(content=entry.model_dump_json(), media_type="application/json")
@@ -5,17 +5,27 @@ This module provides image upload functionality using StorageService.
 """
 
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from app.services.storage import StorageService, StorageConnectionError
 from app.core import depends_storage
 from app.models.diagnosis import UploadResponse
-import uuid
+import hashlib
+from urllib.parse import quote
 
-router = APIRouter(prefix="/api/v1/upload", tags=["upload"])
+router = APIRouter(prefix="/upload", tags=["upload"])
 
 # 允许的文件类型
-ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/jpg", "image/png"]
+ALLOWED_CONTENT_TYPES: frozenset[str] = frozenset(("image/jpeg", "image/jpg", "image/png"))
+# 文件类型不支持时的错误信息模板（模块加载时生成一次）
+UNSUPPORTED_TYPE_DETAIL = (
+    "Unsupported file type: {}. Allowed: " + ", ".join(sorted(ALLOWED_CONTENT_TYPES))
+)
 # 最大文件大小 (10MB)
 MAX_FILE_SIZE = 10 * 1024 * 1024
+# 整个请求体的上限：文件大小 + multipart 边界/表单头的余量（由 MaxBodySizeMiddleware 在读取请求体前检查）
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 64 * 1024
+# 流式读取的分块大小 (256KB)
+UPLOAD_CHUNK_SIZE = 256 * 1024
 
 
 @router.post("", response_model=UploadResponse)
@@ -42,8 +52,8 @@ async def upload_image(
 
         Response:
         {
-            "url": "http://localhost:9010/smart-agriculture/a1b2c3d4-photo.jpg",
-            "filename": "a1b2c3d4-photo.jpg",
+            "url": "http://localhost:9010/smart-agriculture/3f2a9c0e8b1d4e6f7a5b2c9d0e1f3a4b.jpg",
+            "filename": "3f2a9c0e8b1d4e6f7a5b2c9d0e1f3a4b.jpg",
             "original_filename": "photo.jpg",
             "content_type": "image/jpeg"
         }
@@ -52,18 +62,23 @@ async def upload_image(
     if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type: {file.content_type}. Allowed: {', '.join(ALLOWED_CONTENT_TYPES)}"
+            detail=UNSUPPORTED_TYPE_DETAIL.format(file.content_type)
         )
 
-    # 读取文件内容并验证大小
-    file_content = await file.read()
-    file_size = len(file_content)
-
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large: {file_size} bytes. Maximum size: {MAX_FILE_SIZE} bytes"
-        )
+    # 分块读取并验证大小（不把整个文件载入内存，超限立即中断），同时增量计算内容哈希
+    file_size = 0
+    hasher = hashlib.blake2b(digest_size=16)
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        file_size += len(chunk)
+        hasher.update(chunk)
+        if file_size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=(
+                    f"File too large: exceeds {MAX_FILE_SIZE} bytes. "
+                    f"Maximum size: {MAX_FILE_SIZE} bytes"
+                ),
+            )
 
     if file_size == 0:
         raise HTTPException(
@@ -71,26 +86,39 @@ async def upload_image(
             detail="Empty file"
         )
 
-    # 生成唯一文件名
-    file_extension = file.filename.split(".")[-1] if file.filename and "." in file.filename else "jpg"
-    unique_filename = f"{uuid.uuid4()}_{file.filename}"
+    # 以内容哈希 + 扩展名作为对象键（相同内容得到相同键；原始文件名不进入对象键，只作为元数据保存）
+    _, dot, file_extension = (file.filename or "").rpartition(".")
+    if dot and file_extension.isascii() and file_extension.isalnum():
+        file_extension = file_extension.lower()
+    else:
+        file_extension = "jpg"
+    unique_filename = f"{hasher.hexdigest()}.{file_extension}"
+    original_filename = file.filename or "unknown"
 
     try:
-        # 重置文件指针
-        import io
-        file.file = io.BytesIO(file_content)
-
-        # 上传到 MinIO
-        url = storage.upload_image(
-            file.file,
-            unique_filename,
-            content_type=file.content_type
-        )
+        # 相同内容已上传过则直接复用，跳过 PUT（minio-py 为同步阻塞 I/O，放到线程池执行）
+        if await run_in_threadpool(storage.object_exists, unique_filename):
+            url = storage.get_public_url(unique_filename)
+        else:
+            # 重置文件指针，直接将 UploadFile 底层的临时文件流式上传（无需再拷贝一份）
+            await file.seek(0)
+
+            # 上传到 MinIO（放到线程池执行，避免阻塞事件循环）
+            url = await run_in_threadpool(
+                storage.upload_image,
+                file.file,
+                unique_filename,
+                content_type=file.content_type,
+                # S3 元数据只能是 ASCII，原始文件名做 URL 编码
+                metadata={"original-filename": quote(original_filename)},
+                # 大小已在分块读取时统计，MinIO 可走单次 PUT 而非分片上传
+                length=file_size,
+            )
 
         return UploadResponse(
             url=url,
             filename=unique_filename,
-            original_filename=file.filename or "unknown",
+            original_filename=original_filename,
             content_type=file.content_type
         )
 
@@ -4,16 +4,37 @@ FastAPI Main Application for Smart Agriculture System.
 This module initializes the FastAPI application with all routes and middleware.
 """
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+import logging
+from contextlib import asynccontextmanager
 
-from app.core.config import get_settings
+import orjson
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+
+from app.core.config import SETTINGS as settings
+from app.api.middleware import MaxBodySizeMiddleware
+from app.core.ssrf_protection import aclose_async_client
+from app.services.report_stream import aclose_async_redis
+from app.services.storage import StorageConnectionError
 from app.api.endpoints.taxonomy import router as taxonomy_router
-from app.api.endpoints.upload import router as upload_router
+from app.api.endpoints.upload import MAX_REQUEST_SIZE, router as upload_router
 from app.api.endpoints.diagnose import router as diagnose_router
 
-# Initialize settings
-settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Pre-serialized error envelopes (the body never changes, so encode it once)
+_ERR_500 = orjson.dumps({"error": "Internal server error"})
+_ERR_503 = orjson.dumps({"error": "Service unavailable"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release shared resources on shutdown (they are created lazily on first use)."""
+    yield
+    await aclose_async_client()
+    await aclose_async_redis()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -22,12 +43,33 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    # orjson 序列化比标准库 json 快数倍，且原生输出 UTF-8（中文无需转义）
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-# Register routers
-app.include_router(taxonomy_router)
-app.include_router(upload_router)
-app.include_router(diagnose_router)
+# Reject oversized uploads from the Content-Length header, before the body is parsed
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_body_size=MAX_REQUEST_SIZE,
+    path_prefixes=("/api/v1/upload",),
+)
+
+# CORS (added last so it is the outermost layer and also decorates early 413 responses).
+# Immutable option tuples; preflight results are cached by browsers for a day.
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=tuple(settings.cors_origins),
+    allow_methods=("GET", "POST"),
+    allow_headers=("Content-Type",),
+    max_age=86400,
+)
+
+# All v1 endpoints share one prefix router (endpoint routers carry only their own sub-prefix)
+api_v1 = APIRouter(prefix="/api/v1")
+api_v1.include_router(taxonomy_router)
+api_v1.include_router(upload_router)
+api_v1.include_router(diagnose_router)
 
 
 @app.get("/")
@@ -40,13 +82,13 @@ async def root():
     }
 
 
-@app.get("/api/v1/health")
+@api_v1.get("/health", include_in_schema=False)
 async def health_check():
     """Health check endpoint for Docker health checks."""
     return {"status": "healthy", "service": "smart-agriculture-web"}
 
 
-@app.get("/api/v1/info")
+@api_v1.get("/info", include_in_schema=False)
 async def system_info():
     """System information endpoint."""
     return {
@@ -56,11 +98,35 @@ async def system_info():
     }
 
 
+# Register routers
+app.include_router(api_v1)
+
+
+# Storage backend (MinIO) unreachable, e.g. while initializing the dependency
+@app.exception_handler(StorageConnectionError)
+async def storage_exception_handler(request: Request, exc: StorageConnectionError):
+    """Map storage connection failures to 503."""
+    logger.warning("Storage unavailable on %s %s: %s", request.method, request.url.path, exc)
+    if settings.debug:
+        return ORJSONResponse(
+            status_code=503,
+            content={"error": "Service unavailable", "detail": str(exc)},
+        )
+    return Response(content=_ERR_503, status_code=503, media_type="application/json")
+
+
 # Global exception handler
 @app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    """Handle all uncaught exceptions."""
-    return JSONResponse(
-        status_code=500,
-        content={"error": "Internal server error", "detail": str(exc)},
-    )
+async def global_exception_handler(request: Request, exc: Exception):
+    """Handle all uncaught exceptions (details are only exposed in debug mode)."""
+    logger.error("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+    if settings.debug:
+        return ORJSONResponse(
+            status_code=500,
+            content={"error": "Internal server error", "detail": str(exc)},
+        )
+    return Response(content=_ERR_500, status_code=500, media_type="application/json")
+
+
+# Build the OpenAPI schema once at import instead of on the first /docs hit
+app.openapi_schema = app.openapi()
@@ -0,0 +1,80 @@
+"""
+ASGI middleware for Smart Agriculture API.
+
+This module provides middleware that runs before FastAPI parses the request,
+so oversized uploads can be rejected without reading the body.
+"""
+
+from typing import Tuple
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class MaxBodySizeMiddleware:
+    """
+    Reject requests whose Content-Length exceeds a limit with 413.
+
+    FastAPI parses (and spools) the whole multipart body before the endpoint
+    runs, so a size check inside the endpoint only happens after the upload
+    has been received. This middleware checks the Content-Length header first
+    and answers immediately. Requests without Content-Length (chunked
+    transfer) are passed through and still limited by the endpoint's own
+    streaming check.
+
+    Example:
+        >>> app.add_middleware(
+        ...     MaxBodySizeMiddleware,
+        ...     max_body_size=10 * 1024 * 1024,
+        ...     path_prefixes=("/api/v1/upload",),
+        ... )
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_body_size: int,
+        path_prefixes: Tuple[str, ...] = ("/",),
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: Downstream ASGI application
+            max_body_size: Maximum accepted Content-Length in bytes
+            path_prefixes: Only requests whose path starts with one of these are checked
+        """
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_prefixes = tuple(path_prefixes)
+        # 错误响应体只序列化一次
+        self._body = orjson.dumps(
+            {"detail": f"Request body too large. Maximum size: {max_body_size} bytes"}
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.path_prefixes):
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    # 非法的 Content-Length 交给服务器/框架处理
+                    if value.isdigit() and int(value) > self.max_body_size:
+                        await self._reject(send)
+                        return
+                    break
+
+        await self.app(scope, receive, send)
+
+    async def _reject(self, send: Send) -> None:
+        """Send a 413 response without reading the request body."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(self._body)).encode("latin-1")),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": self._body})
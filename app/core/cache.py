@@ -0,0 +1,240 @@
+"""
+Caches for Smart Agriculture system.
+
+This module provides a small thread-safe in-process cache with per-entry
+expiry and LRU eviction, used to absorb repeated lookups on hot paths (e.g.
+task status polling), and a SQLite-backed LRU that survives process restarts
+and is shared between worker processes. Neither adds an external dependency.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Each entry may override the default TTL, so callers can keep stable
+    values (e.g. finished tasks) much longer than volatile ones.
+
+    Example:
+        >>> cache = TTLCache(maxsize=1000, ttl=0.5)
+        >>> cache.set("task-1", {"status": "PENDING"})
+        >>> cache.get("task-1")
+        {'status': 'PENDING'}
+        >>> cache.set("task-2", {"status": "SUCCESS"}, ttl=300)
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept (least recently used are evicted)
+            ttl: Default time-to-live in seconds
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing or expired
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            ttl: Time-to-live in seconds (default: the cache-wide ttl)
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key and return its value (expired or not), or default."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Persistent LRU cache of bytes values stored in a SQLite file.
+
+    Several processes (e.g. Celery workers) can share one file; entries
+    survive worker recycling and restarts. Storage errors are logged and
+    treated as cache misses, so a broken cache file never fails the caller.
+
+    Example:
+        >>> cache = SQLiteCache("data/rag_cache.db", maxsize=10000, ttl=86400)
+        >>> cache.set("key", b"value")
+        >>> cache.get("key")
+        b'value'
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 86400.0):
+        """
+        Initialize the cache (the file is opened lazily on first use).
+
+        Args:
+            path: SQLite database file
+            maxsize: Maximum number of entries kept (least recently used are evicted)
+            ttl: Time-to-live in seconds
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 复用（Celery prefork 子进程），进程变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get a cached value.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached bytes, or None when missing, expired or unreadable
+        """
+        now = time.time()
+        # 读操作不创建缓存文件
+        if self._conn is None and not os.path.exists(self.path):
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                return row[0]
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("SQLite cache read failed (%s): %s", self.path, e)
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store a value, evicting expired and least recently used entries.
+
+        Args:
+            key: Cache key
+            value: Bytes to cache
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now + self.ttl, now),
+                )
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("SQLite cache write failed (%s): %s", self.path, e)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM cache")
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("SQLite cache clear failed (%s): %s", self.path, e)
+
+    def close(self) -> None:
+        """Close the database connection (reopened on next use)."""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def __len__(self) -> int:
+        try:
+            with self._lock:
+                return self._connection().execute(
+                    "SELECT COUNT(*) FROM cache WHERE expires_at > ?", (time.time(),)
+                ).fetchone()[0]
+        except (sqlite3.Error, OSError):
+            return 0
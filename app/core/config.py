@@ -5,7 +5,7 @@ This module defines the Settings class that loads configuration from
 environment variables and .env files.
 """
 
-from typing import Any, List
+from typing import Any, Final, List, Literal, Optional
 
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -46,6 +46,37 @@ class Settings(BaseSettings):
     celery_result_backend: str = Field(
         default="redis://localhost:6379/0", description="Celery result backend"
     )
+    celery_serializer: Literal["json", "msgpack"] = Field(
+        default="json",
+        description=(
+            "Serializer for task messages and results "
+            "(msgpack requires the msgpack package)"
+        ),
+    )
+    celery_result_compression: Optional[str] = Field(
+        default="zstd",
+        description=(
+            "Compression for stored task results "
+            "(zstd, gzip, bzip2, lzma; empty to disable)"
+        ),
+    )
+    celery_result_expires: int = Field(
+        default=3600, ge=0, description="Seconds to keep task results in the backend"
+    )
+    celery_result_keyprefix: str = Field(
+        default="", description="Global key prefix for result backend keys (e.g. 'sa:')"
+    )
+    diagnosis_early_return: bool = Field(
+        default=False,
+        description=(
+            "Return the diagnosis before the LLM report; "
+            "the report is generated by a follow-up task"
+        ),
+    )
+    report_streaming: bool = Field(
+        default=False,
+        description="Publish LLM report chunks to Redis so clients can follow them over SSE",
+    )
 
     # MinIO (Object storage)
     minio_endpoint: str = Field(default="localhost:9000", description="MinIO endpoint")
@@ -53,6 +84,18 @@ class Settings(BaseSettings):
     minio_secret_key: str = Field(default="", description="MinIO secret key")
     minio_bucket_name: str = Field(default="smart-agriculture", description="MinIO bucket name")
     minio_secure: bool = Field(default=False, description="Use HTTPS for MinIO")
+    minio_pool_maxsize: int = Field(
+        default=64,
+        ge=1,
+        description="Max pooled connections per MinIO host (>= worker concurrency)",
+    )
+
+    # Image download
+    dns_resolver_threads: int = Field(
+        default=64,
+        ge=1,
+        description="Threads for synchronous DNS lookups (>= worker concurrency)",
+    )
 
     # API Configuration
     api_v1_prefix: str = Field(default="/api/v1", description="API v1 prefix")
@@ -76,24 +119,21 @@ class Settings(BaseSettings):
         env_file_encoding="utf-8",
         case_sensitive=False,
         extra="ignore",
+        frozen=True,
     )
 
 
-# Global settings instance
-_settings: Settings | None = None
+# Global settings instance (validated once at import time, immutable afterwards)
+SETTINGS: Final[Settings] = Settings()
 
 
 def get_settings() -> Settings:
     """
     Get the global Settings instance.
 
+    Kept for backwards compatibility; hot paths can import SETTINGS directly.
+
     Returns:
         Settings: The application settings
-
-    Raises:
-        ValidationError: If environment variables are invalid
     """
-    global _settings
-    if _settings is None:
-        _settings = Settings()
-    return _settings
+    return SETTINGS
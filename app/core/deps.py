@@ -6,26 +6,18 @@ This module provides dependency injection functions for FastAPI routes.
 
 from typing import TYPE_CHECKING
 
-from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
 
 if TYPE_CHECKING:
     from app.services.storage import StorageService
     from app.services.taxonomy_service import TaxonomyService
 
-# Lazy imports to avoid circular dependency
-def _get_taxonomy_service():
-    from app.services.taxonomy_service import get_taxonomy_service
-    return get_taxonomy_service()
-
-
-def _get_storage_service():
-    from app.services.storage import get_storage_service
-    return get_storage_service()
+# Service modules are imported inside the dependencies to avoid a circular
+# import (app.services.* -> app.core.config -> app.core). After the first call
+# this is just a sys.modules lookup.
 
 
-async def depends_taxonomy(
-    service: "TaxonomyService" = Depends(_get_taxonomy_service),
-) -> "TaxonomyService":
+async def depends_taxonomy() -> "TaxonomyService":
     """
     FastAPI dependency injection for TaxonomyService.
 
@@ -41,12 +33,12 @@ async def depends_taxonomy(
     Returns:
         TaxonomyService: The singleton taxonomy service instance
     """
-    return service
+    from app.services.taxonomy_service import get_taxonomy_service
+
+    return get_taxonomy_service()
 
 
-async def depends_storage(
-    service: "StorageService" = Depends(_get_storage_service),
-) -> "StorageService":
+async def depends_storage() -> "StorageService":
     """
     FastAPI dependency injection for StorageService.
 
@@ -62,4 +54,10 @@ async def depends_storage(
     Returns:
         StorageService: The singleton storage service instance
     """
-    return service
+    from app.services import storage
+
+    service = storage.peek_storage_service()
+    if service is not None:
+        return service
+    # First initialization connects to MinIO (blocking I/O), keep it off the event loop
+    return await run_in_threadpool(storage.get_storage_service)
@@ -13,31 +13,54 @@ Key features:
 
 import asyncio
 import atexit
+import bisect
+import io
 import ipaddress
 import logging
+import re
 import socket
-from typing import Optional, Tuple
-from urllib.parse import urlparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import ParseResult, urljoin, urlparse
 
 import httpx
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from app.core.cache import TTLCache
+from app.core.config import SETTINGS
+
 logger = logging.getLogger(__name__)
 
 # 配置常量
-ALLOWED_SCHEMES = ("http", "https")
-ALLOWED_IMAGE_TYPES = (
-    "image/jpeg",
-    "image/jpg",
-    "image/png",
-    "image/gif",
-    "image/webp",
-    "image/bmp",
+ALLOWED_SCHEMES: frozenset[str] = frozenset(("http", "https"))
+ALLOWED_IMAGE_TYPES: frozenset[str] = frozenset(
+    (
+        "image/jpeg",
+        "image/jpg",
+        "image/png",
+        "image/gif",
+        "image/webp",
+        "image/bmp",
+    )
 )
+# 错误信息中的允许列表（排序后生成一次，输出稳定）
+_ALLOWED_SCHEMES_TEXT = ", ".join(sorted(ALLOWED_SCHEMES))
+_ALLOWED_IMAGE_TYPES_TEXT = ", ".join(sorted(ALLOWED_IMAGE_TYPES))
 MAX_IMAGE_SIZE_BYTES = 10 * 1024 * 1024  # 10MB
 DOWNLOAD_TIMEOUT = 30  # 秒
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 下载分块大小（64KB，减少 Python 层循环次数）
+DOWNLOAD_USER_AGENT = "Smart-Agriculture-Diagnosis/1.0"
+MAX_REDIRECTS = 3  # 最多跟随的重定向次数（每一跳都重新验证）
+REDIRECT_STATUS_CODES: frozenset[int] = frozenset((301, 302, 303, 307, 308))
+
+# DNS 解析缓存（同一 CDN 主机的重复下载无需每次查询 DNS）
+DNS_CACHE_TTL = 30  # 秒
+DNS_CACHE_MAXSIZE = 4096  # 最多缓存的主机名数量
+DNS_TIMEOUT = 5  # 单次 DNS 查询超时（秒），防止 DNS 慢速攻击
 
 # HTTP 连接池配置
 SESSION_POOL_CONNECTIONS = 10  # 连接池大小（不同主机）
@@ -45,9 +68,37 @@ SESSION_POOL_MAXSIZE = 50  # 每个主机的最大连接数
 SESSION_MAX_RETRIES = 3  # 自动重试次数
 SESSION_BACKOFF_FACTOR = 0.3  # 重试退避系数
 
+# 异步 HTTP 连接池配置（API 进程内所有并发下载共享）
+ASYNC_POOL_MAX_CONNECTIONS = 100  # 最大并发连接数
+ASYNC_POOL_MAX_KEEPALIVE = 50  # 保持活跃的空闲连接数（避免重复 TCP/TLS 握手）
+BATCH_DOWNLOAD_CONCURRENCY = 16  # 批量下载的默认并发数
+
+
+class _PinnedHostAdapter(HTTPAdapter):
+    """
+    请求发往已验证的 IP，HTTPS 的 SNI 与证书校验仍使用 Host 头中的原始主机名。
+
+    下载时 URL 中的主机是 IP（防 DNS Rebinding），若不处理，TLS 会以 IP 作为
+    SNI 并按 IP 校验证书，导致依赖 SNI 的站点握手失败或证书不匹配。
+    server_hostname / assert_hostname 是 urllib3 连接池键的一部分，
+    因此不同主机名即使解析到同一 IP 也不会共用连接。
+    """
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(
+            request, verify, cert
+        )
+        host = request.headers.get("Host")
+        if host and host_params["scheme"] == "https":
+            pool_kwargs["server_hostname"] = host
+            pool_kwargs["assert_hostname"] = host
+        return host_params, pool_kwargs
+
 
 # 全局 Session 单例（用于连接池复用）
 _session: Optional[requests.Session] = None
+# Celery 线程池 / FastAPI 线程池中可能并发首次调用，初始化需加锁（否则会各建一个连接池）
+_session_lock = threading.Lock()
 
 
 def _get_http_session() -> requests.Session:
@@ -60,39 +111,44 @@ def _get_http_session() -> requests.Session:
     - max_retries=3: 自动重试次数
     - backoff_factor=0.3: 重试退避系数
 
-    Celery 多进程环境：每个进程有独立的 Session 实例
+    Celery 多进程环境：每个进程有独立的 Session 实例；
+    同一进程内多线程并发首次调用时只会创建一个实例
 
     Returns:
         全局 HTTP Session 实例
     """
     global _session
 
-    if _session is None:
-        _session = requests.Session()
-
-        # 配置连接池和重试策略
-        adapter = HTTPAdapter(
-            pool_connections=SESSION_POOL_CONNECTIONS,
-            pool_maxsize=SESSION_POOL_MAXSIZE,
-            max_retries=Retry(
-                total=SESSION_MAX_RETRIES,
-                backoff_factor=SESSION_BACKOFF_FACTOR,
-                status_forcelist=[500, 502, 503, 504],
-                allowed_methods=["GET"],  # 仅对 GET 请求重试
-            ),
-        )
-        _session.mount("http://", adapter)
-        _session.mount("https://", adapter)
-
-        # 注册进程退出时的清理函数
-        atexit.register(close_http_session)
-
-        logger.info(
-            f"HTTP Session 已初始化（连接池: {SESSION_POOL_CONNECTIONS}/"
-            f"{SESSION_POOL_MAXSIZE}）"
-        )
+    session = _session
+    if session is not None:
+        return session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+
+            # 配置连接池和重试策略
+            adapter = _PinnedHostAdapter(
+                pool_connections=SESSION_POOL_CONNECTIONS,
+                pool_maxsize=SESSION_POOL_MAXSIZE,
+                max_retries=Retry(
+                    total=SESSION_MAX_RETRIES,
+                    backoff_factor=SESSION_BACKOFF_FACTOR,
+                    status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=["GET"],  # 仅对 GET 请求重试
+                ),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+
+            logger.info(
+                "HTTP Session 已初始化（连接池: %d/%d）",
+                SESSION_POOL_CONNECTIONS,
+                SESSION_POOL_MAXSIZE,
+            )
 
-    return _session
+        return _session
 
 
 def close_http_session() -> None:
@@ -104,12 +160,17 @@ def close_http_session() -> None:
     - 进程退出时会自动通过 atexit 清理
     """
     global _session
-    if _session is not None:
-        _session.close()
-        _session = None
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
         logger.info("HTTP Session 已关闭")
 
 
+# 进程退出时的清理函数只注册一次（Session 关闭后重建不会重复注册）
+atexit.register(close_http_session)
+
+
 # =============================================================================
 # Async HTTP Client for Phase 2: HTTP 与 SSRF 异步化
 # =============================================================================
@@ -118,18 +179,40 @@ def close_http_session() -> None:
 _async_client: Optional[httpx.AsyncClient] = None
 
 
+def _new_async_client(timeout: int = DOWNLOAD_TIMEOUT) -> httpx.AsyncClient:
+    """
+    按统一的连接池配置创建一个新的 httpx.AsyncClient。
+
+    Args:
+        timeout: 默认请求超时时间（秒）
+
+    Returns:
+        新的 httpx.AsyncClient 实例（调用方负责关闭）
+    """
+    limits = httpx.Limits(
+        max_keepalive_connections=ASYNC_POOL_MAX_KEEPALIVE,
+        max_connections=ASYNC_POOL_MAX_CONNECTIONS,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=False,  # HTTP/2 在某些情况下不稳定，暂时禁用
+    )
+
+
 def _get_async_client(timeout: int = DOWNLOAD_TIMEOUT) -> httpx.AsyncClient:
     """
     获取全局异步 HTTP Client（连接池复用）。
 
     连接池配置：
-    - limits=httpx.Limits(max_connections=50, max_keepalive_connections=10)
-    - timeout=timeout: 请求超时时间
+    - limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    - timeout=timeout: 默认请求超时时间（单次请求可覆盖）
 
+    FastAPI 应用在 lifespan 启动时预先创建、关闭时通过 aclose_async_client() 释放；
     Celery 多进程环境：每个进程有独立的 AsyncClient 实例
 
     Args:
-        timeout: 请求超时时间（秒）
+        timeout: 默认请求超时时间（秒），仅在首次创建时生效
 
     Returns:
         全局 httpx.AsyncClient 实例
@@ -137,24 +220,15 @@ def _get_async_client(timeout: int = DOWNLOAD_TIMEOUT) -> httpx.AsyncClient:
     global _async_client
 
     if _async_client is None:
-        # 配置连接池
-        limits = httpx.Limits(
-            max_keepalive_connections=SESSION_POOL_CONNECTIONS,
-            max_connections=SESSION_POOL_MAXSIZE,
-        )
-
-        _async_client = httpx.AsyncClient(
-            limits=limits,
-            timeout=timeout,
-            http2=False,  # HTTP/2 在某些情况下不稳定，暂时禁用
-        )
+        _async_client = _new_async_client(timeout=timeout)
 
         # 注册进程退出时的清理函数
         atexit.register(close_async_client)
 
         logger.info(
-            f"Async HTTP Client 已初始化（连接池: {SESSION_POOL_CONNECTIONS}/"
-            f"{SESSION_POOL_MAXSIZE}）"
+            "Async HTTP Client 已初始化（连接池: %d/%d）",
+            ASYNC_POOL_MAX_KEEPALIVE,
+            ASYNC_POOL_MAX_CONNECTIONS,
         )
 
     return _async_client
@@ -186,6 +260,170 @@ def close_async_client() -> None:
         logger.info("Async HTTP Client 已关闭")
 
 
+async def aclose_async_client() -> None:
+    """
+    在当前事件循环中关闭异步 HTTP Client。
+
+    用于 FastAPI lifespan 关闭阶段：与 close_async_client() 不同，
+    会等待连接池真正释放后再返回。
+    """
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.aclose()
+        logger.info("Async HTTP Client 已关闭")
+
+
+# 主机名字符串级别的快速拒绝（DNS 解析前，单次正则匹配）
+# loopback: localhost、127.0.0.0/8、0.0.0.0/8、::1、::
+# private: RFC 1918、链路本地、CGNAT、基准测试网段、多播/保留、
+#          IPv6 ULA/链路本地/多播、IPv4 映射、文档网段、NAT64
+_BLOCKED_HOST_RE = re.compile(
+    r"""
+    ^(?:
+        (?P<loopback>
+            localhost$ | .*\.localhost$
+          | 127\. | 0\.
+          | ::1?$
+        )
+      | (?P<private>
+            10\.
+          | 172\.(?:1[6-9]|2\d|3[01])\.
+          | 192\.168\.
+          | 169\.254\.
+          | 100\.(?:6[4-9]|[7-9]\d|1[01]\d|12[0-7])\.
+          | 198\.1[89]\.
+          | 2(?:2[4-9]|[34]\d|5[0-5])\.
+          | f[cd][0-9a-f]{0,2}:
+          | fe[89ab][0-9a-f]?:
+          | ff[0-9a-f]{0,2}:
+          | ::ffff:
+          | 2001:db8:
+          | 64:ff9b:
+        )
+    )
+    """,
+    re.VERBOSE,
+)
+
+
+def _build_range_table(
+    networks: Iterable[Tuple[str, str]],
+) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[str, ...]]:
+    """
+    将禁止访问的网段编译为按起始地址排序的整数区间表（供 bisect 查找）。
+
+    Args:
+        networks: (CIDR, 类别描述) 序列，网段之间不能重叠
+
+    Returns:
+        (起始地址元组, 结束地址元组, 类别描述元组)
+
+    Raises:
+        ValueError: 网段重叠（bisect 查找要求区间互不相交）
+    """
+    ranges = sorted(
+        (int(net.network_address), int(net.broadcast_address), label)
+        for net, label in ((ipaddress.ip_network(cidr), label) for cidr, label in networks)
+    )
+    for (_, prev_end, prev_label), (start, _, label) in zip(ranges, ranges[1:]):
+        if start <= prev_end:
+            raise ValueError(f"禁止网段重叠: {prev_label} / {label}")
+    starts, ends, labels = zip(*ranges)
+    return starts, ends, labels
+
+
+# 禁止访问的 IP 网段（IANA 特殊用途地址注册表，RFC 6890）
+_FORBIDDEN_V4 = _build_range_table((
+    ("0.0.0.0/8", "保留地址"),  # 本网络
+    ("10.0.0.0/8", "私有地址 (RFC 1918)"),
+    ("100.64.0.0/10", "运营商级 NAT 共享地址 (RFC 6598)"),
+    ("127.0.0.0/8", "回环地址"),
+    ("169.254.0.0/16", "链路本地地址"),
+    ("172.16.0.0/12", "私有地址 (RFC 1918)"),
+    ("192.0.0.0/24", "保留地址"),  # IETF 协议分配
+    ("192.0.2.0/24", "文档示例地址"),  # TEST-NET-1
+    ("192.88.99.0/24", "保留地址"),  # 6to4 中继（已废弃）
+    ("192.168.0.0/16", "私有地址 (RFC 1918)"),
+    ("198.18.0.0/15", "基准测试地址"),
+    ("198.51.100.0/24", "文档示例地址"),  # TEST-NET-2
+    ("203.0.113.0/24", "文档示例地址"),  # TEST-NET-3
+    ("224.0.0.0/4", "多播地址"),
+    ("240.0.0.0/4", "保留地址"),  # 含 255.255.255.255
+))
+_FORBIDDEN_V6 = _build_range_table((
+    ("::/128", "保留地址"),  # 未指定地址
+    ("::1/128", "回环地址"),
+    ("::ffff:0:0/96", "IPv4 映射地址"),
+    ("64:ff9b::/96", "NAT64 地址"),
+    ("64:ff9b:1::/48", "NAT64 地址"),
+    ("100::/64", "保留地址"),  # 丢弃前缀
+    ("2001::/23", "保留地址"),  # IETF 协议分配（含 Teredo）
+    ("2001:db8::/32", "文档示例地址"),
+    ("fc00::/7", "私有地址 (ULA)"),
+    ("fe80::/10", "链路本地地址"),
+    ("fec0::/10", "保留地址"),  # 站点本地（已废弃）
+    ("ff00::/8", "多播地址"),
+))
+# 2000::/3 之外的 IPv6 地址（除上表已列出的）均为未分配/保留空间
+_IPV6_GLOBAL_UNICAST_PREFIX = 0b001
+
+
+def _ip_to_int(ip: str) -> Optional[Tuple[int, int]]:
+    """
+    将 IP 字符串转换为 (版本, 整数值)，IPv4 不创建 ipaddress 对象。
+
+    IPv4 通过 inet_pton 严格解析（不接受 127.1 等非标准写法）；
+    IPv6（含 IPv4 映射、带 scope 的链路本地地址）交给 ipaddress 解析。
+
+    Args:
+        ip: IP 地址字符串
+
+    Returns:
+        (4 或 6, 整数形式)；格式无效时返回 None
+    """
+    if ":" not in ip:
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        except OSError:
+            return None
+    try:
+        return 6, int(ipaddress.IPv6Address(ip))
+    except ValueError:
+        return None
+
+
+def _forbidden_ip_category(version: int, value: int) -> Optional[str]:
+    """
+    查找 IP 所属的禁止网段（按整数形式二分查找区间表）。
+
+    Args:
+        version: IP 版本（4 或 6）
+        value: IP 的整数形式
+
+    Returns:
+        禁止类别描述；允许访问时返回 None
+    """
+    starts, ends, labels = _FORBIDDEN_V4 if version == 4 else _FORBIDDEN_V6
+    index = bisect.bisect_right(starts, value) - 1
+    if index >= 0 and value <= ends[index]:
+        return labels[index]
+    if version == 6 and value >> 125 != _IPV6_GLOBAL_UNICAST_PREFIX:
+        return "保留地址"
+    return None
+
+
+# 主机名 -> 解析出的 IP 列表（只缓存原始解析结果，IP 策略检查每次都会重新执行）
+_dns_cache = TTLCache(maxsize=DNS_CACHE_MAXSIZE, ttl=DNS_CACHE_TTL)
+
+# 同步路径的 DNS 查询线程池（用于给阻塞的 getaddrinfo 加上单次调用超时）。
+# 大小不低于 worker 并发数：超时的 getaddrinfo 无法中断，会继续占用线程，
+# 线程过少时几个慢速/黑洞域名就会让其他任务的查询在队列中等到超时
+_dns_executor = ThreadPoolExecutor(
+    max_workers=SETTINGS.dns_resolver_threads, thread_name_prefix="ssrf-dns"
+)
+
+
 class SSRFValidationError(Exception):
     """URL 验证失败异常."""
 
@@ -198,7 +436,250 @@ class ImageDownloadError(Exception):
     pass
 
 
-def validate_image_url(url: str) -> Tuple[str, str]:
+def _extract_ips(addr_info: list) -> List[str]:
+    """
+    从 getaddrinfo 结果中安全提取去重后的 IP 地址，处理不规范 DNS 响应。
+
+    addr 结构：(family, type, proto, canonname, sockaddr)
+    sockaddr 对于 IPv4 是 (address, port)，对于 IPv6 是 (address, port, flow_info, scope_id)
+    """
+    ips = []
+    seen = set()
+    for addr in addr_info:
+        try:
+            if len(addr) >= 5 and addr[4] and len(addr[4]) >= 1:
+                ip = addr[4][0]
+                if ip and ip not in seen:
+                    seen.add(ip)
+                    ips.append(ip)
+            else:
+                logger.warning("DNS 返回不规范的结果: %s", addr)
+        except (IndexError, TypeError) as e:
+            logger.warning("解析 DNS 结果时出错: %s - %s", addr, e)
+            continue
+    return ips
+
+
+def _ip_literal(hostname: str) -> Optional[List[str]]:
+    """
+    主机名本身就是 IP 地址时直接返回，无需 DNS 查询。
+
+    Args:
+        hostname: 主机名（IPv6 不带方括号）
+
+    Returns:
+        [规范化的 IP]；不是 IP 字面量时返回 None
+    """
+    try:
+        return [str(ipaddress.ip_address(hostname))]
+    except ValueError:
+        return None
+
+
+def _resolve_cached(hostname: str) -> List[str]:
+    """
+    解析主机名得到去重后的 IP 列表，结果按 DNS_CACHE_TTL 缓存。
+
+    只缓存解析结果本身；调用方每次都会对返回的 IP 重新做内网/保留地址检查，
+    因此缓存不会削弱 DNS 重绑定防护。解析失败不缓存。
+
+    getaddrinfo 在专用线程池中执行并设置单次调用的超时，
+    避免修改进程级的 socket.setdefaulttimeout（会影响同进程内其他 socket）。
+
+    Args:
+        hostname: 主机名
+
+    Returns:
+        IP 地址列表（可能为空）
+
+    Raises:
+        SSRFValidationError: DNS 查询超时或解析失败
+    """
+    # IP 字面量跳过 DNS（后续仍逐个检查内网/保留地址）
+    literal = _ip_literal(hostname)
+    if literal is not None:
+        return literal
+
+    cached = _dns_cache.get(hostname)
+    if cached is not None:
+        return cached
+
+    try:
+        # 只查询 TCP 记录：不限定时每个 IP 会按 (socktype, proto) 组合重复返回多条
+        future = _dns_executor.submit(
+            socket.getaddrinfo,
+            hostname,
+            None,
+            type=socket.SOCK_STREAM,
+            proto=socket.IPPROTO_TCP,
+        )
+        try:
+            addr_info = future.result(timeout=DNS_TIMEOUT)
+        except FutureTimeoutError:
+            # 仍在排队的查询不再执行（已开始的 getaddrinfo 无法取消）
+            future.cancel()
+            raise
+    except (FutureTimeoutError, socket.timeout) as e:
+        # socket.timeout 是 OSError 的子类，必须先捕获
+        raise SSRFValidationError(f"DNS 查询超时: {hostname}") from e
+    except (socket.gaierror, OSError) as e:
+        # 捕获 DNS 解析错误（包括 gaierror 和其他 socket 错误）
+        raise SSRFValidationError(f"DNS 解析失败: {hostname} - {e}") from e
+
+    ips = _extract_ips(addr_info)
+    if ips:
+        _dns_cache.set(hostname, ips)
+    return ips
+
+
+async def _resolve_cached_async(hostname: str) -> List[str]:
+    """
+    _resolve_cached 的异步版本：通过事件循环的 getaddrinfo 解析，不阻塞事件循环。
+
+    Args:
+        hostname: 主机名
+
+    Returns:
+        IP 地址列表（可能为空）
+
+    Raises:
+        SSRFValidationError: DNS 查询超时或解析失败
+    """
+    literal = _ip_literal(hostname)
+    if literal is not None:
+        return literal
+
+    cached = _dns_cache.get(hostname)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    try:
+        addr_info = await asyncio.wait_for(
+            loop.getaddrinfo(
+                hostname, None, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+            ),
+            timeout=DNS_TIMEOUT,
+        )
+    except (asyncio.TimeoutError, socket.timeout) as e:
+        raise SSRFValidationError(f"DNS 查询超时: {hostname}") from e
+    except (socket.gaierror, OSError) as e:
+        raise SSRFValidationError(f"DNS 解析失败: {hostname} - {e}") from e
+
+    ips = _extract_ips(addr_info)
+    if ips:
+        _dns_cache.set(hostname, ips)
+    return ips
+
+
+def _parse_url(url: str) -> ParseResult:
+    """
+    解析 URL（每次校验/下载只解析一次，结果在各步骤间传递）。
+
+    Args:
+        url: 待验证的图片 URL
+
+    Returns:
+        urlparse 的解析结果
+
+    Raises:
+        SSRFValidationError: URL 格式不合法
+    """
+    try:
+        return urlparse(url)
+    except Exception as e:
+        raise SSRFValidationError(f"无效的 URL 格式: {e}") from e
+
+
+def _validate_parsed_url(parsed: ParseResult) -> str:
+    """
+    不涉及 I/O 的 URL 检查：协议、主机名、localhost/私有地址字符串模式。
+
+    Args:
+        parsed: 已解析的图片 URL
+
+    Returns:
+        主机名
+
+    Raises:
+        SSRFValidationError: 协议或主机名不合法
+    """
+    # 2. 验证协议
+    if parsed.scheme not in ALLOWED_SCHEMES:
+        raise SSRFValidationError(
+            f"不支持的协议: {parsed.scheme}. 仅允许: {_ALLOWED_SCHEMES_TEXT}"
+        )
+
+    # 3. 提取主机名（ParseResult.hostname 已转为小写）
+    hostname = parsed.hostname
+    if not hostname:
+        raise SSRFValidationError("URL 缺少主机名")
+
+    # 4-5. 禁止 localhost/回环地址及私有/保留地址字符串模式（在 DNS 解析前快速拒绝）
+    # DNS 解析后仍会对每个 IP 做 ipaddress 检查（纵深防御）
+    blocked = _BLOCKED_HOST_RE.match(hostname)
+    if blocked:
+        if blocked.lastgroup == "loopback":
+            raise SSRFValidationError(f"禁止访问 localhost/回环地址: {hostname}")
+        raise SSRFValidationError(f"禁止访问私有地址或保留网段: {hostname}")
+
+    return hostname
+
+
+def _check_resolved_ips(hostname: str, ips: List[str], strict: bool = True) -> str:
+    """
+    验证解析出的 IP 不是内网/保留地址，并返回第一个公网 IP。
+
+    Args:
+        hostname: 主机名（用于错误信息）
+        ips: 解析出的 IP 地址列表
+        strict: True 时检查全部 IP，任何一个为内网/保留地址即拒绝（防多记录 DNS 重绑定）；
+            False 时跳过被禁止的 IP，找到第一个公网 IP 即停止（请求固定发往该 IP）
+
+    Returns:
+        用于发起请求的公网 IP
+
+    Raises:
+        SSRFValidationError: 未解析到 IP、存在内网/保留地址（strict）或没有可用的公网 IP
+    """
+    if not ips:
+        raise SSRFValidationError(f"域名未解析到任何 IP 地址: {hostname}")
+
+    # 7. 验证解析的 IP 地址，确保都不是内网地址
+    # 这一步可以防止 DNS 重绑定攻击（攻击者控制一个域名，
+    # 第一次查询返回公网 IP，第二次查询返回内网 IP）
+    selected_ip = None
+    for ip in ips:
+        parsed_ip = _ip_to_int(ip)
+        if parsed_ip is None:
+            # 如果 IP 地址解析失败，跳过
+            logger.warning("无效的 IP 地址格式: %s", ip)
+            continue
+
+        # 回环、私有、链路本地、保留、多播、CGNAT、文档/基准测试、NAT64 等网段
+        category = _forbidden_ip_category(*parsed_ip)
+        if category is not None:
+            if strict:
+                raise SSRFValidationError(f"禁止访问{category}: {hostname} -> {ip}")
+            continue
+
+        if selected_ip is None:
+            selected_ip = ip
+            if not strict:
+                break
+
+    if selected_ip is None:
+        raise SSRFValidationError(f"域名 {hostname} 的所有 IP 地址都是内网/保留地址")
+
+    # 8. 返回第一个公网 IP（用于后续请求）
+    logger.info("URL 验证通过: %s -> %s", hostname, selected_ip)
+
+    return selected_ip
+
+
+def validate_image_url(
+    url: str, parsed: Optional[ParseResult] = None, strict: bool = True
+) -> Tuple[str, str]:
     """
     验证图片 URL 不指向内网地址，并返回解析后的 IP 和主机名。
 
@@ -210,6 +691,9 @@ def validate_image_url(url: str) -> Tuple[str, str]:
 
     Args:
         url: 待验证的图片 URL
+        parsed: 调用方已解析好的 URL（提供时不再重复解析）
+        strict: 是否要求所有解析出的 IP 都是公网地址（默认开启）；
+            关闭时只取第一个公网 IP，跳过其余记录的检查
 
     Returns:
         (ip_address, hostname) 元组
@@ -227,129 +711,186 @@ def validate_image_url(url: str) -> Tuple[str, str]:
         SSRFValidationError: 禁止访问 localhost/回环地址
     """
     # 1. 解析 URL
+    if parsed is None:
+        parsed = _parse_url(url)
+    hostname = _validate_parsed_url(parsed)
+
+    # 6. DNS 解析，获取所有 IP 地址（带 TTL 缓存）
+    ips = _resolve_cached(hostname)
+
+    # 7-8. 验证所有 IP 并选出公网 IP
+    return _check_resolved_ips(hostname, ips, strict=strict), hostname
+
+
+async def validate_image_url_async(
+    url: str, parsed: Optional[ParseResult] = None, strict: bool = True
+) -> Tuple[str, str]:
+    """
+    validate_image_url 的异步版本（DNS 解析不阻塞事件循环）。
+
+    Args:
+        url: 待验证的图片 URL
+        parsed: 调用方已解析好的 URL（提供时不再重复解析）
+        strict: 是否要求所有解析出的 IP 都是公网地址（默认开启）
+
+    Returns:
+        (ip_address, hostname) 元组
+
+    Raises:
+        SSRFValidationError: URL 验证失败（内网地址、不支持的协议等）
+    """
+    if parsed is None:
+        parsed = _parse_url(url)
+    hostname = _validate_parsed_url(parsed)
+    ips = await _resolve_cached_async(hostname)
+    return _check_resolved_ips(hostname, ips, strict=strict), hostname
+
+
+def _pinned_url(parsed: ParseResult, ip_address: str) -> str:
+    """
+    将 URL 的主机替换为已验证的 IP（保留端口、路径与查询参数）。
+
+    Args:
+        parsed: 已解析的原始 URL
+        ip_address: 验证通过的 IP 地址
+
+    Returns:
+        直接指向该 IP 的 URL（IPv6 地址加方括号）
+
+    Raises:
+        ImageDownloadError: URL 中的端口不合法
+    """
     try:
-        parsed = urlparse(url)
-    except Exception as e:
-        raise SSRFValidationError(f"无效的 URL 格式: {e}") from e
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError as e:
+        raise ImageDownloadError(f"URL 端口不合法: {e}") from e
+    host = f"[{ip_address}]" if ":" in ip_address else ip_address
+    return parsed._replace(netloc=f"{host}:{port}").geturl()
 
-    # 2. 验证协议
-    if parsed.scheme not in ALLOWED_SCHEMES:
-        raise SSRFValidationError(
-            f"不支持的协议: {parsed.scheme}. 仅允许: {ALLOWED_SCHEMES}"
+
+def _pinned_request(
+    parsed: ParseResult, ip_address: str, hostname: str
+) -> Tuple[str, Dict[str, str]]:
+    """
+    构造发往已验证 IP 的请求 URL 与请求头。
+
+    Args:
+        parsed: 已解析的原始 URL
+        ip_address: 验证通过的 IP 地址
+        hostname: 原始主机名
+
+    Returns:
+        (target_url, headers) 元组
+    """
+    # 重建 URL（使用 IP 地址而非域名），防止 DNS Rebinding：请求发往的正是已验证的 IP
+    target_url = _pinned_url(parsed, ip_address)
+    # 保留原始 Host，支持虚拟主机
+    headers = {
+        "Host": hostname,  # 关键：使用原始主机名，而非 IP 地址
+        "User-Agent": DOWNLOAD_USER_AGENT,
+    }
+    return target_url, headers
+
+
+def _redirect_location(response: Union[requests.Response, httpx.Response]) -> Optional[str]:
+    """
+    返回重定向响应的 Location；不是重定向时返回 None。
+
+    Args:
+        response: requests 或 httpx 的响应对象
+
+    Returns:
+        Location 头的值（可能是相对地址）
+    """
+    if response.status_code in REDIRECT_STATUS_CODES:
+        return response.headers.get("Location")
+    return None
+
+
+def _check_content_length(content_length: Optional[str], max_size: int) -> int:
+    """
+    在读取响应体之前按 Content-Length 检查文件大小。
+
+    Args:
+        content_length: 响应头中的 Content-Length（可能缺失或不合法）
+        max_size: 最大允许的文件大小（字节）
+
+    Returns:
+        声明的文件大小；缺失或不合法时返回 0
+
+    Raises:
+        ImageDownloadError: Content-Length 超过 max_size
+    """
+    if not content_length or not content_length.isdigit():
+        return 0
+
+    expected_size = int(content_length)
+    if expected_size > max_size:
+        raise ImageDownloadError(
+            f"文件过大: {content_length} 字节（最大允许 {max_size} 字节）"
         )
+    return expected_size
 
-    # 3. 提取主机名
-    hostname = parsed.hostname
-    if not hostname:
-        raise SSRFValidationError("URL 缺少主机名")
 
-    # 4. 禁止 localhost 和回环地址（字符串级别检查）
-    hostname_lower = hostname.lower()
-    if hostname_lower in (
-        "localhost",
-        "127.0.0.1",
-        "::1",  # IPv6 回环地址（urlparse 返回时不带方括号）
-        "0.0.0.0",
-        "127.0.1.1",
-    ):
-        raise SSRFValidationError(f"禁止访问 localhost/回环地址: {hostname}")
-
-    # 5. 禁止私有地址字符串模式（在 DNS 解析前快速拒绝）
-    if (
-        hostname_lower.startswith("127.")
-        or hostname_lower.startswith("192.168.")
-        or hostname_lower.startswith("10.")
-    ):
-        raise SSRFValidationError(f"禁止访问私有地址: {hostname}")
-
-    # 6. DNS 解析，获取所有 IP 地址
-    try:
-        # 设置 DNS 超时，防止 DNS 慢速攻击
-        socket.setdefaulttimeout(5)
-        addr_info = socket.getaddrinfo(hostname, None)
-
-        # 安全提取 IP 地址，处理不规范 DNS 响应
-        # addr 结构：(family, type, proto, canonname, sockaddr)
-        # sockaddr 对于 IPv4 是 (address, port)，对于 IPv6 是 (address, port, flow_info, scope_id)
-        ips = []
-        for addr in addr_info:
-            try:
-                if len(addr) >= 5 and addr[4] and len(addr[4]) >= 1:
-                    ip = addr[4][0]
-                    if ip and ip not in ips:
-                        ips.append(ip)
-                else:
-                    logger.warning(f"DNS 返回不规范的结果: {addr}")
-            except (IndexError, TypeError) as e:
-                logger.warning(f"解析 DNS 结果时出错: {addr} - {e}")
-                continue
-
-    except socket.timeout as e:
-        # socket.timeout 是 OSError 的子类，必须先捕获
-        raise SSRFValidationError(f"DNS 查询超时: {hostname}") from e
-    except (socket.gaierror, OSError) as e:
-        # 捕获 DNS 解析错误（包括 gaierror 和其他 socket 错误）
-        raise SSRFValidationError(f"DNS 解析失败: {hostname} - {e}") from e
-    finally:
-        # 重置 socket 超时
-        socket.setdefaulttimeout(None)
+def _allocate_download_buffer(expected_size: int) -> io.BytesIO:
+    """
+    按声明的文件大小预分配下载缓冲区，避免随下载反复扩容拷贝。
 
-    if not ips:
-        raise SSRFValidationError(f"域名未解析到任何 IP 地址: {hostname}")
+    使用 io.BytesIO 而非 bytearray：BytesIO 内部直接持有一个 bytes 对象，
+    写满后 getvalue() 原样返回该对象（不再整体拷贝一次）；预分配通过在
+    expected_size - 1 处写入一个字节实现，之后从头覆盖写入。
+    服务端少报或未提供 Content-Length 时 BytesIO 按需扩容，两种情况共用一条路径。
 
-    # 7. 验证所有解析的 IP 地址，确保都不是内网地址
-    # 这一步可以防止 DNS 重绑定攻击（攻击者控制一个域名，
-    # 第一次查询返回公网 IP，第二次查询返回内网 IP）
-    public_ips = []
-    for ip in ips:
-        try:
-            ip_obj = ipaddress.ip_address(ip)
+    Args:
+        expected_size: 声明的文件大小（0 表示未知）
 
-            # 检查是否为回环地址
-            if ip_obj.is_loopback:
-                raise SSRFValidationError(
-                    f"禁止访问回环地址: {hostname} -> {ip}"
-                )
+    Returns:
+        写入位置在开头的 BytesIO
+    """
+    buffer = io.BytesIO()
+    if expected_size:
+        buffer.seek(expected_size - 1)
+        buffer.write(b"\0")
+        buffer.seek(0)
+    return buffer
 
-            # 检查是否为链路本地地址（169.254.0.0/16，必须在 is_private 前检查）
-            if ip_obj.is_link_local:
-                raise SSRFValidationError(
-                    f"禁止访问链路本地地址: {hostname} -> {ip}"
-                )
 
-            # 检查是否为私有地址（RFC 1918）
-            if ip_obj.is_private:
-                raise SSRFValidationError(
-                    f"禁止访问私有地址: {hostname} -> {ip} (RFC 1918)"
-                )
+def _peer_ip(sock_addr: object) -> Optional[str]:
+    """
+    从 socket 对端地址中取出规范化的 IP 字符串。
 
-            # 检查是否为保留地址
-            if ip_obj.is_reserved:
-                raise SSRFValidationError(
-                    f"禁止访问保留地址: {hostname} -> {ip}"
-                )
+    Args:
+        sock_addr: getpeername() / server_addr 返回的地址元组
 
-            # 检查是否为多播地址
-            if ip_obj.is_multicast:
-                raise SSRFValidationError(
-                    f"禁止访问多播地址: {hostname} -> {ip}"
-                )
+    Returns:
+        规范化后的 IP 字符串；无法识别时返回 None
+    """
+    try:
+        return str(ipaddress.ip_address(sock_addr[0]))
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
 
-            public_ips.append(ip)
 
-        except ValueError:
-            # 如果 IP 地址解析失败，跳过
-            logger.warning(f"无效的 IP 地址格式: {ip}")
-            continue
+def _verify_peer_ip(peer_ip: Optional[str], ip_address: str, hostname: str) -> None:
+    """
+    校验实际连接的对端 IP 与验证通过的 IP 一致（读取响应体之前）。
 
-    if not public_ips:
-        raise SSRFValidationError(f"域名 {hostname} 的所有 IP 地址都是内网/保留地址")
+    请求虽然直接发往已验证的 IP，但代理、连接复用异常等情况下实际连接可能是其他地址；
+    这里以连接建立后的对端地址为准，彻底关闭"验证时 / 使用时"之间的 DNS Rebinding 窗口。
+    HTTP 客户端不暴露对端地址时（如 HTTP/1.0 短连接）跳过此项校验。
 
-    # 8. 返回第一个公网 IP（用于后续请求）和原始主机名
-    selected_ip = public_ips[0]
-    logger.info(f"URL 验证通过: {hostname} -> {selected_ip}")
+    Args:
+        peer_ip: 实际连接的对端 IP（None 表示无法获取）
+        ip_address: 验证通过的 IP 地址
+        hostname: 原始主机名（用于错误信息）
 
-    return selected_ip, hostname
+    Raises:
+        ImageDownloadError: 对端 IP 与验证通过的 IP 不一致
+    """
+    if peer_ip is not None and peer_ip != str(ipaddress.ip_address(ip_address)):
+        raise ImageDownloadError(
+            f"连接的对端地址与验证的 IP 不一致: {hostname} -> {ip_address}，实际连接 {peer_ip}"
+        )
 
 
 def download_image_securely(
@@ -364,8 +905,9 @@ def download_image_securely(
     1. 验证 URL，解析域名获取 IP 地址
     2. 使用 IP 地址发起 HTTP 请求（而非域名）
     3. 在 Host header 中保留原始主机名（支持虚拟主机）
-    4. 验证响应 Content-Type 为图片类型
-    5. 限制下载文件大小
+    4. 遇到重定向时对 Location 重复以上步骤（最多 MAX_REDIRECTS 次）
+    5. 按 Content-Length 预检文件大小
+    6. 验证响应 Content-Type 为图片类型，流式下载并限制文件大小
 
     Args:
         url: 图片 URL
@@ -384,100 +926,144 @@ def download_image_securely(
         >>> len(image_data)
         123456
     """
-    # 1. 验证 URL 并获取 IP 地址
+    session = _get_http_session()  # 使用全局 Session（复用连接池）
+
+    # 重定向不交给 requests 自动跟随：每一跳的 Location 都重新验证并固定到验证通过的 IP
+    current_url = url
+    for _ in range(MAX_REDIRECTS + 1):
+        # 1. 验证 URL 并获取 IP 地址
+        try:
+            parsed = _parse_url(current_url)  # 只解析一次，验证与重建 URL 共用
+            ip_address, hostname = validate_image_url(current_url, parsed=parsed)
+        except SSRFValidationError as e:
+            # 将 SSRF 验证错误转换为 ImageDownloadError
+            raise ImageDownloadError(f"URL 验证失败: {str(e)}") from e
+
+        # 2-3. 构造发往已验证 IP 的请求；
+        # HTTPS 的 SNI 与证书校验由 _PinnedHostAdapter 按 Host 头中的主机名处理
+        target_url, headers = _pinned_request(parsed, ip_address, hostname)
+
+        # 4. 发起 HTTP 请求
+        logger.info("下载图片: %s -> %s", hostname, ip_address)
+        try:
+            response = session.get(
+                target_url,
+                headers=headers,
+                timeout=timeout,
+                stream=True,  # 流式下载，支持大小限制
+                allow_redirects=False,  # 重定向在此处手动跟随并重新验证
+            )
+            location = _redirect_location(response)
+            if location is None:
+                response.raise_for_status()
+                break
+            response.close()
+
+        except requests.exceptions.Timeout:
+            raise ImageDownloadError(f"下载超时: {url}") from None
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None:
+                e.response.close()
+            status_code = e.response.status_code if e.response is not None else "Unknown"
+            raise ImageDownloadError(f"HTTP 错误: {status_code} - {url}") from e
+        except requests.exceptions.RequestException as e:
+            raise ImageDownloadError(f"下载失败: {str(e)} - {url}") from e
+
+        current_url = urljoin(current_url, location)
+    else:
+        raise ImageDownloadError(f"重定向次数过多（最多 {MAX_REDIRECTS} 次）: {url}")
+
+    # 无论校验失败还是读取完毕都关闭响应，连接及时归还连接池（未读完的连接直接断开）
     try:
-        ip_address, hostname = validate_image_url(url)
-    except SSRFValidationError as e:
-        # 将 SSRF 验证错误转换为 ImageDownloadError
-        raise ImageDownloadError(f"URL 验证失败: {str(e)}") from e
-
-    # 2. 重建 URL（使用 IP 地址而非域名）
-    # 这样可以防止 DNS Rebinding 攻击，因为我们使用的是已验证的 IP 地址
-    parsed = urlparse(url)
-    port = parsed.port or (443 if parsed.scheme == "https" else 80)
-    target_url = parsed._replace(netloc=f"{ip_address}:{port}").geturl()
-
-    # 3. 准备请求头（保留原始 Host，支持虚拟主机）
-    headers = {
-        "Host": hostname,  # 关键：使用原始主机名，而非 IP 地址
-        "User-Agent": "Smart-Agriculture-Diagnosis/1.0",
-    }
+        return _read_response(response, ip_address, hostname, max_size)
+    finally:
+        response.close()
+
+
+def _read_response(
+    response: requests.Response, ip_address: str, hostname: str, max_size: int
+) -> bytes:
+    """
+    校验流式响应（对端 IP、大小、类型）并分块读取响应体。
+
+    Args:
+        response: 以 stream=True 发送得到的响应（调用方负责关闭）
+        ip_address: 验证通过的 IP 地址
+        hostname: 原始主机名
+        max_size: 最大允许的文件大小（字节）
+
+    Returns:
+        图片二进制数据
 
-    # 4. 发起 HTTP 请求（使用 Session 复用连接）
-    logger.info(f"下载图片: {hostname} -> {ip_address}")
+    Raises:
+        ImageDownloadError: 校验失败或文件过大
+    """
+    # 校验实际连接的对端 IP（urllib3 在流式读取期间持有连接）
     try:
-        session = _get_http_session()  # 使用全局 Session
-
-        response = session.get(
-            target_url,
-            headers=headers,
-            timeout=timeout,
-            stream=True,  # 流式下载，支持大小限制
-            allow_redirects=True,  # 允许重定向（但目标 IP 已固定）
-        )
-        response.raise_for_status()
-
-    except requests.exceptions.Timeout:
-        raise ImageDownloadError(f"下载超时: {url}") from None
-    except requests.exceptions.HTTPError as e:
-        status_code = e.response.status_code if e.response else "Unknown"
-        raise ImageDownloadError(f"HTTP 错误: {status_code} - {url}") from e
-    except requests.exceptions.RequestException as e:
-        raise ImageDownloadError(f"下载失败: {str(e)} - {url}") from e
-
-    # 5. 验证 Content-Type
-    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        peer_addr = response.raw._connection.sock.getpeername()
+    except (AttributeError, OSError):
+        peer_addr = None
+    _verify_peer_ip(_peer_ip(peer_addr), ip_address, hostname)
+
+    # 5. 先按 Content-Length 检查大小（超限直接拒绝，无需再解析 Content-Type）
+    expected_size = _check_content_length(response.headers.get("Content-Length"), max_size)
+
+    # 6. 验证 Content-Type
+    content_type = response.headers.get("Content-Type", "").partition(";")[0].strip().lower()
     if content_type not in ALLOWED_IMAGE_TYPES:
         raise ImageDownloadError(
             f"不支持的文件类型: {content_type}. "
-            f"仅允许图片类型: {ALLOWED_IMAGE_TYPES}"
+            f"仅允许图片类型: {_ALLOWED_IMAGE_TYPES_TEXT}"
         )
 
-    # 6. 流式下载并验证文件大小
-    image_data = bytearray()
-    content_length = response.headers.get("Content-Length")
-
-    # 如果有 Content-Length header，先检查大小
-    if content_length and int(content_length) > max_size:
-        raise ImageDownloadError(
-            f"文件过大: {content_length} 字节（最大允许 {max_size} 字节）"
-        )
+    # 7. 流式下载并验证文件大小
+    buffer = _allocate_download_buffer(expected_size)
 
-    # 分块下载
-    for chunk in response.iter_content(chunk_size=8192):
+    # 分块下载（顺序写入预分配的缓冲区）
+    received = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
         if chunk:  # 过滤掉 keep-alive chunk
-            image_data.extend(chunk)
-            if len(image_data) > max_size:
+            end = received + len(chunk)
+            if end > max_size:
                 raise ImageDownloadError(
-                    f"文件过大: 已下载 {len(image_data)} 字节（最大允许 {max_size} 字节）"
+                    f"文件过大: 已下载 {end} 字节（最大允许 {max_size} 字节）"
                 )
+            buffer.write(chunk)
+            received = end
+
+    # Content-Length 多报时截掉未写入的尾部
+    buffer.truncate(received)
 
     logger.info(
-        f"图片下载成功: {hostname} -> {len(image_data)} 字节, type={content_type}"
+        "图片下载成功: %s -> %d 字节, type=%s", hostname, received, content_type
     )
 
-    return bytes(image_data)
+    # 直接返回 BytesIO 内部的 bytes 对象（无需再拷贝一份）
+    return buffer.getvalue()
 
 
 async def download_image_securely_async(
     url: str,
     max_size: int = MAX_IMAGE_SIZE_BYTES,
     timeout: int = DOWNLOAD_TIMEOUT,
+    client: Optional[httpx.AsyncClient] = None,
 ) -> bytes:
     """
     异步安全下载图片（防 DNS Rebinding 攻击）。
 
     工作流程：
-    1. 验证 URL，解析域名获取 IP 地址（同步操作，开销可忽略）
+    1. 验证 URL，异步解析域名获取 IP 地址
     2. 使用 IP 地址发起异步 HTTP 请求（而非域名）
     3. 在 Host header 中保留原始主机名（支持虚拟主机）
-    4. 验证响应 Content-Type 为图片类型
-    5. 限制下载文件大小
+    4. 遇到重定向时对 Location 重复以上步骤（最多 MAX_REDIRECTS 次）
+    5. 按 Content-Length 预检文件大小
+    6. 验证响应 Content-Type 为图片类型，流式下载并限制文件大小
 
     Args:
         url: 图片 URL
         max_size: 最大允许的文件大小（字节）
         timeout: 下载超时时间（秒）
+        client: 使用的 httpx.AsyncClient（默认使用全局共享的 Client）
 
     Returns:
         图片二进制数据
@@ -493,73 +1079,201 @@ async def download_image_securely_async(
         >>> len(image_data)
         123456
     """
-    # 1. 验证 URL 并获取 IP 地址（同步操作，快速）
-    try:
-        ip_address, hostname = validate_image_url(url)
-    except SSRFValidationError as e:
-        raise ImageDownloadError(f"URL 验证失败: {str(e)}") from e
+    if client is None:
+        client = _get_async_client(timeout=timeout)
 
-    # 2. 重建 URL（使用 IP 地址而非域名）
-    parsed = urlparse(url)
-    target_url = parsed._replace(
-        netloc=f"{ip_address}:{parsed.port or (443 if parsed.scheme == 'https' else 80)}"
-    ).geturl()
+    # 重定向不交给 httpx 自动跟随：每一跳的 Location 都重新验证并固定到验证通过的 IP
+    current_url = url
+    for _ in range(MAX_REDIRECTS + 1):
+        # 1. 验证 URL 并获取 IP 地址（异步 DNS 解析，不阻塞事件循环）
+        try:
+            parsed = _parse_url(current_url)
+            ip_address, hostname = await validate_image_url_async(current_url, parsed=parsed)
+        except SSRFValidationError as e:
+            raise ImageDownloadError(f"URL 验证失败: {str(e)}") from e
 
-    # 3. 准备请求头（保留原始 Host，支持虚拟主机）
-    headers = {
-        "Host": hostname,
-        "User-Agent": "Smart-Agriculture-Diagnosis/1.0",
-    }
+        # 2-3. 构造发往已验证 IP 的请求
+        target_url, headers = _pinned_request(parsed, ip_address, hostname)
 
-    # 4. 发起异步 HTTP 请求
-    logger.info(f"异步下载图片: {hostname} -> {ip_address}")
+        # 4. 发起异步 HTTP 请求
+        logger.info("异步下载图片: %s -> %s", hostname, ip_address)
+        try:
+            request = client.build_request(
+                "GET",
+                target_url,
+                headers=headers,
+                timeout=timeout,
+                # TLS 的 SNI 与证书校验使用原始主机名（httpcore 的 sni_hostname 扩展）
+                extensions={"sni_hostname": hostname} if parsed.scheme == "https" else None,
+            )
+            # stream=True：只读取响应头，响应体在大小/类型校验通过后再分块读取
+            response = await client.send(
+                request,
+                stream=True,
+                follow_redirects=False,  # 重定向在此处手动跟随并重新验证
+            )
+            location = _redirect_location(response)
+            if location is None:
+                response.raise_for_status()
+                break
+            await response.aclose()
+
+        except httpx.TimeoutException:
+            raise ImageDownloadError(f"下载超时: {url}") from None
+        except httpx.HTTPStatusError as e:
+            await e.response.aclose()
+            raise ImageDownloadError(f"HTTP 错误: {e.response.status_code} - {url}") from e
+        except httpx.RequestError as e:
+            raise ImageDownloadError(f"下载失败: {str(e)} - {url}") from e
+
+        current_url = urljoin(current_url, location)
+    else:
+        raise ImageDownloadError(f"重定向次数过多（最多 {MAX_REDIRECTS} 次）: {url}")
+
+    # 无论校验失败还是读取完毕都关闭响应，连接及时归还连接池（未读完的连接直接断开）
     try:
-        client = _get_async_client(timeout=timeout)
+        return await _read_response_async(response, ip_address, hostname, max_size)
+    finally:
+        await response.aclose()
 
-        response = await client.get(
-            target_url,
-            headers=headers,
-            follow_redirects=True,  # 允许重定向（但目标 IP 已固定）
-        )
-        response.raise_for_status()
-
-    except httpx.TimeoutException:
-        raise ImageDownloadError(f"下载超时: {url}") from None
-    except httpx.HTTPStatusError as e:
-        raise ImageDownloadError(f"HTTP 错误: {e.response.status_code} - {url}") from e
-    except httpx.RequestError as e:
-        raise ImageDownloadError(f"下载失败: {str(e)} - {url}") from e
-
-    # 5. 验证 Content-Type
-    content_type = (
-        response.headers.get("Content-Type", "").split(";")[0].strip().lower()
-    )
+
+async def _read_response_async(
+    response: httpx.Response, ip_address: str, hostname: str, max_size: int
+) -> bytes:
+    """
+    校验流式响应（对端 IP、大小、类型）并分块读取响应体。
+
+    Args:
+        response: 以 stream=True 发送得到的响应（调用方负责关闭）
+        ip_address: 验证通过的 IP 地址
+        hostname: 原始主机名
+        max_size: 最大允许的文件大小（字节）
+
+    Returns:
+        图片二进制数据
+
+    Raises:
+        ImageDownloadError: 校验失败或文件过大
+    """
+    # 校验实际连接的对端 IP（httpcore 通过 network_stream 扩展暴露连接信息）
+    network_stream = response.extensions.get("network_stream")
+    peer_addr = network_stream.get_extra_info("server_addr") if network_stream is not None else None
+    _verify_peer_ip(_peer_ip(peer_addr), ip_address, hostname)
+
+    # 5. 先按 Content-Length 检查大小（超限直接拒绝，无需再解析 Content-Type）
+    expected_size = _check_content_length(response.headers.get("Content-Length"), max_size)
+
+    # 6. 验证 Content-Type
+    content_type = response.headers.get("Content-Type", "").partition(";")[0].strip().lower()
     if content_type not in ALLOWED_IMAGE_TYPES:
         raise ImageDownloadError(
             f"不支持的文件类型: {content_type}. "
-            f"仅允许图片类型: {ALLOWED_IMAGE_TYPES}"
+            f"仅允许图片类型: {_ALLOWED_IMAGE_TYPES_TEXT}"
         )
 
-    # 6. 流式下载并验证文件大小
-    content_length = response.headers.get("Content-Length")
+    # 7. 流式下载并验证文件大小
+    buffer = _allocate_download_buffer(expected_size)
 
-    # 如果有 Content-Length header，先检查大小
-    if content_length and int(content_length) > max_size:
-        raise ImageDownloadError(
-            f"文件过大: {content_length} 字节（最大允许 {max_size} 字节）"
-        )
-
-    # 使用 httpx 的 aiter_bytes 进行异步流式下载
-    image_data = bytearray()
-    async for chunk in response.aiter_bytes(chunk_size=8192):
-        image_data.extend(chunk)
-        if len(image_data) > max_size:
+    # 使用 httpx 的 aiter_bytes 进行异步流式下载（顺序写入预分配的缓冲区）
+    received = 0
+    async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        end = received + len(chunk)
+        if end > max_size:
             raise ImageDownloadError(
-                f"文件过大: 已下载 {len(image_data)} 字节（最大允许 {max_size} 字节）"
+                f"文件过大: 已下载 {end} 字节（最大允许 {max_size} 字节）"
             )
+        buffer.write(chunk)
+        received = end
+
+    # Content-Length 多报时截掉未写入的尾部
+    buffer.truncate(received)
 
     logger.info(
-        f"异步图片下载成功: {hostname} -> {len(image_data)} 字节, type={content_type}"
+        "异步图片下载成功: %s -> %d 字节, type=%s", hostname, received, content_type
+    )
+
+    # 直接返回 BytesIO 内部的 bytes 对象（无需再拷贝一份）
+    return buffer.getvalue()
+
+
+async def download_images_batch(
+    urls: List[str],
+    max_concurrency: int = BATCH_DOWNLOAD_CONCURRENCY,
+    max_size: int = MAX_IMAGE_SIZE_BYTES,
+    timeout: int = DOWNLOAD_TIMEOUT,
+    client: Optional[httpx.AsyncClient] = None,
+) -> List[Union[bytes, Exception]]:
+    """
+    并发安全下载多张图片（共享一个 AsyncClient 的连接池）。
+
+    每个 URL 的验证与下载流程与 download_image_securely_async 相同；
+    多个 URL 的 DNS 解析、TCP/TLS 握手与传输并发进行，并发数由信号量限制。
+    单个 URL 失败不影响其他 URL。
+
+    Args:
+        urls: 图片 URL 列表
+        max_concurrency: 最大并发下载数
+        max_size: 单张图片最大允许的文件大小（字节）
+        timeout: 单张图片下载超时时间（秒）
+        client: 使用的 httpx.AsyncClient（默认使用全局共享的 Client）
+
+    Returns:
+        与 urls 顺序一致的结果列表：成功为图片二进制数据，失败为对应的异常对象
+        （通常是 ImageDownloadError）
+
+    Examples:
+        >>> results = await download_images_batch([url1, url2])
+        >>> images = [r for r in results if isinstance(r, bytes)]
+    """
+    if not urls:
+        return []
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _download(url: str) -> bytes:
+        async with semaphore:
+            return await download_image_securely_async(
+                url, max_size=max_size, timeout=timeout, client=client
+            )
+
+    return await asyncio.gather(
+        *(_download(url) for url in urls), return_exceptions=True
     )
 
-    return bytes(image_data)
+
+def download_images_batch_sync(
+    urls: List[str],
+    max_concurrency: int = BATCH_DOWNLOAD_CONCURRENCY,
+    max_size: int = MAX_IMAGE_SIZE_BYTES,
+    timeout: int = DOWNLOAD_TIMEOUT,
+) -> List[Union[bytes, Exception]]:
+    """
+    download_images_batch 的同步入口（用于尚未异步化的 Celery 任务）。
+
+    通过 asyncio.run 运行一个新的事件循环，并为本批次创建独立的 AsyncClient
+    （全局 Client 绑定在其他事件循环上，不能跨循环复用），批次结束后关闭。
+    不能在已运行的事件循环中调用。
+
+    Args:
+        urls: 图片 URL 列表
+        max_concurrency: 最大并发下载数
+        max_size: 单张图片最大允许的文件大小（字节）
+        timeout: 单张图片下载超时时间（秒）
+
+    Returns:
+        与 urls 顺序一致的结果列表：成功为图片二进制数据，失败为对应的异常对象
+    """
+    if not urls:
+        return []
+
+    async def _run() -> List[Union[bytes, Exception]]:
+        async with _new_async_client(timeout=timeout) as client:
+            return await download_images_batch(
+                urls,
+                max_concurrency=max_concurrency,
+                max_size=max_size,
+                timeout=timeout,
+                client=client,
+            )
+
+    return asyncio.run(_run())
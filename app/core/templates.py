@@ -5,6 +5,8 @@ This module defines structured prompt templates for generating agricultural
 diagnosis reports based on CV classification results (Disease vs Pest).
 """
 
+from functools import lru_cache
+
 # Template 1: Disease Report (Concise Style)
 DISEASE_REPORT_TEMPLATE = """你是一名植物病理学专家。请基于以下检索到的上下文（Context），严格按照下述格式生成诊断报告。
 
@@ -50,10 +52,14 @@ PEST_REPORT_TEMPLATE = """你是一名农业昆虫学专家。请基于以下检
 """
 
 
+@lru_cache(maxsize=8)
 def get_report_template(diagnosis_type: str) -> str:
     """
     Select the appropriate report template based on diagnosis type.
 
+    Results are memoized per diagnosis_type spelling; unknown types raise
+    every time (exceptions are not cached).
+
     Args:
         diagnosis_type: Either "Disease" or "Pest" (case-insensitive)
 
@@ -63,9 +69,10 @@ def get_report_template(diagnosis_type: str) -> str:
     Raises:
         ValueError: If diagnosis_type is not recognized
     """
-    if diagnosis_type.lower() == "disease":
+    normalized = diagnosis_type.lower()
+    if normalized == "disease":
         return DISEASE_REPORT_TEMPLATE
-    elif diagnosis_type.lower() == "pest":
+    elif normalized == "pest":
         return PEST_REPORT_TEMPLATE
     else:
         raise ValueError(
@@ -9,6 +9,10 @@ from typing import Optional
 
 from pydantic import BaseModel, Field, HttpUrl
 
+# 报告由后续任务生成时（DIAGNOSIS_EARLY_RETURN=true）的报告状态
+REPORT_STATUS_PENDING = "PENDING"
+REPORT_STATUS_READY = "READY"
+
 
 class DiagnoseRequest(BaseModel):
     """诊断请求模型"""
@@ -52,6 +56,8 @@ class DiagnosisResult(BaseModel):
     location: Optional[str] = Field(None, description="地理位置")
     report: Optional[str] = Field(None, description="LLM 生成的诊断报告（Markdown 格式）")
     report_error: Optional[str] = Field(None, description="报告生成错误信息（仅在失败时）")
+    report_task_id: Optional[str] = Field(None, description="报告生成任务 ID（仅在报告异步生成时）")
+    report_status: Optional[str] = Field(None, description="报告状态（PENDING, READY；报告同步生成时为空）")
 
 
 class TaskStatus(BaseModel):
@@ -65,6 +71,6 @@ class TaskStatus(BaseModel):
 class UploadResponse(BaseModel):
     """上传响应模型"""
     url: str = Field(..., description="图片访问 URL")
-    filename: str = Field(..., description="存储的文件名（带 UUID 前缀）")
+    filename: str = Field(..., description="存储的文件名（内容哈希 + 扩展名）")
     original_filename: str = Field(..., description="原始文件名")
     content_type: str = Field(..., description="文件 MIME 类型")
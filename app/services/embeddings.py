@@ -0,0 +1,177 @@
+"""
+Local embedding backend for Smart-Agriculture RAG System
+
+This module provides a SentenceTransformers-based LangChain embedder that
+coalesces concurrent single-query calls into batched encode() calls. It is
+selected with EMBEDDING_PROVIDER=local; the default remains OpenAI.
+
+Switching providers changes the vector space (bge-small-zh-v1.5 produces
+512-dimensional vectors), so the knowledge base must be re-ingested with the
+same provider that serves queries.
+
+Usage:
+    from app.services.embeddings import BatchingEmbedder
+
+    embedder = BatchingEmbedder("BAAI/bge-small-zh-v1.5")
+    vector = embedder.embed_query("番茄晚疫病")
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-small-zh-v1.5")
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_WAIT = 0.005  # 5ms 合并窗口
+
+
+class BatchingEmbedder(Embeddings):
+    """
+    SentenceTransformers embedder that micro-batches concurrent queries.
+
+    embed_query() enqueues the text and waits; a single background thread
+    collects requests for up to max_wait seconds (or until max_batch_size are
+    queued) and encodes them in one call, so bursts of concurrent queries
+    share the fixed per-call overhead of the model.
+
+    Example:
+        >>> embedder = BatchingEmbedder("BAAI/bge-small-zh-v1.5")
+        >>> len(embedder.embed_query("番茄晚疫病"))
+        512
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_wait: float = EMBEDDING_BATCH_WAIT,
+        model: Optional[Any] = None,
+    ):
+        """
+        Initialize the embedder.
+
+        Args:
+            model_name: SentenceTransformers model name or local path
+            max_batch_size: Maximum number of queries encoded per call
+            max_wait: Seconds to wait for more queries after the first one arrives
+            model: Preloaded model exposing encode() (default: load model_name)
+
+        Raises:
+            ImportError: If sentence-transformers is not installed
+        """
+        if model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    "EMBEDDING_PROVIDER=local requires sentence-transformers. "
+                    "Please run: uv pip install sentence-transformers"
+                ) from e
+            logger.info(f"Loading local embedding model: {model_name}")
+            model = SentenceTransformer(model_name)
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.max_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return vectors.tolist()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                worker.start()
+                self._worker = worker
+
+    def _run(self) -> None:
+        """Background loop: collect a batch, encode it, resolve the futures."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # 调用方可能已取消（如 asyncio 超时），跳过这些请求
+            batch = [
+                (text, future)
+                for text, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                vectors = self._encode([text for text, _ in batch])
+            except Exception as e:
+                logger.error(f"Failed to encode {len(batch)} queries: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query, batched with concurrent callers.
+
+        Args:
+            text: Query text
+
+        Returns:
+            Normalized embedding vector
+        """
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async variant of embed_query that does not block the event loop."""
+        return await asyncio.wrap_future(self._submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents directly (callers already pass batches).
+
+        Args:
+            texts: Document texts
+
+        Returns:
+            Normalized embedding vectors, one per text
+        """
+        if not texts:
+            return []
+        return self._encode(texts)
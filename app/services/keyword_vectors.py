@@ -0,0 +1,179 @@
+"""
+Precomputed query vectors for taxonomy terms
+
+The diagnosis pipeline queries the knowledge base with a small, stable set of
+terms (taxonomy names and search keywords). This module stores their
+embeddings, int8-quantized with one scale per vector, in a .npz file written
+by scripts/ingest_knowledge.py, so RAGService can skip the embedding API call
+when a query exactly matches one of them.
+
+int8 storage is a quarter of float32; with a per-vector scale the cosine
+similarity to the original vector stays above 0.999 for typical embeddings.
+
+Usage:
+    from app.services.keyword_vectors import KeywordVectors
+
+    vectors = KeywordVectors.load("data/keyword_vectors.npz", model="text-embedding-3-small")
+    embedding = vectors.get("白粉病") if vectors else None
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Configuration（空字符串表示禁用）
+KEYWORD_VECTORS_PATH = os.getenv("KEYWORD_VECTORS_PATH", "data/keyword_vectors.npz")
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize float vectors to int8 with a symmetric per-vector scale.
+
+    Args:
+        vectors: (n, dim) float array
+
+    Returns:
+        (int8 array of shape (n, dim), float32 scales of shape (n,)) such that
+        vectors ≈ quantized * scales[:, None]
+    """
+    max_abs = np.abs(vectors).max(axis=1)
+    # 全零向量的 scale 取 1，避免除零
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales
+
+
+class KeywordVectors:
+    """
+    Read-only map from term to its dequantized embedding.
+
+    Instances are immutable after construction and safe to share between
+    threads.
+
+    Example:
+        >>> vectors = KeywordVectors.build(["白粉病"], embeddings, model="bge")
+        >>> len(vectors.get("白粉病"))
+        512
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        quantized: np.ndarray,
+        scales: np.ndarray,
+        model: str,
+    ):
+        """
+        Initialize from quantized vectors.
+
+        Args:
+            terms: Terms, one per row of quantized
+            quantized: (n, dim) int8 vectors
+            scales: (n,) per-vector scales
+            model: Embedding model the vectors were produced with
+        """
+        self.model = model
+        self._terms: List[str] = list(terms)
+        self._index: Dict[str, int] = {term: i for i, term in enumerate(self._terms)}
+        self._quantized = quantized
+        self._scales = scales
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._index
+
+    def get(self, term: str) -> Optional[List[float]]:
+        """
+        Get the dequantized embedding for an exact term.
+
+        Args:
+            term: Query text
+
+        Returns:
+            Embedding vector, or None if the term is not precomputed
+        """
+        row = self._index.get(term)
+        if row is None:
+            return None
+        vector = self._quantized[row].astype(np.float32) * self._scales[row]
+        return vector.tolist()
+
+    @classmethod
+    def build(
+        cls, terms: Sequence[str], embeddings: Embeddings, model: str
+    ) -> "KeywordVectors":
+        """
+        Embed terms in one batch and quantize them.
+
+        Args:
+            terms: Unique terms to precompute
+            embeddings: Embeddings instance used for queries
+            model: Name of the embedding model
+
+        Returns:
+            KeywordVectors instance
+        """
+        vectors = np.asarray(embeddings.embed_documents(list(terms)), dtype=np.float32)
+        quantized, scales = quantize(vectors)
+        return cls(terms, quantized, scales, model)
+
+    def save(self, path: str) -> None:
+        """
+        Write the vectors to a .npz file.
+
+        Args:
+            path: Output file path
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            terms=np.array(self._terms, dtype=np.str_),
+            quantized=self._quantized,
+            scales=self._scales,
+            model=np.array(self.model, dtype=np.str_),
+        )
+
+    @classmethod
+    def load(cls, path: str, model: str) -> Optional["KeywordVectors"]:
+        """
+        Load vectors written by save().
+
+        Args:
+            path: .npz file path
+            model: Embedding model currently used for queries
+
+        Returns:
+            KeywordVectors instance, or None if the file is missing, unreadable
+            or was built with a different model
+        """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                stored_model = str(data["model"])
+                if stored_model != model:
+                    # 向量空间不同，不能混用
+                    logger.warning(
+                        f"Ignoring keyword vectors built with {stored_model} "
+                        f"(current model: {model})"
+                    )
+                    return None
+                vectors = cls(
+                    [str(term) for term in data["terms"]],
+                    data["quantized"],
+                    data["scales"],
+                    stored_model,
+                )
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Failed to load keyword vectors from {path}: {e}")
+            return None
+
+        logger.info(f"Loaded {len(vectors)} keyword vectors from {path}")
+        return vectors
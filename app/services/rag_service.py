@@ -11,17 +11,31 @@ Usage:
     docs = rag.query("番茄白粉病", top_k=3)
 """
 
+import hashlib
 import json
 import logging
 import os
+import threading
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
+import orjson
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 
+from app.core.cache import SQLiteCache
+from app.services.embeddings import (
+    EMBEDDING_PROVIDER,
+    LOCAL_EMBEDDING_MODEL,
+    BatchingEmbedder,
+)
+from app.services.keyword_vectors import KEYWORD_VECTORS_PATH, KeywordVectors
+
 # Load environment variables
 load_dotenv()
 
@@ -32,6 +46,24 @@ logger = logging.getLogger(__name__)
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIRECTORY", "data/chroma")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# HNSW 索引参数：M / ef_construction 仅在创建集合时生效，ef_search 可随时调整
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "400"))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "50"))
+# 跨进程持久化的查询结果缓存（空字符串表示禁用）；重新入库后由入库脚本清空
+RAG_DISK_CACHE_PATH = os.getenv("RAG_DISK_CACHE_PATH", "data/rag_cache.db")
+RAG_DISK_CACHE_SIZE = int(os.getenv("RAG_DISK_CACHE_SIZE", "10000"))
+RAG_DISK_CACHE_TTL = float(os.getenv("RAG_DISK_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "500"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+# 保护单例的创建与初始化（可重入：get_rag_service 持锁时会调用 RAGService()）
+_lock = threading.RLock()
+
+
+def _embedding_model_name() -> str:
+    """Name of the embedding model used for queries (defines the vector space)."""
+    return LOCAL_EMBEDDING_MODEL if EMBEDDING_PROVIDER == "local" else OPENAI_EMBEDDING_MODEL
 
 
 class RAGServiceNotInitializedError(Exception):
@@ -40,6 +72,124 @@ class RAGServiceNotInitializedError(Exception):
     pass
 
 
+class _SemanticQueryCache:
+    """
+    Thread-safe LRU cache of search results keyed by query embedding.
+
+    A lookup returns the results of the most similar cached query when its
+    cosine similarity reaches the threshold and it was run with the same
+    top_k and filter, so paraphrased queries ("番茄晚疫病症状" vs
+    "番茄晚疫病的症状") skip the vector store search. Similarity is computed
+    as a single matrix-vector product over the normalized cached vectors,
+    which stays well under a millisecond at a few hundred entries.
+    """
+
+    def __init__(self, maxsize: int = 500, threshold: float = 0.92):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of cached queries (least recently used are evicted)
+            threshold: Minimum cosine similarity for a hit
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._entries: OrderedDict[
+            int, Tuple[np.ndarray, int, Optional[str], List[Document]]
+        ] = OrderedDict()
+        self._next_id = 0
+        # 归一化向量矩阵按需重建（仅在条目增删时失效），_matrix_ids 为对应行的条目 ID
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if vector.ndim != 1 or not norm:
+            return None
+        return vector / norm
+
+    def get(
+        self, embedding: Sequence[float], top_k: int, filter_json: Optional[str]
+    ) -> Optional[List[Document]]:
+        """
+        Look up results for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            top_k: Number of results the query asks for
+            filter_json: Serialized metadata filter (None for no filter)
+
+        Returns:
+            Cached documents of the closest matching query, or None on a miss
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.vstack([self._entries[i][0] for i in self._matrix_ids])
+            if self._matrix.shape[1] != vector.shape[0]:
+                return None
+
+            scores = self._matrix @ vector
+            # 按相似度从高到低检查，只接受 top_k 与过滤条件都一致的条目
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for row in candidates[np.argsort(-scores[candidates])]:
+                entry_id = self._matrix_ids[row]
+                _, entry_top_k, entry_filter, docs = self._entries[entry_id]
+                if entry_top_k == top_k and entry_filter == filter_json:
+                    self._entries.move_to_end(entry_id)
+                    return docs
+        return None
+
+    def set(
+        self,
+        embedding: Sequence[float],
+        top_k: int,
+        filter_json: Optional[str],
+        docs: List[Document],
+    ) -> None:
+        """
+        Store results for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            top_k: Number of results the query asked for
+            filter_json: Serialized metadata filter (None for no filter)
+            docs: Retrieved documents
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            self._entries[self._next_id] = (vector, top_k, filter_json, docs)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_ids = []
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
 class RAGService:
     """
     Singleton service for retrieving relevant documents from ChromaDB.
@@ -51,21 +201,48 @@ class RAGService:
     _instance: Optional["RAGService"] = None
 
     def __new__(cls) -> "RAGService":
-        """Implement singleton pattern."""
+        """Implement singleton pattern (double-checked locking)."""
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
+            with _lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
         return cls._instance
 
     def __init__(self):
         """Initialize RAG service (lazily on first query)."""
         if self._initialized:
             return
-
-        self._chroma_db: Optional[Chroma] = None
-        self._embeddings: Optional[OpenAIEmbeddings] = None
-        self._initialized = True
-        logger.info("RAG Service singleton created")
+        with _lock:
+            if self._initialized:
+                return
+
+            self._chroma_db: Optional[Chroma] = None
+            # 保护 ChromaDB 的加载与 ef_search 调整，确保只执行一次
+            self._db_lock = threading.Lock()
+            self._embeddings: Optional[Embeddings] = None
+            # 分类术语的预计算查询向量（由入库脚本生成，随 ChromaDB 一起加载）
+            self._keyword_vectors: Optional[KeywordVectors] = None
+            # 当前集合已生效的 ef_search（None 表示尚未读取）
+            self._ef_search: Optional[int] = None
+            # 精确缓存（_cached_search 的 lru_cache）之后的第二层：语义相近的查询复用结果
+            self._semantic_cache = _SemanticQueryCache(
+                maxsize=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD
+            )
+            # 精确缓存的持久化副本：Celery worker 回收/重启后仍可命中，并在 worker 间共享
+            self._disk_cache: Optional[SQLiteCache] = (
+                SQLiteCache(
+                    RAG_DISK_CACHE_PATH,
+                    maxsize=RAG_DISK_CACHE_SIZE,
+                    ttl=RAG_DISK_CACHE_TTL,
+                )
+                if RAG_DISK_CACHE_PATH
+                else None
+            )
+            # 最后置位：其他线程在锁外检查该标志
+            self._initialized = True
+            logger.info("RAG Service singleton created")
 
     def _get_chroma_db(self) -> Chroma:
         """
@@ -80,6 +257,24 @@ class RAGService:
         if self._chroma_db is not None:
             return self._chroma_db
 
+        with self._db_lock:
+            if self._chroma_db is None:
+                self._load_chroma_db()
+        return self._chroma_db
+
+    def warm_up(self) -> None:
+        """
+        Load ChromaDB, the embedding backend and the keyword vectors now.
+
+        Called at worker startup so the first query does not pay for it.
+
+        Raises:
+            RAGServiceNotInitializedError: If database directory doesn't exist
+        """
+        self._get_chroma_db()
+
+    def _load_chroma_db(self) -> None:
+        """Open the persisted ChromaDB collection (caller holds _db_lock)."""
         chroma_path = CHROMA_PERSIST_DIR
         if not os.path.exists(chroma_path):
             raise RAGServiceNotInitializedError(
@@ -90,7 +285,10 @@ class RAGService:
         logger.info(f"Loading ChromaDB from {chroma_path}")
 
         # Initialize embeddings
-        if OPENAI_BASE_URL:
+        if EMBEDDING_PROVIDER == "local":
+            logger.info(f"Using local embedding model: {LOCAL_EMBEDDING_MODEL}")
+            self._embeddings = BatchingEmbedder(LOCAL_EMBEDDING_MODEL)
+        elif OPENAI_BASE_URL:
             logger.info(f"Using custom base URL: {OPENAI_BASE_URL}")
             logger.info(f"Using embedding model: {OPENAI_EMBEDDING_MODEL}")
             self._embeddings = OpenAIEmbeddings(
@@ -100,14 +298,127 @@ class RAGService:
         else:
             self._embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
 
-        # Load ChromaDB
+        self._keyword_vectors = KeywordVectors.load(
+            KEYWORD_VECTORS_PATH, _embedding_model_name()
+        )
+
+        # Load ChromaDB（最后赋值：其他线程在锁外检查 _chroma_db）
         self._chroma_db = Chroma(
             persist_directory=chroma_path,
             embedding_function=self._embeddings,
+            collection_metadata={
+                "hnsw:M": CHROMA_HNSW_M,
+                "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF,
+            },
         )
 
         logger.info("ChromaDB loaded successfully")
-        return self._chroma_db
+
+    def _tune_ef_search(self, top_k: int) -> None:
+        """
+        Make sure the collection's HNSW ef_search is large enough for top_k.
+
+        The target is max(CHROMA_HNSW_SEARCH_EF, 10 * top_k). ef_search only
+        ever grows, so the collection configuration is written at most a few
+        times per process instead of before every query.
+
+        Args:
+            top_k: Number of results the next query asks for
+        """
+        required = max(CHROMA_HNSW_SEARCH_EF, 10 * top_k)
+        if self._ef_search is not None and self._ef_search >= required:
+            return
+
+        with self._db_lock:
+            if self._ef_search is None or self._ef_search < required:
+                self._set_ef_search(required)
+
+    def _set_ef_search(self, required: int) -> None:
+        """Write ef_search to the collection configuration (caller holds _db_lock)."""
+        collection = self._chroma_db._collection
+        if self._ef_search is None:
+            # 已持久化的集合保留创建时的配置，先读取当前值
+            current = (collection.configuration.get("hnsw") or {}).get("ef_search")
+            if isinstance(current, int) and current >= required:
+                self._ef_search = current
+                return
+
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": required}})
+            logger.info(f"Set HNSW ef_search to {required}")
+        except Exception as e:
+            # 调参失败不影响检索，只是召回率可能偏低；记录后不再重试同一目标值
+            logger.warning(f"Failed to set HNSW ef_search to {required}: {e}")
+        self._ef_search = required
+
+    def _embed_query(self, query_text: str) -> List[float]:
+        """Embed a query, using the precomputed vector for taxonomy terms."""
+        if self._keyword_vectors is not None:
+            embedding = self._keyword_vectors.get(query_text)
+            if embedding is not None:
+                logger.debug(f"Using precomputed vector: '{query_text}'")
+                return embedding
+        return self._embeddings.embed_query(query_text)
+
+    async def _aembed_query(self, query_text: str) -> List[float]:
+        """Async variant of _embed_query."""
+        if self._keyword_vectors is not None:
+            embedding = self._keyword_vectors.get(query_text)
+            if embedding is not None:
+                logger.debug(f"Using precomputed vector: '{query_text}'")
+                return embedding
+        return await self._embeddings.aembed_query(query_text)
+
+    @staticmethod
+    def _disk_cache_key(
+        query_text: str, top_k: int, filter_json: Optional[str]
+    ) -> str:
+        # 嵌入模型不同则向量空间不同，模型名也作为 key 的一部分
+        raw = f"{_embedding_model_name()}|{query_text}|{top_k}|{filter_json}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def _disk_get(
+        self, query_text: str, top_k: int, filter_json: Optional[str]
+    ) -> Optional[List[Document]]:
+        """
+        Look up query results in the persistent cache.
+
+        Returns:
+            Cached documents, or None on a miss (or if the cache is disabled)
+        """
+        if self._disk_cache is None:
+            return None
+        key = self._disk_cache_key(query_text, top_k, filter_json)
+        raw = self._disk_cache.get(key)
+        if raw is None:
+            return None
+        try:
+            return [
+                Document(page_content=content, metadata=metadata)
+                for content, metadata in orjson.loads(raw)
+            ]
+        except (orjson.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring corrupt RAG disk cache entry: {e}")
+            return None
+
+    def _disk_set(
+        self,
+        query_text: str,
+        top_k: int,
+        filter_json: Optional[str],
+        docs: List[Document],
+    ) -> None:
+        """Store query results in the persistent cache (only text and metadata)."""
+        if self._disk_cache is None:
+            return
+        try:
+            raw = orjson.dumps([(doc.page_content, doc.metadata) for doc in docs])
+        except TypeError as e:
+            logger.warning(f"Skipping RAG disk cache write: {e}")
+            return
+        key = self._disk_cache_key(query_text, top_k, filter_json)
+        self._disk_cache.set(key, raw)
 
     def query(
         self,
@@ -190,23 +501,41 @@ class RAGService:
         if filter_metadata:
             logger.info(f"Filter metadata: {filter_metadata}")
 
+        cached = self._disk_get(query_text, top_k, filter_json)
+        if cached is not None:
+            logger.info(f"Disk cache hit: '{query_text}'")
+            return cached
+
         try:
             chroma_db = self._get_chroma_db()
 
+            # 查询向量只计算一次：先查语义缓存，未命中再直接用该向量检索
+            embedding = self._embed_query(query_text)
+            cached = self._semantic_cache.get(embedding, top_k, filter_json)
+            if cached is not None:
+                logger.info(f"Semantic cache hit: '{query_text}'")
+                # 近似命中只留在进程内，不写入持久化的精确缓存（否则会以精确命中的身份
+                # 在所有 worker 间长期共享，并进一步进入报告缓存）
+                return cached
+
+            self._tune_ef_search(top_k)
+
             # Perform similarity search
             if filter_metadata:
-                results = chroma_db.similarity_search(
-                    query_text,
+                results = chroma_db.similarity_search_by_vector(
+                    embedding,
                     k=top_k,
                     filter=filter_metadata,
                 )
             else:
-                results = chroma_db.similarity_search(query_text, k=top_k)
+                results = chroma_db.similarity_search_by_vector(embedding, k=top_k)
 
             logger.info(f"Retrieved {len(results)} documents")
             for i, doc in enumerate(results):
                 logger.debug(f"  [{i+1}] {doc.metadata.get('source', 'unknown')}")
 
+            self._semantic_cache.set(embedding, top_k, filter_json, results)
+            self._disk_set(query_text, top_k, filter_json, results)
             return results
 
         except Exception as e:
@@ -270,8 +599,8 @@ class RAGService:
         """
         异步缓存相似度搜索实现（使用 JSON 字符串作为缓存 key）。
 
-        注意：由于 @lru_cache 不支持 async 函数，这里不使用缓存装饰器。
-        异步调用通常在高并发场景，缓存效果有限。
+        注意：由于 @lru_cache 不支持 async 函数，这里不使用进程内精确缓存，
+        只经过与同步路径共享的持久化缓存和语义缓存。
 
         Args:
             query_text: 查询文本
@@ -292,23 +621,43 @@ class RAGService:
         if filter_metadata:
             logger.info(f"Filter metadata: {filter_metadata}")
 
+        cached = self._disk_get(query_text, top_k, filter_json)
+        if cached is not None:
+            logger.info(f"Disk cache hit (async): '{query_text}'")
+            return cached
+
         try:
             chroma_db = self._get_chroma_db()
 
+            # 与同步路径一致：查询向量只计算一次，先查语义缓存，未命中再直接用该向量检索
+            embedding = await self._aembed_query(query_text)
+            cached = self._semantic_cache.get(embedding, top_k, filter_json)
+            if cached is not None:
+                logger.info(f"Semantic cache hit (async): '{query_text}'")
+                # 近似命中只留在进程内，不写入持久化的精确缓存（否则会以精确命中的身份
+                # 在所有 worker 间长期共享，并进一步进入报告缓存）
+                return cached
+
+            self._tune_ef_search(top_k)
+
             # 异步执行相似度搜索
             if filter_metadata:
-                results = await chroma_db.asimilarity_search(
-                    query_text,
+                results = await chroma_db.asimilarity_search_by_vector(
+                    embedding,
                     k=top_k,
                     filter=filter_metadata,
                 )
             else:
-                results = await chroma_db.asimilarity_search(query_text, k=top_k)
+                results = await chroma_db.asimilarity_search_by_vector(
+                    embedding, k=top_k
+                )
 
             logger.info(f"Retrieved {len(results)} documents (async)")
             for i, doc in enumerate(results):
                 logger.debug(f"  [{i+1}] {doc.metadata.get('source', 'unknown')}")
 
+            self._semantic_cache.set(embedding, top_k, filter_json, results)
+            self._disk_set(query_text, top_k, filter_json, results)
             return results
 
         except Exception as e:
@@ -338,8 +687,10 @@ def get_rag_service() -> RAGService:
     global _rag_service_instance
 
     if _rag_service_instance is None:
-        logger.info("Initializing RAG Service singleton...")
-        _rag_service_instance = RAGService()
+        with _lock:
+            if _rag_service_instance is None:
+                logger.info("Initializing RAG Service singleton...")
+                _rag_service_instance = RAGService()
 
     return _rag_service_instance
 
@@ -354,7 +705,11 @@ def reset_rag_service() -> None:
         This should not be called in production code.
     """
     global _rag_service_instance
-    _rag_service_instance = None
-    # Also reset the class-level singleton
-    RAGService._instance = None
+    with _lock:
+        instance = RAGService._instance
+        if instance is not None and instance._disk_cache is not None:
+            instance._disk_cache.close()
+        _rag_service_instance = None
+        # Also reset the class-level singleton
+        RAGService._instance = None
     logger.warning("RAG Service singleton has been reset")
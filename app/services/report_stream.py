@@ -0,0 +1,174 @@
+"""
+Report streaming over Redis Streams
+
+While the diagnosis worker generates an LLM report it appends each chunk to a
+Redis Stream keyed by the diagnosis task ID; the API reads the stream and
+forwards the chunks to the client as Server-Sent Events, so the report can be
+rendered as soon as the first tokens arrive instead of after the whole
+report has been generated. Enabled with REPORT_STREAMING=true.
+
+Each stream entry has two fields: event (chunk, end or error) and data.
+Streams expire after the Celery result expiry, counted from the first chunk.
+
+Usage:
+    # Worker
+    report = publish_report_stream(task_id, generate_diagnosis_report_stream(...))
+
+    # API
+    async for event, data in iter_report_stream(task_id):
+        ...
+"""
+
+import logging
+from functools import lru_cache
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import redis
+import redis.asyncio
+
+from app.core.config import SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REPORT_STREAM_KEY_PREFIX = "report_stream:"
+REPORT_STREAM_BLOCK_MS = 5000  # XREAD 单次阻塞等待时间
+REPORT_STREAM_READ_COUNT = 100
+
+# Stream entry events
+EVENT_CHUNK = "chunk"
+EVENT_END = "end"
+EVENT_ERROR = "error"
+# 阻塞读取超时、暂无新条目（调用方可据此发送心跳或放弃等待）
+EVENT_IDLE = "idle"
+
+_async_redis: Optional[redis.asyncio.Redis] = None
+
+
+def report_stream_key(task_id: str) -> str:
+    """Redis key of the report stream for a diagnosis task."""
+    return f"{REPORT_STREAM_KEY_PREFIX}{task_id}"
+
+
+@lru_cache(maxsize=1)
+def _get_redis() -> redis.Redis:
+    """Get the process-wide Redis client used by workers to publish chunks."""
+    return redis.Redis.from_url(SETTINGS.redis_url)
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Get the process-wide async Redis client used by the API to read streams.
+
+    Released on application shutdown by aclose_async_redis().
+    """
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = redis.asyncio.Redis.from_url(SETTINGS.redis_url, decode_responses=True)
+    return _async_redis
+
+
+async def aclose_async_redis() -> None:
+    """Close the async Redis client (called from the FastAPI lifespan)."""
+    global _async_redis
+    if _async_redis is not None:
+        client, _async_redis = _async_redis, None
+        await client.aclose()
+
+
+def publish_report_stream(
+    task_id: str,
+    chunks: Iterable[str],
+    client: Optional[redis.Redis] = None,
+) -> str:
+    """
+    Consume report chunks, appending each one to the task's report stream.
+
+    Publishing is best effort: if Redis fails, the remaining chunks are still
+    consumed and the report is returned, only the live stream stops.
+
+    Args:
+        task_id: Diagnosis task ID the client follows
+        chunks: Report text chunks (e.g. from generate_diagnosis_report_stream)
+        client: Redis client (default: shared client for SETTINGS.redis_url)
+
+    Returns:
+        Full report text
+
+    Raises:
+        Exception: Whatever the chunk iterator raises, after an error event
+            has been published
+    """
+    client = client or _get_redis()
+    key = report_stream_key(task_id)
+    publishing = True
+    expiry_set = False
+
+    def publish(event: str, data: str) -> None:
+        nonlocal publishing, expiry_set
+        if not publishing:
+            return
+        try:
+            client.xadd(key, {"event": event, "data": data})
+            if not expiry_set:
+                # 第一条写入后立即设置过期时间：worker 在生成中途崩溃时流也会过期
+                expiry_set = True
+                if SETTINGS.celery_result_expires:
+                    client.expire(key, SETTINGS.celery_result_expires)
+        except redis.RedisError as e:
+            logger.warning(
+                "[Task %s] Report stream unavailable, not publishing: %s", task_id, e
+            )
+            publishing = False
+
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            publish(EVENT_CHUNK, chunk)
+    except Exception as e:
+        publish(EVENT_ERROR, str(e))
+        raise
+    else:
+        publish(EVENT_END, "")
+
+    return "".join(parts)
+
+
+async def iter_report_stream(
+    task_id: str,
+    client: Optional[redis.asyncio.Redis] = None,
+    block_ms: int = REPORT_STREAM_BLOCK_MS,
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Follow a task's report stream from the beginning.
+
+    Yields (EVENT_IDLE, "") whenever no entry arrives within block_ms, so the
+    caller can send keep-alives or give up; iteration ends after the end or
+    error event.
+
+    Args:
+        task_id: Diagnosis task ID
+        client: Async Redis client with decode_responses=True (default: shared client)
+        block_ms: Milliseconds to block per XREAD call
+
+    Yields:
+        (event, data) pairs
+    """
+    client = client or get_async_redis()
+    key = report_stream_key(task_id)
+    last_id = "0-0"
+    while True:
+        response = await client.xread(
+            {key: last_id}, count=REPORT_STREAM_READ_COUNT, block=block_ms
+        )
+        if not response:
+            yield EVENT_IDLE, ""
+            continue
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                event = fields.get("event", EVENT_CHUNK)
+                yield event, fields.get("data", "")
+                if event in (EVENT_END, EVENT_ERROR):
+                    return
@@ -8,9 +8,26 @@ operations for uploading files and generating access URLs.
 from minio import Minio
 from minio.error import S3Error
 from app.core.config import get_settings
-from typing import BinaryIO, Optional
+from typing import BinaryIO, Dict, Optional, Tuple
 import urllib3
+import certifi
+import hashlib
+import io
 import json
+import os
+import threading
+
+
+# 内容寻址文件名的扩展名（按 content_type）
+CONTENT_TYPE_EXTENSIONS: Dict[str, str] = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 保护单例的创建与初始化（可重入：get_storage_service 持锁时会调用 StorageService()）
+_lock = threading.RLock()
 
 
 class StorageConnectionError(Exception):
@@ -55,15 +72,30 @@ class StorageService:
 
     def __new__(cls) -> "StorageService":
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
+            with _lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
         return cls._instance
 
     def __init__(self):
         if self._initialized:
             return
-        self._initialized = True
+        with _lock:
+            if self._initialized:
+                return
+            self._connect()
+            # 连接成功后才置位：其他线程在锁外检查该标志，失败时下次调用会重试
+            self._initialized = True
+
+    def _connect(self) -> None:
+        """
+        Load MinIO settings, create the client and ensure the bucket exists.
 
+        Raises:
+            StorageConnectionError: If connection to MinIO fails
+        """
         # Load configuration
         settings = get_settings()
         self._endpoint = settings.minio_endpoint
@@ -72,10 +104,6 @@ class StorageService:
         self._bucket_name = settings.minio_bucket_name
         self._secure = settings.minio_secure
 
-        # Disable SSL warnings for development
-        if not self._secure:
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
         # Initialize MinIO client
         try:
             self._client = Minio(
@@ -83,16 +111,49 @@ class StorageService:
                 access_key=self._access_key,
                 secret_key=self._secret_key,
                 secure=self._secure,
+                http_client=self._create_http_client(settings.minio_pool_maxsize),
             )
 
             # Create bucket if not exists
             self._ensure_bucket_exists()
 
-        except S3Error as e:
+        # urllib3 HTTPError: MinIO 不可达（连接被拒绝、超时，重试耗尽后为 MaxRetryError）
+        except (S3Error, urllib3.exceptions.HTTPError) as e:
             raise StorageConnectionError(
                 f"Failed to connect to MinIO at {self._endpoint}: {e}"
             )
 
+    @staticmethod
+    def _create_http_client(maxsize: int) -> urllib3.PoolManager:
+        """
+        Build the connection pool shared by all MinIO calls of this process.
+
+        minio-py's default pool keeps only 10 connections, so concurrent
+        uploads from worker threads beyond that open (and discard) new TCP
+        connections. Timeouts and retries are also tightened so a stalled
+        MinIO fails a diagnosis quickly instead of after minutes.
+
+        Args:
+            maxsize: Maximum number of pooled connections per host
+
+        Returns:
+            PoolManager passed to Minio(http_client=...)
+        """
+        return urllib3.PoolManager(
+            num_pools=4,
+            maxsize=maxsize,
+            block=False,
+            timeout=urllib3.Timeout(connect=2.0, read=15.0),
+            retries=urllib3.Retry(
+                total=2,
+                backoff_factor=0.1,
+                status_forcelist=[500, 502, 503, 504],
+            ),
+            # 证书校验与 minio 默认客户端一致（仅 HTTPS 时生效）
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        )
+
     def _ensure_bucket_exists(self):
         """
         Ensure the bucket exists, create if not.
@@ -121,21 +182,40 @@ class StorageService:
                     self._bucket_name, json.dumps(policy)
                 )
 
-        except S3Error as e:
+        except (S3Error, urllib3.exceptions.HTTPError) as e:
             raise StorageConnectionError(
                 f"Failed to create or configure bucket '{self._bucket_name}': {e}"
             )
 
     def upload_image(
-        self, file_data: BinaryIO, filename: str, content_type: str = "image/jpeg"
+        self,
+        file_data: BinaryIO,
+        filename: Optional[str] = None,
+        content_type: str = "image/jpeg",
+        metadata: Optional[Dict[str, str]] = None,
+        length: Optional[int] = None,
     ) -> str:
         """
         Upload an image file to MinIO and return the accessible URL.
 
+        When the size is known (passed in, or measured on a seekable stream)
+        the object is sent with a single PUT; only unseekable streams of
+        unknown size fall back to a multipart upload.
+
+        Without a filename the object key is derived from the content hash
+        (``<blake2b-128 hex>.<ext>``); if that object already exists the PUT
+        is skipped, so retried or repeated uploads of the same image cost a
+        single HEAD request.
+
         Args:
             file_data: File-like object containing image data
             filename: Name to save the file as in the bucket
+                (default: content-addressed name)
             content_type: MIME type of the file (default: image/jpeg)
+            metadata: Optional user metadata stored as x-amz-meta-* headers
+                (values must be ASCII)
+            length: Number of bytes to upload from the current position
+                (default: measured from the stream when it is seekable)
 
         Returns:
             Full HTTP URL to access the uploaded file
@@ -149,26 +229,100 @@ class StorageService:
             ...     print(url)
             http://localhost:9010/smart-agriculture/diagnosis_123.jpg
         """
+        if filename is None:
+            if not file_data.seekable():
+                # 需要先计算哈希再上传，不可 seek 的流先读入内存（图片不超过 10MB）
+                file_data = io.BytesIO(file_data.read())
+            filename, length = self._content_address(file_data, content_type)
+            if self.object_exists(filename):
+                return self.get_public_url(filename)
+
+        if length is None and file_data.seekable():
+            # 从当前位置到末尾的字节数
+            position = file_data.tell()
+            length = file_data.seek(0, io.SEEK_END) - position
+            file_data.seek(position)
+
+        if length is None:
+            # Unknown size, stream until EOF in 5MB parts (MinIO minimum)
+            length, part_size = -1, 5 * 1024 * 1024
+        else:
+            # 已知大小：小于单个分片时 minio 直接单次 PUT，更大时自动计算分片大小
+            part_size = 0
+
         try:
             # Upload file
             self._client.put_object(
                 bucket_name=self._bucket_name,
                 object_name=filename,
                 data=file_data,
-                length=-1,  # Unknown size, stream until EOF
-                part_size=10 * 1024 * 1024,  # 10MB parts
+                length=length,
+                part_size=part_size,
                 content_type=content_type,
+                metadata=metadata,
             )
 
             # Generate URL
-            return self._get_public_url(filename)
+            return self.get_public_url(filename)
 
-        except S3Error as e:
+        except (S3Error, urllib3.exceptions.HTTPError) as e:
             raise StorageConnectionError(
                 f"Failed to upload file '{filename}' to MinIO: {e}"
             )
 
-    def _get_public_url(self, filename: str) -> str:
+    @staticmethod
+    def _content_address(file_data: BinaryIO, content_type: str) -> Tuple[str, int]:
+        """
+        Hash the stream from its current position and rewind it.
+
+        Args:
+            file_data: Seekable file-like object
+            content_type: MIME type used to pick the file extension
+
+        Returns:
+            (content-addressed filename, number of bytes hashed)
+        """
+        position = file_data.tell()
+        hasher = hashlib.blake2b(digest_size=16)
+        size = 0
+        while chunk := file_data.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+        file_data.seek(position)
+
+        extension = CONTENT_TYPE_EXTENSIONS.get(content_type, "jpg")
+        return f"{hasher.hexdigest()}.{extension}", size
+
+    def object_exists(self, filename: str) -> bool:
+        """
+        Check whether an object already exists in the bucket.
+
+        Uses a single HEAD request (stat_object) without downloading data.
+
+        Args:
+            filename: Name of the file in the bucket
+
+        Returns:
+            True if the object exists, False otherwise
+
+        Raises:
+            StorageConnectionError: If the check fails for any other reason
+        """
+        try:
+            self._client.stat_object(self._bucket_name, filename)
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise StorageConnectionError(
+                f"Failed to check file '{filename}' in MinIO: {e}"
+            )
+        except urllib3.exceptions.HTTPError as e:
+            raise StorageConnectionError(
+                f"Failed to check file '{filename}' in MinIO: {e}"
+            )
+
+    def get_public_url(self, filename: str) -> str:
         """
         Generate public access URL for a file.
 
@@ -208,5 +362,20 @@ def get_storage_service() -> StorageService:
     """
     global _storage_service
     if _storage_service is None:
-        _storage_service = StorageService()
+        with _lock:
+            if _storage_service is None:
+                _storage_service = StorageService()
+    return _storage_service
+
+
+def peek_storage_service() -> Optional[StorageService]:
+    """
+    Return the singleton StorageService if it has already been created.
+
+    Unlike get_storage_service(), this never connects to MinIO, so it is safe
+    to call from the event loop.
+
+    Returns:
+        StorageService instance, or None if it has not been initialized yet
+    """
     return _storage_service
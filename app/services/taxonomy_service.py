@@ -5,15 +5,21 @@ This module provides a singleton service that loads taxonomy_standard_v1.json
 and provides fast in-memory lookups for taxonomy entries.
 """
 
-import json
+import threading
+from bisect import bisect_left
 from pathlib import Path
 from typing import Optional
 
+import orjson
 from pydantic import ValidationError
 
 from app.models.taxonomy import Metadata, TaxonomyEntry, TaxonomyStandard
 
 
+# 保护单例的创建与初始化（可重入：get_taxonomy_service 持锁时会调用 TaxonomyService()）
+_lock = threading.RLock()
+
+
 class TaxonomyNotFoundError(Exception):
     """Raised when a taxonomy entry is not found."""
 
@@ -35,18 +41,37 @@ class TaxonomyService:
     """
 
     _instance: Optional["TaxonomyService"] = None
+    # Parsed data and indexes, keyed by the JSON file's (mtime_ns, size).
+    # Kept on the class so re-creating the singleton skips parsing.
+    _loaded: Optional[tuple[tuple[int, int], tuple]] = None
 
     def __new__(cls) -> "TaxonomyService":
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
+            with _lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
         return cls._instance
 
     def __init__(self):
         if self._initialized:
             return
-        self._initialized = True
+        with _lock:
+            if self._initialized:
+                return
+            self._load_indexes()
+            # 加载完成后才置位：其他线程在锁外检查该标志
+            self._initialized = True
+
+    def _load_indexes(self) -> None:
+        """
+        Attach the parsed taxonomy and indexes, loading them if needed.
 
+        Raises:
+            FileNotFoundError: If the taxonomy file does not exist
+            TaxonomyValidationError: If the data fails validation
+        """
         # Load JSON file
         json_path = Path("data/taxonomy_standard_v1.json")
         if not json_path.exists():
@@ -55,25 +80,76 @@ class TaxonomyService:
                 "Please ensure data/taxonomy_standard_v1.json exists."
             )
 
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        stat = json_path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        loaded = TaxonomyService._loaded
+        if loaded is None or loaded[0] != key:
+            loaded = (key, self._load(json_path))
+            TaxonomyService._loaded = loaded
+
+        (
+            self._data,
+            self._id_idx,
+            self._label_idx,
+            self._zh_idx,
+            self._by_name_or_label,
+            self._sorted_search_keys,
+        ) = loaded[1]
+        self._entries: list[TaxonomyEntry] = self._data.taxonomy
+
+    @staticmethod
+    def _load(json_path: Path) -> tuple:
+        """
+        Parse and validate the taxonomy file and build the lookup indexes.
+
+        Args:
+            json_path: Path to taxonomy_standard_v1.json
+
+        Returns:
+            Tuple of (data, id_idx, label_idx, zh_idx, by_name_or_label,
+            sorted_search_keys); the *_idx dicts map a key to the entry's
+            row in data.taxonomy
+
+        Raises:
+            TaxonomyValidationError: If the data fails validation
+        """
+        data = orjson.loads(json_path.read_bytes())
 
         # Validate with Pydantic
         try:
-            self._data = TaxonomyStandard(**data)
+            taxonomy_data = TaxonomyStandard.model_validate(data)
         except ValidationError as e:
             raise TaxonomyValidationError(f"Invalid taxonomy data: {e}") from e
 
-        # Build indexes for fast lookup
-        self._by_id: dict[int, TaxonomyEntry] = {
-            entry.id: entry for entry in self._data.taxonomy
-        }
-        self._by_label: dict[str, TaxonomyEntry] = {
-            entry.model_label: entry for entry in self._data.taxonomy
-        }
-        self._by_zh_name: dict[str, TaxonomyEntry] = {
-            entry.zh_scientific_name: entry for entry in self._data.taxonomy
-        }
+        # Build indexes for fast lookup (key -> row in taxonomy_data.taxonomy)
+        # and the name part of the combined search index in a single pass
+        entries = taxonomy_data.taxonomy
+        id_idx: dict[int, int] = {}
+        label_idx: dict[str, int] = {}
+        zh_idx: dict[str, int] = {}
+        by_name_or_label: dict[str, list[TaxonomyEntry]] = {}
+        for i, entry in enumerate(entries):
+            id_idx[entry.id] = i
+            label_idx[entry.model_label] = i
+            zh_idx[entry.zh_scientific_name] = i
+            by_name_or_label.setdefault(entry.zh_scientific_name, []).append(entry)
+
+        # Label matches are appended after all name matches, so for a key that
+        # is both a name and a label the name matches are listed first
+        for entry in entries:
+            matches = by_name_or_label.setdefault(entry.model_label, [])
+            if all(m.id != entry.id for m in matches):
+                matches.append(entry)
+        sorted_search_keys: list[str] = sorted(by_name_or_label)
+
+        return (
+            taxonomy_data,
+            id_idx,
+            label_idx,
+            zh_idx,
+            by_name_or_label,
+            sorted_search_keys,
+        )
 
     @property
     def metadata(self) -> Metadata:
@@ -82,7 +158,7 @@ class TaxonomyService:
 
     def get_all(self) -> list[TaxonomyEntry]:
         """Get all taxonomy entries."""
-        return self._data.taxonomy
+        return self._entries
 
     def get_by_id(self, id: int) -> TaxonomyEntry:
         """
@@ -97,9 +173,33 @@ class TaxonomyService:
         Raises:
             TaxonomyNotFoundError: If ID not found
         """
-        if id not in self._by_id:
-            raise TaxonomyNotFoundError(f"Taxonomy ID {id} not found")
-        return self._by_id[id]
+        try:
+            return self._entries[self._id_idx[id]]
+        except KeyError:
+            raise TaxonomyNotFoundError(f"Taxonomy ID {id} not found") from None
+
+    def get_many_by_ids(self, ids: list[int]) -> list[TaxonomyEntry]:
+        """
+        Get taxonomy entries for several IDs at once.
+
+        Args:
+            ids: Taxonomy entry IDs
+
+        Returns:
+            Entries in the same order as ids
+
+        Raises:
+            TaxonomyNotFoundError: If any ID is not found
+        """
+        id_idx = self._id_idx
+        try:
+            rows = [id_idx[id] for id in ids]
+        except KeyError as e:
+            raise TaxonomyNotFoundError(
+                f"Taxonomy ID {e.args[0]} not found"
+            ) from None
+        entries = self._entries
+        return [entries[row] for row in rows]
 
     def get_by_model_label(self, label: str) -> TaxonomyEntry:
         """
@@ -114,9 +214,10 @@ class TaxonomyService:
         Raises:
             TaxonomyNotFoundError: If label not found
         """
-        if label not in self._by_label:
-            raise TaxonomyNotFoundError(f"Model label '{label}' not found")
-        return self._by_label[label]
+        try:
+            return self._entries[self._label_idx[label]]
+        except KeyError:
+            raise TaxonomyNotFoundError(f"Model label '{label}' not found") from None
 
     def get_by_name(self, name: str) -> TaxonomyEntry:
         """
@@ -131,9 +232,54 @@ class TaxonomyService:
         Raises:
             TaxonomyNotFoundError: If name not found
         """
-        if name not in self._by_zh_name:
-            raise TaxonomyNotFoundError(f"Chinese name '{name}' not found")
-        return self._by_zh_name[name]
+        try:
+            return self._entries[self._zh_idx[name]]
+        except KeyError:
+            raise TaxonomyNotFoundError(f"Chinese name '{name}' not found") from None
+
+    def get_by_name_or_label(self, q: str) -> list[TaxonomyEntry]:
+        """
+        Get entries whose Chinese scientific name or model label equals q.
+
+        Both fields are served from one combined index, so this is a single
+        hash probe; entries matching on both fields are returned once.
+
+        Args:
+            q: Chinese scientific name or model label
+
+        Returns:
+            Matching entries (empty list if nothing matches)
+        """
+        return list(self._by_name_or_label.get(q, ()))
+
+    def lookup(self, q: str) -> list[TaxonomyEntry]:
+        """
+        Search entries by Chinese scientific name or model label.
+
+        An exact query is delegated to get_by_name_or_label(). A trailing
+        '*' turns the query into a prefix search (e.g. 'powdery*').
+
+        Args:
+            q: Chinese scientific name or model label
+
+        Returns:
+            Matching entries (empty list if nothing matches)
+        """
+        if not q.endswith("*"):
+            return self.get_by_name_or_label(q)
+
+        prefix = q[:-1]
+        keys = self._sorted_search_keys
+        results: list[TaxonomyEntry] = []
+        seen: set[int] = set()
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            for entry in self._by_name_or_label[keys[i]]:
+                if entry.id not in seen:
+                    seen.add(entry.id)
+                    results.append(entry)
+        return results
 
     def get_search_keywords(self, id: int) -> list[str]:
         """
@@ -151,6 +297,21 @@ class TaxonomyService:
         entry = self.get_by_id(id)
         return entry.search_keywords or []
 
+    def get_query_terms(self) -> list[str]:
+        """
+        Get the unique terms RAG queries are commonly made with.
+
+        Returns:
+            Chinese names and search keywords of all entries, deduplicated,
+            in file order
+        """
+        terms: dict[str, None] = {}
+        for entry in self._entries:
+            terms[entry.zh_scientific_name] = None
+            for keyword in entry.search_keywords or []:
+                terms[keyword] = None
+        return list(terms)
+
 
 # Module-level singleton instance
 _taxonomy_service: Optional[TaxonomyService] = None
@@ -165,5 +326,7 @@ def get_taxonomy_service() -> TaxonomyService:
     """
     global _taxonomy_service
     if _taxonomy_service is None:
-        _taxonomy_service = TaxonomyService()
+        with _lock:
+            if _taxonomy_service is None:
+                _taxonomy_service = TaxonomyService()
     return _taxonomy_service
@@ -5,9 +5,17 @@ This module contains background task handlers for CV processing,
 RAG retrieval, and LLM inference.
 """
 
-from app.worker.chains import GenerateReport, create_report_chain
-
 __all__ = [
     "GenerateReport",
     "create_report_chain",
 ]
+
+
+def __getattr__(name):
+    # 延迟导入 chains（LangChain 导入开销约 1 秒），
+    # 避免仅需 celery_app 的进程（如 API 服务）在启动时加载
+    if name in __all__:
+        from app.worker import chains
+
+        return getattr(chains, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -11,28 +11,62 @@ from app.core.config import get_settings
 # Initialize settings
 settings = get_settings()
 
+# Queues: long-running diagnosis pipeline vs. quick housekeeping tasks
+DEFAULT_QUEUE = "default"
+DIAGNOSIS_QUEUE = "diagnosis"
+
+# Content types workers and clients will decode
+ACCEPT_CONTENT = sorted({"json", settings.celery_serializer})
+
 # Create Celery app
 celery_app = Celery(
     "smart_agriculture_worker",
     broker=settings.celery_broker_url,
     backend=settings.celery_result_backend,
-    include=["app.worker.tasks"],  # Import tasks module
+    include=["app.worker.tasks", "app.worker.diagnosis_tasks"],  # Import tasks modules
 )
 
 # Configure Celery
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    # msgpack encodes the Chinese Markdown reports faster and smaller than JSON;
+    # JSON stays accepted so messages queued before a switch still decode
+    task_serializer=settings.celery_serializer,
+    result_serializer=settings.celery_serializer,
+    accept_content=ACCEPT_CONTENT,
+    result_accept_content=ACCEPT_CONTENT,
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
+    # Prefetch 1: task durations range from a cache hit to an LLM timeout, so
+    # workers only reserve tasks they can start (acks_late counts running tasks)
     worker_prefetch_multiplier=1,
+    # Ack after the task finishes so a crashed worker's tasks are redelivered
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_disable_rate_limits=True,
     worker_max_tasks_per_child=1000,
+    # Route diagnosis tasks to a dedicated queue so a backlog of long
+    # downloads/RAG/LLM calls never delays quick tasks (e.g. health_check)
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes={
+        "app.worker.diagnosis_tasks.analyze_image": {"queue": DIAGNOSIS_QUEUE},
+        "app.worker.diagnosis_tasks.analyze_images_batch": {"queue": DIAGNOSIS_QUEUE},
+        "app.worker.diagnosis_tasks.generate_report": {"queue": DIAGNOSIS_QUEUE},
+    },
+    # Result backend: compress stored results (diagnosis reports can be several KB)
+    # and let them expire so polled keys don't accumulate in Redis
+    result_compression=settings.celery_result_compression or None,
+    result_expires=settings.celery_result_expires,
 )
 
+# Partition result keys when the backend Redis is shared with other apps
+if settings.celery_result_keyprefix:
+    celery_app.conf.result_backend_transport_options = {
+        "global_keyprefix": settings.celery_result_keyprefix,
+    }
+
 
 # Example task to verify worker is running
 @celery_app.task(name="app.worker.tasks.health_check")
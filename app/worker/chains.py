@@ -5,17 +5,25 @@ This module contains Chain implementations for generating plant disease
 and pest reports using dynamic template switching based on CV results.
 """
 
+import asyncio
+import hashlib
 import logging
 import os
+import re
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, NoReturn, Optional, Tuple
 
-from typing import Any, Dict, List, Optional
-
+import orjson
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 
+from app.core.cache import SQLiteCache
 from app.core.templates import (
     TEMPLATE_TYPE_DISEASE,
     TEMPLATE_TYPE_PEST,
@@ -32,6 +40,146 @@ logger = logging.getLogger(__name__)
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 DEFAULT_TIMEOUT = 30  # seconds
+# 报告缓存：同一诊断 + 同一检索上下文直接复用已生成的报告（跨进程共享，空字符串表示禁用）
+REPORT_CACHE_PATH = os.getenv("REPORT_CACHE_PATH", "data/report_cache.db")
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "2000"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", str(7 * 24 * 3600)))
+REPORT_CACHE_MIN_CONFIDENCE = 0.7  # 低置信度的报告不缓存
+CONTEXT_DEDUP_PREFIX = 128  # 前缀相同的片段视为重复
+CONTEXT_SHINGLE_SIZE = 5  # 近似去重使用的字符 n-gram 长度
+CONTEXT_NEAR_DUP_THRESHOLD = 0.8  # 片段的 n-gram 有该比例已出现在前面的片段中则视为重复
+CONTEXT_MAX_CHARS_PER_DOC = 800
+CONTEXT_MAX_TOTAL_CHARS = 3200
+
+
+def _shingles(text: str) -> set:
+    """Character n-grams of text (the whole text if it is shorter than one n-gram)."""
+    n = CONTEXT_SHINGLE_SIZE
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+def _iter_context_snippets(documents: List[Document]) -> Iterator[Tuple[Document, str]]:
+    """
+    Yield deduplicated, length-capped snippets of RAG documents.
+
+    Chroma often returns near-duplicate chunks, e.g. the same article split
+    at different offsets. Documents whose first CONTEXT_DEDUP_PREFIX
+    characters were already seen are skipped, and so are snippets whose
+    character n-grams are mostly (CONTEXT_NEAR_DUP_THRESHOLD) covered by the
+    snippets already kept. Each snippet is truncated to
+    CONTEXT_MAX_CHARS_PER_DOC and iteration stops once CONTEXT_MAX_TOTAL_CHARS
+    have been emitted, keeping LLM input small.
+
+    Args:
+        documents: Retrieved documents, most relevant first
+
+    Yields:
+        (document, snippet) pairs
+    """
+    seen = set()
+    seen_shingles: set = set()
+    total = 0
+    for doc in documents:
+        content = doc.page_content.strip()
+        key = content[:CONTEXT_DEDUP_PREFIX]
+        if key in seen:
+            continue
+        seen.add(key)
+        snippet = content[:CONTEXT_MAX_CHARS_PER_DOC]
+        shingles = _shingles(snippet)
+        if len(shingles & seen_shingles) >= CONTEXT_NEAR_DUP_THRESHOLD * len(shingles):
+            continue
+        seen_shingles |= shingles
+        yield doc, snippet
+        total += len(snippet)
+        if total >= CONTEXT_MAX_TOTAL_CHARS:
+            break
+
+
+@lru_cache(maxsize=8)
+def _get_chat_model(
+    model_name: str,
+    temperature: float,
+    timeout: Optional[float] = None,
+    base_url: Optional[str] = None,
+) -> ChatOpenAI:
+    """
+    Get a ChatOpenAI instance shared by all callers with the same settings.
+
+    langchain_openai already shares its default httpx clients per base URL
+    and timeout; caching the ChatOpenAI object as well skips re-validating
+    its config and rebuilding the OpenAI SDK clients for every report.
+
+    Args:
+        model_name: OpenAI model identifier
+        temperature: LLM sampling temperature
+        timeout: Request timeout in seconds (default: SDK default)
+        base_url: OpenAI-compatible API base URL (default: SDK default)
+
+    Returns:
+        Cached ChatOpenAI instance
+    """
+    kwargs: Dict[str, Any] = {"model": model_name, "temperature": temperature}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if base_url:
+        kwargs["base_url"] = base_url
+    return ChatOpenAI(**kwargs)
+
+
+@lru_cache(maxsize=None)
+def _compiled_prompt(diagnosis_type: str) -> ChatPromptTemplate:
+    """
+    Parse the chat prompt for a diagnosis type once.
+
+    Args:
+        diagnosis_type: Either "Disease" or "Pest"
+
+    Returns:
+        Compiled ChatPromptTemplate
+
+    Raises:
+        ValueError: If diagnosis_type is not "Disease" or "Pest"
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", "你是一名农业专家，擅长植物病虫害诊断和防治建议。"),
+        ("human", get_report_template(diagnosis_type)),
+    ])
+
+
+# 只有两种模板，导入时预先编译
+for _diagnosis_type in (TEMPLATE_TYPE_DISEASE, TEMPLATE_TYPE_PEST):
+    _compiled_prompt(_diagnosis_type)
+
+
+@lru_cache(maxsize=8)
+def _build_report_chain(
+    diagnosis_type: str,
+    model_name: str,
+    temperature: float,
+) -> Runnable:
+    """
+    Compile the report chain (prompt | llm | parser) for a diagnosis type.
+
+    The template for each type is fixed, so the parsed prompt and the
+    RunnableSequence are built once and reused by every report.
+
+    Args:
+        diagnosis_type: Either "Disease" or "Pest"
+        model_name: OpenAI model identifier
+        temperature: LLM sampling temperature
+
+    Returns:
+        Compiled Runnable producing the report text
+
+    Raises:
+        ValueError: If diagnosis_type is not "Disease" or "Pest"
+    """
+    return (
+        _compiled_prompt(diagnosis_type)
+        | _get_chat_model(model_name, temperature)
+        | StrOutputParser()
+    )
 
 
 class LLMError(Exception):
@@ -70,10 +218,9 @@ class GenerateReport:
             model_name: OpenAI model identifier
             temperature: LLM temperature (lower = more factual)
         """
-        self.llm = ChatOpenAI(
-            model=model_name,
-            temperature=temperature,
-        )
+        self.model_name = model_name
+        self.temperature = temperature
+        self.llm = _get_chat_model(model_name, temperature)
         self.output_parser = StrOutputParser()
 
     def _format_context(self, documents: List[Document]) -> str:
@@ -86,16 +233,12 @@ class GenerateReport:
         Returns:
             Formatted context string
         """
-        if not documents:
-            return "未检索到相关上下文信息。"
+        formatted_sections = [
+            f"【上下文片段 {i}】\n{snippet}\n"
+            for i, (_, snippet) in enumerate(_iter_context_snippets(documents), 1)
+        ]
 
-        formatted_sections = []
-        for i, doc in enumerate(documents, 1):
-            formatted_sections.append(
-                f"【上下文片段 {i}】\n{doc.page_content}\n"
-            )
-
-        return "\n".join(formatted_sections)
+        return "\n".join(formatted_sections) or "未检索到相关上下文信息。"
 
     def _prepare_template_inputs(
         self,
@@ -165,8 +308,8 @@ class GenerateReport:
         Raises:
             ValueError: If diagnosis_type is not "Disease" or "Pest"
         """
-        # Route to appropriate template
-        template_str = get_report_template(diagnosis_type)
+        # Route to appropriate template (compiled chain is cached per type)
+        chain = _build_report_chain(diagnosis_type, self.model_name, self.temperature)
 
         # Prepare template inputs
         template_inputs = self._prepare_template_inputs(
@@ -180,21 +323,75 @@ class GenerateReport:
         if additional_context:
             template_inputs.update(additional_context)
 
-        # Construct the prompt
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一名农业专家，擅长植物病虫害诊断和防治建议。"),
-            ("human", template_str),
-        ])
-
-        # Create and invoke the chain
-        chain = prompt | self.llm | self.output_parser
-
         try:
             report = chain.invoke(template_inputs)
             return report
         except Exception as e:
             raise RuntimeError(f"Report generation failed: {str(e)}") from e
 
+    def generate_batch(
+        self,
+        items: List[Dict[str, Any]],
+        max_concurrency: int = 8,
+    ) -> List[str]:
+        """
+        Generate several reports concurrently.
+
+        Items are grouped by diagnosis_type so each group runs through its
+        cached chain with a single chain.batch() call; results are returned
+        in the order of the input items. Within a group, items with the
+        longest context are submitted first: output length grows with the
+        context, so when there are more items than max_concurrency the slow
+        requests overlap with the short ones instead of forming the tail.
+
+        Args:
+            items: Keyword arguments for generate(), one dict per report
+            max_concurrency: Maximum number of concurrent LLM requests
+
+        Returns:
+            Generated report texts, in the same order as items
+
+        Raises:
+            ValueError: If any diagnosis_type is not "Disease" or "Pest"
+        """
+        # 按诊断类型分组（不同类型使用不同模板）
+        groups: Dict[str, List[int]] = {}
+        inputs: List[Dict[str, Any]] = []
+        for index, item in enumerate(items):
+            diagnosis_type = item["diagnosis_type"]
+            template_inputs = self._prepare_template_inputs(
+                diagnosis_type=diagnosis_type,
+                diagnosis_name=item["diagnosis_name"],
+                diagnosis_en_name=item.get("diagnosis_en_name"),
+                documents=item.get("documents") or [],
+            )
+            if item.get("additional_context"):
+                template_inputs.update(item["additional_context"])
+            inputs.append(template_inputs)
+            groups.setdefault(diagnosis_type, []).append(index)
+
+        # 先编译所有链，类型非法时在发出任何请求前报错
+        chains = {
+            diagnosis_type: _build_report_chain(diagnosis_type, self.model_name, self.temperature)
+            for diagnosis_type in groups
+        }
+
+        reports: List[str] = [""] * len(items)
+        for diagnosis_type, indexes in groups.items():
+            # 最长优先调度（LPT）：长上下文的报告生成耗时最长，先提交以缩短整批的尾部延迟
+            indexes.sort(key=lambda i: len(inputs[i]["context"]), reverse=True)
+            try:
+                results = chains[diagnosis_type].batch(
+                    [inputs[i] for i in indexes],
+                    config={"max_concurrency": min(max_concurrency, len(indexes))},
+                )
+            except Exception as e:
+                raise RuntimeError(f"Batch report generation failed: {str(e)}") from e
+            for i, report in zip(indexes, results):
+                reports[i] = report
+
+        return reports
+
     async def agenerate(
         self,
         diagnosis_type: str,
@@ -208,8 +405,8 @@ class GenerateReport:
 
         Useful when calling from async Celery tasks or FastAPI endpoints.
         """
-        # Route to appropriate template
-        template_str = get_report_template(diagnosis_type)
+        # Route to appropriate template (compiled chain is cached per type)
+        chain = _build_report_chain(diagnosis_type, self.model_name, self.temperature)
 
         # Prepare template inputs
         template_inputs = self._prepare_template_inputs(
@@ -223,15 +420,6 @@ class GenerateReport:
         if additional_context:
             template_inputs.update(additional_context)
 
-        # Construct the prompt
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一名农业专家，擅长植物病虫害诊断和防治建议。"),
-            ("human", template_str),
-        ])
-
-        # Create and invoke the chain (async)
-        chain = prompt | self.llm | self.output_parser
-
         try:
             report = await chain.ainvoke(template_inputs)
             return report
@@ -261,18 +449,10 @@ def create_report_chain(
 # New simplified report generation function for RAG integration
 # =============================================================================
 
-# Prompt template for diagnosis report
-SIMPLIFIED_REPORT_TEMPLATE = """你是一位农业病虫害诊断专家。请根据以下信息生成一份专业的诊断报告。
-
-## 诊断信息
-- **作物类型**: {crop_type}
-- **诊断结果**: {diagnosis_name}
-- **置信度**: {confidence:.1%}
-
-{confidence_warning}
-
-## 相关知识资料
-{context_section}
+# Prompt for the diagnosis report. The static instructions form the system
+# message and every per-request field comes last in the human message, so the
+# identical prefix can be served from the provider's prompt cache.
+SIMPLIFIED_REPORT_SYSTEM = """你是一位农业病虫害诊断专家，负责根据诊断信息和相关知识资料生成专业的诊断报告。
 
 ## 要求
 请生成一份结构化的 Markdown 诊断报告，包含以下章节：
@@ -283,20 +463,66 @@ SIMPLIFIED_REPORT_TEMPLATE = """你是一位农业病虫害诊断专家。请根
 3. **预防措施**: 种植前预防、栽培管理建议、注意事项
 
 请使用专业但易懂的语言，确保农户能够理解并实施。
+如果诊断信息中带有置信度警告，请在报告开头保留该提示。
+"""
+
+SIMPLIFIED_REPORT_TEMPLATE = """## 诊断信息
+- **作物类型**: {crop_type}
+- **诊断结果**: {diagnosis_name}
+- **置信度**: {confidence:.1%}
+
+{confidence_warning}
+
+## 相关知识资料
+{context_section}
 
 ## 诊断报告
 """
 
-# Global cached LLM instance to enable connection reuse
-_CACHED_LLM: Optional[ChatOpenAI] = None
+# 模板固定，模块加载时解析一次，所有报告共用
+SIMPLIFIED_REPORT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SIMPLIFIED_REPORT_SYSTEM),
+    ("human", SIMPLIFIED_REPORT_TEMPLATE),
+])
+
+# 组合好的报告链按 LLM 实例缓存；值中保留 LLM 引用，避免 id 被回收后复用到别的对象
+_REPORT_CHAIN_CACHE_SIZE = 8
+_report_chains: Dict[int, Tuple[ChatOpenAI, Runnable]] = {}
+_report_chains_lock = threading.Lock()
+
+
+def _get_simplified_report_chain(llm: ChatOpenAI) -> Runnable:
+    """
+    Get the SIMPLIFIED_REPORT_PROMPT | llm | parser chain for an LLM instance.
+
+    The default LLMs are shared per timeout (see _get_llm), so in practice
+    each worker composes the chain once per timeout.
+
+    Args:
+        llm: Chat model the chain should call
+
+    Returns:
+        Cached Runnable producing the report text
+    """
+    with _report_chains_lock:
+        cached = _report_chains.get(id(llm))
+        if cached is not None and cached[0] is llm:
+            return cached[1]
+
+        chain = SIMPLIFIED_REPORT_PROMPT | llm | StrOutputParser()
+        _report_chains[id(llm)] = (llm, chain)
+        if len(_report_chains) > _REPORT_CHAIN_CACHE_SIZE:
+            # 插入顺序即新旧顺序，淘汰最早的
+            del _report_chains[next(iter(_report_chains))]
+        return chain
 
 
 def _get_llm(timeout: int = DEFAULT_TIMEOUT) -> ChatOpenAI:
     """
-    Initialize or retrieve cached OpenAI Chat LLM instance.
+    Retrieve the cached OpenAI Chat LLM instance for the given timeout.
 
-    Uses a cached instance if available and timeout matches default,
-    otherwise creates a new instance.
+    Instances are shared per timeout (see _get_chat_model), so repeated
+    reports reuse the same client and its pooled connections.
 
     Args:
         timeout: Request timeout in seconds
@@ -304,33 +530,100 @@ def _get_llm(timeout: int = DEFAULT_TIMEOUT) -> ChatOpenAI:
     Returns:
         ChatOpenAI instance configured for SiliconFlow API
     """
-    global _CACHED_LLM
+    if OPENAI_BASE_URL:
+        logger.debug("Using custom base URL: %s", OPENAI_BASE_URL)
+        logger.debug("Using chat model: %s", OPENAI_CHAT_MODEL)
 
-    # Return cached instance if using default timeout
-    if _CACHED_LLM is not None and timeout == DEFAULT_TIMEOUT:
-        return _CACHED_LLM
+    return _get_chat_model(OPENAI_CHAT_MODEL, 0.7, timeout, OPENAI_BASE_URL)
 
-    if OPENAI_BASE_URL:
-        logger.debug(f"Using custom base URL: {OPENAI_BASE_URL}")
-        logger.debug(f"Using chat model: {OPENAI_CHAT_MODEL}")
-        llm = ChatOpenAI(
-            model=OPENAI_CHAT_MODEL,
-            base_url=OPENAI_BASE_URL,
-            temperature=0.7,
-            timeout=timeout,
-        )
-    else:
-        llm = ChatOpenAI(
-            model=OPENAI_CHAT_MODEL,
-            temperature=0.7,
-            timeout=timeout,
-        )
 
-    # Cache the instance if using default settings
-    if timeout == DEFAULT_TIMEOUT:
-        _CACHED_LLM = llm
+@lru_cache(maxsize=None)
+def _open_report_cache(path: str) -> SQLiteCache:
+    return SQLiteCache(path, maxsize=REPORT_CACHE_SIZE, ttl=REPORT_CACHE_TTL)
+
+
+def _report_cache_key(
+    diagnosis_name: str,
+    crop_type: str,
+    confidence: float,
+    context_section: str,
+) -> Optional[str]:
+    """
+    Build the report cache key, or None if this report should not be cached.
+
+    The key covers everything that reaches the prompt (the formatted context
+    included) plus the chat model, so a changed knowledge base or model
+    never returns a stale report.
+    """
+    if not REPORT_CACHE_PATH or confidence < REPORT_CACHE_MIN_CONFIDENCE:
+        return None
+    raw = orjson.dumps(
+        [OPENAI_CHAT_MODEL, diagnosis_name, crop_type, round(confidence, 2), context_section]
+    )
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _get_cached_report(key: Optional[str]) -> Optional[str]:
+    """Look up a cached report (None on a miss or when caching is off)."""
+    if key is None:
+        return None
+    raw = _open_report_cache(REPORT_CACHE_PATH).get(key)
+    return raw.decode("utf-8") if raw is not None else None
+
+
+def _cache_report(key: Optional[str], report: str) -> None:
+    """Store a generated report (no-op when caching is off; failures are only logged)."""
+    if key is None or not report:
+        return
+    try:
+        _open_report_cache(REPORT_CACHE_PATH).set(key, report.encode("utf-8"))
+    except Exception as e:
+        # 缓存写入是尽力而为：失败不能影响已生成的报告
+        logger.warning("Report cache write failed: %s", e)
 
-    return llm
+
+# 正在生成中的报告（cache key -> Future）：相同请求并发到达时只调用一次 LLM
+_inflight_reports: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _claim_report(key: Optional[str]) -> Tuple[Optional[Future], bool]:
+    """
+    Register the caller as the producer of a report, or join one in flight.
+
+    Args:
+        key: Report cache key (None disables coalescing)
+
+    Returns:
+        (future, owner): the owner must generate the report and call
+        _release_report(); other callers wait on the future
+    """
+    if key is None:
+        return None, True
+    with _inflight_lock:
+        future = _inflight_reports.get(key)
+        if future is not None:
+            return future, False
+        future = Future()
+        _inflight_reports[key] = future
+        return future, True
+
+
+def _release_report(
+    key: Optional[str],
+    future: Optional[Future],
+    report: Optional[str] = None,
+    error: Optional[BaseException] = None,
+) -> None:
+    """Publish the owner's result (or error) to waiting callers."""
+    if key is None or future is None:
+        return
+    with _inflight_lock:
+        _inflight_reports.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(report)
 
 
 def _format_contexts(contexts: List[Document]) -> str:
@@ -343,16 +636,53 @@ def _format_contexts(contexts: List[Document]) -> str:
     Returns:
         Formatted context string for prompt
     """
-    if not contexts:
-        return "**未找到相关资料**。以下报告基于通用知识生成，建议参考专业农业资料确认。"
+    formatted_sections = [
+        f"### 资料 {i}: {doc.metadata.get('source', '未知来源')}\n\n{snippet}\n"
+        for i, (doc, snippet) in enumerate(_iter_context_snippets(contexts), 1)
+    ]
+
+    return "\n".join(formatted_sections) or (
+        "**未找到相关资料**。以下报告基于通用知识生成，建议参考专业农业资料确认。"
+    )
+
+
+# 按异常消息归类 LLM 调用失败（OpenAI SDK 与 httpx 的异常类型因版本而异，消息更稳定）
+_LLM_ERROR_PATTERN = re.compile(
+    r"(?P<timeout>timeout|timed out)"
+    r"|(?P<rate_limit>rate limit|\b429\b)"
+    r"|(?P<auth>authentication|\b401\b)",
+    re.IGNORECASE,
+)
 
-    formatted_sections = []
-    for i, doc in enumerate(contexts, 1):
-        source = doc.metadata.get("source", "未知来源")
-        content = doc.page_content.strip()
-        formatted_sections.append(f"### 资料 {i}: {source}\n\n{content}\n")
 
-    return "\n".join(formatted_sections)
+def _raise_llm_error(error: Exception, prefix: str = "") -> NoReturn:
+    """
+    Translate an LLM call failure into ReportTimeoutError or LLMError.
+
+    Args:
+        error: Exception raised while generating the report
+        prefix: Log message prefix (e.g. "Async ")
+
+    Raises:
+        ReportTimeoutError: If the message indicates a timeout
+        LLMError: For rate limit, authentication and all other failures
+    """
+    error_msg = str(error)
+    match = _LLM_ERROR_PATTERN.search(error_msg)
+    kind = match.lastgroup if match else None
+
+    if kind == "timeout":
+        logger.error("%sLLM timeout: %s", prefix, error_msg)
+        raise ReportTimeoutError(f"LLM call timed out: {error_msg}") from error
+    if kind == "rate_limit":
+        logger.error("OpenAI rate limit exceeded: %s", error_msg)
+        raise LLMError(f"API rate limit exceeded: {error_msg}") from error
+    if kind == "auth":
+        logger.error("OpenAI authentication failed: %s", error_msg)
+        raise LLMError(f"API authentication failed: {error_msg}") from error
+
+    logger.error("%sFailed to generate report: %s: %s", prefix, type(error).__name__, error_msg)
+    raise LLMError(f"Report generation failed: {error_msg}") from error
 
 
 def _get_confidence_warning(confidence: float) -> str:
@@ -374,6 +704,73 @@ def _get_confidence_warning(confidence: float) -> str:
         return ""
 
 
+def _validate_report_inputs(diagnosis_name: str, crop_type: str, confidence: float) -> None:
+    """
+    Validate report generation inputs.
+
+    Raises:
+        ValueError: If a name is empty or blank, or confidence is outside [0, 1]
+    """
+    # isspace() 判断空白，无需 strip() 生成新字符串
+    if not diagnosis_name or diagnosis_name.isspace():
+        raise ValueError("diagnosis_name cannot be empty")
+
+    if not crop_type or crop_type.isspace():
+        raise ValueError("crop_type cannot be empty")
+
+    if not 0.0 <= confidence <= 1.0:
+        raise ValueError("confidence must be between 0.0 and 1.0")
+
+
+def _prepare_report(
+    diagnosis_name: str,
+    crop_type: str,
+    confidence: float,
+    contexts: List[Document],
+    llm: Optional[ChatOpenAI],
+    timeout: int,
+) -> Tuple[ChatOpenAI, Dict[str, Any], Optional[str], Optional[str]]:
+    """
+    Shared setup of the sync, async and streaming report generators.
+
+    Args:
+        diagnosis_name: Name of the diagnosed disease
+        crop_type: Type of crop
+        confidence: Confidence score (0.0 to 1.0)
+        contexts: Retrieved documents
+        llm: Optional pre-configured LLM instance (disables the report cache)
+        timeout: Request timeout in seconds for the default LLM
+
+    Returns:
+        (llm, prompt_inputs, cache_key, cached_report); cached_report is the
+        stored report on a cache hit and None otherwise
+    """
+    # 只缓存默认模型生成的报告
+    use_cache = llm is None
+    if llm is None:
+        llm = _get_llm(timeout=timeout)
+
+    context_section = _format_contexts(contexts)
+
+    cache_key = (
+        _report_cache_key(diagnosis_name, crop_type, confidence, context_section)
+        if use_cache
+        else None
+    )
+    cached = _get_cached_report(cache_key)
+    if cached is not None:
+        logger.info("Report cache hit for %s (%d chars)", diagnosis_name, len(cached))
+
+    prompt_inputs = {
+        "crop_type": crop_type,
+        "diagnosis_name": diagnosis_name,
+        "confidence": confidence,
+        "confidence_warning": _get_confidence_warning(confidence),
+        "context_section": context_section,
+    }
+    return llm, prompt_inputs, cache_key, cached
+
+
 def generate_diagnosis_report(
     diagnosis_name: str,
     crop_type: str,
@@ -413,84 +810,45 @@ def generate_diagnosis_report(
         ... )
         >>> print(report)
     """
-    logger.info(f"Generating report for {diagnosis_name} (confidence={confidence:.2f})")
-
-    # Validate inputs
-    if not diagnosis_name or not diagnosis_name.strip():
-        raise ValueError("diagnosis_name cannot be empty")
-
-    if not crop_type or not crop_type.strip():
-        raise ValueError("crop_type cannot be empty")
-
-    if not 0.0 <= confidence <= 1.0:
-        raise ValueError("confidence must be between 0.0 and 1.0")
+    logger.info("Generating report for %s (confidence=%.2f)", diagnosis_name, confidence)
+    _validate_report_inputs(diagnosis_name, crop_type, confidence)
 
     try:
-        # Initialize LLM
-        if llm is None:
-            llm = _get_llm(timeout=timeout)
-
-        # Format contexts
-        context_section = _format_contexts(contexts)
-
-        # Generate confidence warning
-        confidence_warning = _get_confidence_warning(confidence)
-
-        # Create prompt
-        prompt_template = PromptTemplate(
-            template=SIMPLIFIED_REPORT_TEMPLATE,
-            input_variables=[
-                "crop_type",
-                "diagnosis_name",
-                "confidence",
-                "confidence_warning",
-                "context_section",
-            ],
+        llm, prompt_inputs, cache_key, cached = _prepare_report(
+            diagnosis_name, crop_type, confidence, contexts, llm, timeout
         )
+        if cached is not None:
+            return cached
 
-        # Build prompt inputs
-        prompt_inputs = {
-            "crop_type": crop_type,
-            "diagnosis_name": diagnosis_name,
-            "confidence": confidence,
-            "confidence_warning": confidence_warning,
-            "context_section": context_section,
-        }
+        # 相同报告正在由其他线程生成时直接等待其结果，不重复调用 LLM
+        inflight, owner = _claim_report(cache_key)
+        if not owner:
+            logger.info("Waiting for in-flight report for %s", diagnosis_name)
+            return inflight.result()
 
         # Generate report using LLM chain
         logger.info("Invoking LLM for report generation...")
-        chain = prompt_template | llm | StrOutputParser()
-        report = chain.invoke(prompt_inputs)
+        try:
+            chain = _get_simplified_report_chain(llm)
+            report = chain.invoke(prompt_inputs)
+        except BaseException as e:
+            _release_report(cache_key, inflight, error=e)
+            raise
+        # 无论缓存写入是否成功都要唤醒等待者，否则在途记录会永久残留
+        try:
+            _cache_report(cache_key, report)
+        finally:
+            _release_report(cache_key, inflight, report=report)
 
-        logger.info(f"Report generated successfully ({len(report)} chars)")
+        logger.info("Report generated successfully (%d chars)", len(report))
         return report
 
     except ReportTimeoutError as e:
-        logger.error(f"LLM call timed out after {timeout}s: {str(e)}")
+        logger.error("LLM call timed out after %ss: %s", timeout, e)
         raise
 
     except Exception as e:
-        error_type = type(e).__name__
-        error_msg = str(e)
-
-        # Handle timeout errors
-        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
-            logger.error(f"LLM timeout: {error_msg}")
-            raise ReportTimeoutError(f"LLM call timed out: {error_msg}") from e
-
-        # Handle rate limit errors
-        if "rate limit" in error_msg.lower() or "429" in error_msg:
-            logger.error(f"OpenAI rate limit exceeded: {error_msg}")
-            raise LLMError(f"API rate limit exceeded: {error_msg}") from e
-
-        # Handle authentication errors
-        if "authentication" in error_msg.lower() or "401" in error_msg:
-            logger.error(f"OpenAI authentication failed: {error_msg}")
-            raise LLMError(f"API authentication failed: {error_msg}") from e
-
-        # Generic error
-        logger.error(f"Failed to generate report: {error_type}: {error_msg}")
-        raise LLMError(f"Report generation failed: {error_msg}") from e
+        _raise_llm_error(e)
 
 
 async def generate_diagnosis_report_async(
@@ -533,81 +891,129 @@ async def generate_diagnosis_report_async(
         ... ))
         >>> print(report)
     """
-    logger.info(f"Generating async report for {diagnosis_name} (confidence={confidence:.2f})")
-
-    # Validate inputs
-    if not diagnosis_name or not diagnosis_name.strip():
-        raise ValueError("diagnosis_name cannot be empty")
-
-    if not crop_type or not crop_type.strip():
-        raise ValueError("crop_type cannot be empty")
-
-    if not 0.0 <= confidence <= 1.0:
-        raise ValueError("confidence must be between 0.0 and 1.0")
+    logger.info("Generating async report for %s (confidence=%.2f)", diagnosis_name, confidence)
+    _validate_report_inputs(diagnosis_name, crop_type, confidence)
 
     try:
-        # Initialize LLM
-        if llm is None:
-            llm = _get_llm(timeout=timeout)
-
-        # Format contexts
-        context_section = _format_contexts(contexts)
-
-        # Generate confidence warning
-        confidence_warning = _get_confidence_warning(confidence)
-
-        # Create prompt
-        prompt_template = PromptTemplate(
-            template=SIMPLIFIED_REPORT_TEMPLATE,
-            input_variables=[
-                "crop_type",
-                "diagnosis_name",
-                "confidence",
-                "confidence_warning",
-                "context_section",
-            ],
+        llm, prompt_inputs, cache_key, cached = _prepare_report(
+            diagnosis_name, crop_type, confidence, contexts, llm, timeout
         )
+        if cached is not None:
+            return cached
 
-        # Build prompt inputs
-        prompt_inputs = {
-            "crop_type": crop_type,
-            "diagnosis_name": diagnosis_name,
-            "confidence": confidence,
-            "confidence_warning": confidence_warning,
-            "context_section": context_section,
-        }
+        # 与同步路径共享在途请求表
+        inflight, owner = _claim_report(cache_key)
+        if not owner:
+            logger.info("Waiting for in-flight report for %s", diagnosis_name)
+            return await asyncio.wrap_future(inflight)
 
         # Generate report using async LLM chain
         logger.info("Invoking LLM for async report generation...")
-        chain = prompt_template | llm | StrOutputParser()
-        report = await chain.ainvoke(prompt_inputs)
+        try:
+            chain = _get_simplified_report_chain(llm)
+            report = await chain.ainvoke(prompt_inputs)
+        except BaseException as e:
+            _release_report(cache_key, inflight, error=e)
+            raise
+        # 无论缓存写入是否成功都要唤醒等待者，否则在途记录会永久残留
+        try:
+            _cache_report(cache_key, report)
+        finally:
+            _release_report(cache_key, inflight, report=report)
 
-        logger.info(f"Async report generated successfully ({len(report)} chars)")
+        logger.info("Async report generated successfully (%d chars)", len(report))
         return report
 
     except ReportTimeoutError as e:
-        logger.error(f"Async LLM call timed out after {timeout}s: {str(e)}")
+        logger.error("Async LLM call timed out after %ss: %s", timeout, e)
+        raise
+
+    except Exception as e:
+        _raise_llm_error(e, prefix="Async ")
+
+
+def generate_diagnosis_report_stream(
+    diagnosis_name: str,
+    crop_type: str,
+    confidence: float,
+    contexts: List[Document],
+    llm: Optional[ChatOpenAI] = None,
+    timeout: int = DEFAULT_TIMEOUT,
+) -> Iterator[str]:
+    """
+    Streaming version of generate_diagnosis_report().
+
+    Yields the report text as the LLM produces it, so callers can forward it
+    to the client before generation finishes. Caching, in-flight coalescing
+    and error classification are the same as generate_diagnosis_report(); a
+    cached or concurrently generated report is yielded as a single chunk.
+
+    Args:
+        diagnosis_name: Name of the diagnosed disease (e.g., "番茄晚疫病")
+        crop_type: Type of crop (e.g., "番茄")
+        confidence: Confidence score (0.0 to 1.0)
+        contexts: List of relevant documents retrieved from knowledge base
+        llm: Optional pre-configured LLM instance (for testing/customization)
+        timeout: Request timeout in seconds (default: 30)
+
+    Yields:
+        Report text chunks; joined together they form the full Markdown report
+
+    Raises:
+        ReportTimeoutError: If LLM call exceeds timeout
+        LLMError: If LLM API call fails for any reason
+
+    Example:
+        >>> for chunk in generate_diagnosis_report_stream("番茄晚疫病", "番茄", 0.92, docs):
+        ...     print(chunk, end="")
+    """
+    logger.info("Streaming report for %s (confidence=%.2f)", diagnosis_name, confidence)
+    _validate_report_inputs(diagnosis_name, crop_type, confidence)
+
+    try:
+        llm, prompt_inputs, cache_key, cached = _prepare_report(
+            diagnosis_name, crop_type, confidence, contexts, llm, timeout
+        )
+        if cached is not None:
+            yield cached
+            return
+
+        # 与非流式路径共享在途请求表
+        inflight, owner = _claim_report(cache_key)
+        if not owner:
+            logger.info("Waiting for in-flight report for %s", diagnosis_name)
+            yield inflight.result()
+            return
+
+        # Stream report using LLM chain
+        logger.info("Streaming LLM report generation...")
+        parts: List[str] = []
+        try:
+            chain = _get_simplified_report_chain(llm)
+            for chunk in chain.stream(prompt_inputs):
+                parts.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # 调用方提前关闭了生成器：释放在途记录，等待者得到普通的 LLMError
+            _release_report(
+                cache_key, inflight, error=LLMError("Report stream closed before completion")
+            )
+            raise
+        except BaseException as e:
+            _release_report(cache_key, inflight, error=e)
+            raise
+        report = "".join(parts)
+        # 无论缓存写入是否成功都要唤醒等待者，否则在途记录会永久残留
+        try:
+            _cache_report(cache_key, report)
+        finally:
+            _release_report(cache_key, inflight, report=report)
+
+        logger.info("Report streamed successfully (%d chars)", len(report))
+
+    except ReportTimeoutError as e:
+        logger.error("LLM call timed out after %ss: %s", timeout, e)
         raise
 
     except Exception as e:
-        error_type = type(e).__name__
-        error_msg = str(e)
-
-        # Handle timeout errors
-        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
-            logger.error(f"Async LLM timeout: {error_msg}")
-            raise ReportTimeoutError(f"LLM call timed out: {error_msg}") from e
-
-        # Handle rate limit errors
-        if "rate limit" in error_msg.lower() or "429" in error_msg:
-            logger.error(f"OpenAI rate limit exceeded: {error_msg}")
-            raise LLMError(f"API rate limit exceeded: {error_msg}") from e
-
-        # Handle authentication errors
-        if "authentication" in error_msg.lower() or "401" in error_msg:
-            logger.error(f"OpenAI authentication failed: {error_msg}")
-            raise LLMError(f"API authentication failed: {error_msg}") from e
-
-        # Generic error
-        logger.error(f"Failed to generate async report: {error_type}: {error_msg}")
-        raise LLMError(f"Report generation failed: {error_msg}") from e
+        _raise_llm_error(e)
@@ -4,28 +4,157 @@ Diagnosis tasks for Smart Agriculture system.
 This module contains Celery tasks for image analysis and diagnosis.
 """
 
+import hashlib
 import logging
+import os
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 
+import orjson
+from celery.signals import worker_ready
+
+from app.core.cache import SQLiteCache
+from app.core.config import SETTINGS
 from app.core.ssrf_protection import (
     ImageDownloadError,
     SSRFValidationError,
     download_image_securely,
+    download_images_batch_sync,
 )
+from app.models.diagnosis import REPORT_STATUS_PENDING
 from app.services.rag_service import RAGServiceNotInitializedError, get_rag_service
+from app.services.report_stream import publish_report_stream
 from app.services.taxonomy_service import get_taxonomy_service
-from app.worker.celery_app import celery_app
+from app.worker.celery_app import DIAGNOSIS_QUEUE, celery_app
 from app.worker.chains import (
     LLMError,
     ReportTimeoutError,
     generate_diagnosis_report,
+    generate_diagnosis_report_stream,
 )
 
 logger = logging.getLogger(__name__)
 
+# Mock CV 推理的候选结果（只读，模块加载时创建一次）
+MOCK_INFERENCE_RESULTS: tuple[dict, ...] = (
+    {"model_label": "healthy", "confidence": 0.95},
+    {"model_label": "powdery_mildew", "confidence": 0.87},
+    {"model_label": "aphid_complex", "confidence": 0.92},
+    {"model_label": "spider_mite", "confidence": 0.78},
+    {"model_label": "late_blight", "confidence": 0.85},
+)
+
+# 诊断结果缓存：按图片内容（而非 URL，签名 URL 会变化、外部 URL 的内容也可能变化）
+# 复用已完成的诊断，跨进程共享（空字符串表示禁用）。URL 只作为下方短时去重映射的键，
+# 不作为诊断结果的长期键
+DIAGNOSIS_CACHE_PATH = os.getenv("DIAGNOSIS_CACHE_PATH", "data/diagnosis_cache.db")
+DIAGNOSIS_CACHE_SIZE = 5000
+DIAGNOSIS_CACHE_TTL = 24 * 3600  # 秒
+# 图片 URL → 内容哈希的映射（同一文件），命中且诊断已缓存时跳过下载。
+# 外部 URL 的内容可能变化，长期信任 URL 会返回过期的诊断；这里只在很短的窗口内
+# 对重试/重复提交去重，超出窗口仍按内容键重新下载验证
+DIAGNOSIS_URL_CACHE_TTL = 60  # 秒
+
+# 批量诊断：单批最多图片数、并发执行 RAG + LLM 的图片数（受 LLM 接口限流约束）
+BATCH_MAX_IMAGES = 20
+BATCH_DIAGNOSIS_CONCURRENCY = 4
+
+
+@lru_cache(maxsize=4)
+def _open_diagnosis_cache(path: str, ttl: float = DIAGNOSIS_CACHE_TTL) -> SQLiteCache:
+    return SQLiteCache(path, maxsize=DIAGNOSIS_CACHE_SIZE, ttl=ttl)
+
+
+def _image_hash(image_data: bytes) -> str:
+    """图片内容哈希。"""
+    return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def _diagnosis_cache_key(
+    image_hash: str,
+    crop_type: Optional[str],
+    location: Optional[str],
+) -> Optional[str]:
+    """
+    生成诊断缓存键（缓存禁用时返回 None）。
+
+    键包含图片内容哈希与可选参数（作物类型会进入 RAG 查询和报告）。
+    """
+    if not DIAGNOSIS_CACHE_PATH:
+        return None
+    raw = orjson.dumps([image_hash, crop_type, location])
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _url_cache_key(image_url: str) -> str:
+    return "url:" + hashlib.blake2b(image_url.encode(), digest_size=16).hexdigest()
+
+
+def _get_cached_image_hash(image_url: str) -> Optional[str]:
+    """读取 URL 上次下载到的图片内容哈希（未命中或缓存禁用时返回 None）。"""
+    if not DIAGNOSIS_CACHE_PATH:
+        return None
+    raw = _open_diagnosis_cache(DIAGNOSIS_CACHE_PATH, DIAGNOSIS_URL_CACHE_TTL).get(
+        _url_cache_key(image_url)
+    )
+    return raw.decode() if raw is not None else None
+
+
+def _remember_image_hash(image_url: str, image_hash: str) -> None:
+    """记录 URL 对应的图片内容哈希。"""
+    if DIAGNOSIS_CACHE_PATH:
+        _open_diagnosis_cache(DIAGNOSIS_CACHE_PATH, DIAGNOSIS_URL_CACHE_TTL).set(
+            _url_cache_key(image_url), image_hash.encode()
+        )
+
+
+def _get_cached_diagnosis(key: Optional[str]) -> Optional[dict]:
+    """读取缓存的诊断结果（未命中或缓存禁用时返回 None）。"""
+    if key is None:
+        return None
+    raw = _open_diagnosis_cache(DIAGNOSIS_CACHE_PATH).get(key)
+    return orjson.loads(raw) if raw is not None else None
+
+
+def _cache_diagnosis(key: Optional[str], result: dict) -> None:
+    """
+    缓存完整的诊断结果。
+
+    报告生成失败（可能是暂时性错误）或报告仍在异步生成的结果不缓存。
+    """
+    if key is None or result.get("report_error") or result.get("report_task_id"):
+        return
+    try:
+        value = orjson.dumps(result)
+    except TypeError as e:
+        # 缓存只是优化，无法序列化时跳过，不影响任务结果
+        logger.warning("Diagnosis result not cacheable: %s", e)
+        return
+    _open_diagnosis_cache(DIAGNOSIS_CACHE_PATH).set(key, value)
+
+
+@worker_ready.connect
+def _warm_up_services(sender=None, **kwargs) -> None:
+    """
+    诊断 worker 启动后预先初始化分类服务和 RAG 服务。
+
+    否则首个任务要承担加载分类表、连接 ChromaDB 的开销。只在消费诊断队列的
+    worker 中执行；初始化失败只记录日志，任务中仍会按需重试。
+    """
+    if sender is not None and DIAGNOSIS_QUEUE not in sender.app.amqp.queues.consume_from:
+        return
+    try:
+        get_taxonomy_service()
+        get_rag_service().warm_up()
+    except Exception as e:
+        logger.warning("Service warm-up failed, initializing on first task: %s", e)
+    else:
+        logger.info("Taxonomy and RAG services warmed up")
+
 
 @contextmanager
 def _timer(task_id: str, operation_name: str):
@@ -43,12 +172,328 @@ def _timer(task_id: str, operation_name: str):
         >>> with _timer(task_id, "image_download"):
         ...     image_data = download_image_securely_async(url)
     """
-    start = time.time()
+    # INFO 级别关闭时不计时也不记录
+    if not logger.isEnabledFor(logging.INFO):
+        yield
+        return
+    start = time.perf_counter_ns()
     try:
         yield
     finally:
-        elapsed_ms = int((time.time() - start) * 1000)
-        logger.info(f"[Task {task_id}] {operation_name} completed in {elapsed_ms}ms")
+        elapsed_ms = (time.perf_counter_ns() - start) // 1_000_000
+        logger.info("[Task %s] %s completed in %dms", task_id, operation_name, elapsed_ms)
+
+
+def _generate_report(
+    task_id: str,
+    diagnosis_name: str,
+    confidence: float,
+    crop_type: Optional[str] = None,
+    stream_id: Optional[str] = None,
+) -> dict:
+    """
+    检索知识库并生成 LLM 诊断报告。
+
+    报告生成失败不会抛出异常，错误信息写入 report_error。
+
+    Args:
+        task_id: Celery 任务 ID（用于日志）
+        diagnosis_name: 诊断名称
+        confidence: 置信度
+        crop_type: 可选的作物类型
+        stream_id: 客户端跟随的诊断任务 ID；开启 REPORT_STREAMING 时报告分块发布到该任务的报告流
+
+    Returns:
+        {"report": ..., "report_error": ..., "timings": {"rag_query_ms": ..., "llm_report_ms": ...}}
+    """
+    logger.info("[Task %s] Generating report for %s...", task_id, diagnosis_name)
+    report_result = {
+        "report": None,
+        "report_error": None,
+        "timings": {"rag_query_ms": None, "llm_report_ms": None},
+    }
+    try:
+        # 查询 RAG 服务获取相关知识：提供作物类型时查询中保留作物（不同作物检索到
+        # 不同资料）；未提供时以分类术语（诊断名称）查询，可直接命中预计算的查询向量
+        rag = get_rag_service()
+        query_text = f"{crop_type} {diagnosis_name}" if crop_type else diagnosis_name
+
+        # RAG 查询计时
+        rag_start = time.time()
+        contexts = rag.query(query_text, top_k=3)
+        rag_time = int((time.time() - rag_start) * 1000)
+        report_result["timings"]["rag_query_ms"] = rag_time
+
+        logger.info(
+            "[Task %s] Retrieved %d documents from RAG in %dms",
+            task_id, len(contexts), rag_time,
+        )
+
+        # 生成 LLM 报告
+        llm_start = time.time()
+        report_kwargs = {
+            "diagnosis_name": diagnosis_name,
+            "crop_type": crop_type or "未知",
+            "confidence": confidence,
+            "contexts": contexts,
+            "timeout": 30,
+        }
+        if stream_id and SETTINGS.report_streaming:
+            # 边生成边发布，客户端通过 SSE 实时接收
+            report = publish_report_stream(
+                stream_id, generate_diagnosis_report_stream(**report_kwargs)
+            )
+        else:
+            report = generate_diagnosis_report(**report_kwargs)
+        llm_time = int((time.time() - llm_start) * 1000)
+        report_result["timings"]["llm_report_ms"] = llm_time
+
+        report_result["report"] = report
+        logger.info(
+            "[Task %s] Report generated successfully (%d chars) in %dms",
+            task_id, len(report), llm_time,
+        )
+
+    except RAGServiceNotInitializedError as e:
+        logger.warning("[Task %s] RAG service not initialized: %s", task_id, e)
+        report_result["report_error"] = f"RAG service not initialized: {str(e)}"
+
+    except (ReportTimeoutError, LLMError) as e:
+        logger.error("[Task %s] Report generation failed: %s", task_id, e)
+        report_result["report_error"] = str(e)
+
+    except Exception as e:
+        logger.error(
+            "[Task %s] Unexpected error during report generation: %s",
+            task_id, e,
+            exc_info=True,
+        )
+        report_result["report_error"] = f"Unexpected error: {str(e)}"
+
+    return report_result
+
+
+def _dispatch_report(task_id: str, result: dict) -> Optional[str]:
+    """
+    投递报告生成任务。
+
+    Args:
+        task_id: 诊断任务 ID
+        result: 诊断结果（需包含 diagnosis_name 和 confidence）
+
+    Returns:
+        报告任务 ID；投递失败时返回 None（调用方改为同步生成）
+    """
+    try:
+        report_task = generate_report.apply_async(
+            kwargs={
+                "diagnosis_name": result["diagnosis_name"],
+                "confidence": result["confidence"],
+                "crop_type": result.get("crop_type"),
+                "stream_id": task_id,
+            },
+        )
+    except Exception as e:
+        logger.warning(
+            "[Task %s] Failed to dispatch report task, generating inline: %s",
+            task_id, e,
+        )
+        return None
+
+    logger.info("[Task %s] Report task dispatched: %s", task_id, report_task.id)
+    return report_task.id
+
+
+def _download_cache_key(
+    image_url: str,
+    image_data: bytes,
+    crop_type: Optional[str],
+    location: Optional[str],
+) -> Optional[str]:
+    """记录 URL 对应的内容哈希，并返回下载图片的诊断缓存键。"""
+    image_hash = _image_hash(image_data)
+    _remember_image_hash(image_url, image_hash)
+    return _diagnosis_cache_key(image_hash, crop_type, location)
+
+
+def _cached_result(
+    task_id: str,
+    cache_key: Optional[str],
+    download_time_ms: int,
+    total_start: float,
+) -> Optional[dict]:
+    """读取缓存的诊断结果并填入本次任务的耗时（未命中时返回 None）。"""
+    cached = _get_cached_diagnosis(cache_key)
+    if cached is None:
+        return None
+    total_time = int((time.time() - total_start) * 1000)
+    cached["timings"] = {
+        "image_download_ms": download_time_ms,
+        "inference_ms": 0,
+        "rag_query_ms": None,
+        "llm_report_ms": None,
+        "total_ms": total_time,
+    }
+    logger.info(
+        "[Task %s] Diagnosis cache hit: %s (total: %dms)",
+        task_id, cached["diagnosis_name"], total_time,
+    )
+    return cached
+
+
+def _cached_result_for_url(
+    task_id: str,
+    image_url: str,
+    crop_type: Optional[str],
+    location: Optional[str],
+    total_start: float,
+) -> Optional[dict]:
+    """
+    下载前按 URL 查找缓存的诊断结果（短时间内重试、重复提交同一 URL 时无需重新下载）。
+
+    URL 在 DIAGNOSIS_URL_CACHE_TTL 内下载过（已知内容哈希）且该内容的诊断已缓存时
+    返回结果，否则返回 None。
+    """
+    image_hash = _get_cached_image_hash(image_url)
+    if image_hash is None:
+        return None
+    return _cached_result(
+        task_id, _diagnosis_cache_key(image_hash, crop_type, location), 0, total_start
+    )
+
+
+def _diagnose_image(
+    task_id: str,
+    cache_key: Optional[str],
+    download_time_ms: int,
+    total_start: float,
+    crop_type: Optional[str] = None,
+    location: Optional[str] = None,
+    stream_id: Optional[str] = None,
+) -> dict:
+    """
+    对已下载的图片执行推理、分类查询和报告生成（analyze_image 与 analyze_images_batch 共用）。
+
+    Args:
+        task_id: Celery 任务 ID（用于日志）
+        cache_key: 图片的诊断缓存键（见 _diagnosis_cache_key；缓存禁用时为 None）
+        download_time_ms: 下载耗时（毫秒）
+        total_start: 任务开始时间（time.time()），用于计算总耗时
+        crop_type: 可选的作物类型
+        location: 可选的地理位置
+        stream_id: 客户端跟随的诊断任务 ID；为 None 时（批量诊断）报告同步生成，不提前返回也不发布报告流
+
+    Returns:
+        诊断结果字典
+    """
+    # 相同图片（如移动端重试）已诊断过则直接返回缓存结果，跳过推理、RAG 和 LLM
+    cached = _cached_result(task_id, cache_key, download_time_ms, total_start)
+    if cached is not None:
+        return cached
+
+    # 2. 模拟 CV 模型推理（Mock 数据）
+    logger.info("[Task %s] Running CV model inference...", task_id)
+    start_time = time.time()
+
+    # Mock: 随机选择一个分类结果
+    mock_result = random.choice(MOCK_INFERENCE_RESULTS)
+    inference_time = int((time.time() - start_time) * 1000)
+
+    logger.info(
+        "[Task %s] Mock inference result: %s (confidence: %s)",
+        task_id, mock_result["model_label"], mock_result["confidence"],
+    )
+
+    # 3. 查询 TaxonomyService 获取详细信息
+    taxonomy = get_taxonomy_service()
+    try:
+        taxonomy_entry = taxonomy.get_by_model_label(
+            mock_result["model_label"]
+        )
+    except Exception as e:
+        logger.warning(
+            "[Task %s] Taxonomy entry not found for %s: %s",
+            task_id, mock_result["model_label"], e,
+        )
+        taxonomy_entry = None
+
+    # 4. 构建诊断结果
+    result = {
+        "model_label": mock_result["model_label"],
+        "confidence": mock_result["confidence"],
+        "inference_time_ms": inference_time,
+        "timings": {
+            "image_download_ms": download_time_ms,
+            "inference_ms": inference_time,
+            "rag_query_ms": None,
+            "llm_report_ms": None,
+        },
+    }
+
+    if taxonomy_entry:
+        result.update({
+            "diagnosis_name": taxonomy_entry.zh_scientific_name,
+            "latin_name": taxonomy_entry.latin_name,
+            "category": taxonomy_entry.category,
+            "action_policy": taxonomy_entry.action_policy,
+            "taxonomy_id": taxonomy_entry.id,
+            "description": taxonomy_entry.description,
+            "risk_level": taxonomy_entry.risk_level,
+        })
+    else:
+        result.update({
+            "diagnosis_name": "未知",
+            "latin_name": "Unknown",
+            "category": "Unknown",
+            "action_policy": "HUMAN_REVIEW",
+            "taxonomy_id": None,
+        })
+
+    # 5. 添加可选参数
+    if crop_type:
+        result["crop_type"] = crop_type
+    if location:
+        result["location"] = location
+
+    # 6. 生成 LLM 报告（如果需要）
+    if taxonomy_entry and taxonomy_entry.action_policy == "RETRIEVE":
+        report_task_id = None
+        if stream_id and SETTINGS.diagnosis_early_return:
+            report_task_id = _dispatch_report(task_id, result)
+
+        if report_task_id:
+            # 诊断结果立即返回，报告由后续任务生成（客户端继续轮询同一任务 ID）
+            result["report"] = None
+            result["report_error"] = None
+            result["report_task_id"] = report_task_id
+            result["report_status"] = REPORT_STATUS_PENDING
+        else:
+            report_result = _generate_report(
+                task_id,
+                diagnosis_name=result["diagnosis_name"],
+                confidence=result["confidence"],
+                crop_type=result.get("crop_type"),
+                stream_id=stream_id,
+            )
+            result["report"] = report_result["report"]
+            result["report_error"] = report_result["report_error"]
+            result["timings"].update(report_result["timings"])
+    else:
+        # 不需要生成报告
+        result["report"] = None
+        result["report_error"] = None
+
+    # 计算总耗时
+    total_time = int((time.time() - total_start) * 1000)
+    result["timings"]["total_ms"] = total_time
+    _cache_diagnosis(cache_key, result)
+
+    logger.info(
+        "[Task %s] Diagnosis completed: %s (total: %dms)",
+        task_id, result["diagnosis_name"], total_time,
+    )
+
+    return result
 
 
 @celery_app.task(name="app.worker.diagnosis_tasks.analyze_image", bind=True)
@@ -84,11 +529,15 @@ def analyze_image(
     task_id = self.request.id
     total_start = time.time()
 
-    logger.info(f"[Task {task_id}] Starting diagnosis for image: {image_url}")
+    logger.info("[Task %s] Starting diagnosis for image: %s", task_id, image_url)
 
     try:
+        cached = _cached_result_for_url(task_id, image_url, crop_type, location, total_start)
+        if cached is not None:
+            return cached
+
         # 1. 安全下载图片（同步 HTTP，包含 SSRF 防护和 DNS Rebinding 防护）
-        logger.info(f"[Task {task_id}] Downloading image from: {image_url}")
+        logger.info("[Task %s] Downloading image from: %s", task_id, image_url)
         download_start = time.time()
         try:
             image_data = download_image_securely(
@@ -97,9 +546,13 @@ def analyze_image(
             download_time_ms = int((time.time() - download_start) * 1000)
             image_size = len(image_data)
             logger.info(
-                f"[Task {task_id}] Image downloaded successfully, "
-                f"size: {image_size} bytes (took {download_time_ms}ms)"
+                "[Task %s] Image downloaded successfully, size: %d bytes (took %dms)",
+                task_id, image_size, download_time_ms,
             )
+            # 推理为 Mock 实现，图片只用于计算缓存键；算完即释放，
+            # 避免最大 10MB 的图片在 RAG + LLM 期间一直占用内存
+            cache_key = _download_cache_key(image_url, image_data, crop_type, location)
+            del image_data
         except SSRFValidationError as e:
             # URL 验证失败（内网地址、不支持的协议等）
             raise RuntimeError(f"URL 验证失败: {str(e)}") from e
@@ -107,173 +560,146 @@ def analyze_image(
             # 图片下载失败（类型错误、大小超限等）
             raise RuntimeError(f"图片下载失败: {str(e)}") from e
 
-        # 2. 模拟 CV 模型推理（Mock 数据）
-        logger.info(f"[Task {task_id}] Running CV model inference...")
-        start_time = time.time()
+        return _diagnose_image(
+            task_id,
+            cache_key,
+            download_time_ms,
+            total_start,
+            crop_type=crop_type,
+            location=location,
+            stream_id=task_id,
+        )
 
-        # Mock: 随机选择一个分类结果
-        mock_results = [
-            {
-                "model_label": "healthy",
-                "confidence": 0.95,
-            },
-            {
-                "model_label": "powdery_mildew",
-                "confidence": 0.87,
-            },
-            {
-                "model_label": "aphid_complex",
-                "confidence": 0.92,
-            },
-            {
-                "model_label": "spider_mite",
-                "confidence": 0.78,
-            },
-            {
-                "model_label": "late_blight",
-                "confidence": 0.85,
-            },
-        ]
+    except Exception as e:
+        total_time = int((time.time() - total_start) * 1000)
+        logger.error(
+            "[Task %s] Diagnosis failed after %dms: %s",
+            task_id, total_time, e,
+            exc_info=True,
+        )
+        # 重新抛出异常，Celery 会标记任务为 FAILURE
+        raise
 
-        mock_result = random.choice(mock_results)
-        inference_time = int((time.time() - start_time) * 1000)
 
-        logger.info(
-            f"[Task {task_id}] Mock inference result: "
-            f"{mock_result['model_label']} (confidence: {mock_result['confidence']})"
+@celery_app.task(name="app.worker.diagnosis_tasks.analyze_images_batch", bind=True)
+def analyze_images_batch(
+    self,
+    image_urls: List[str],
+    crop_type: Optional[str] = None,
+    location: Optional[str] = None,
+):
+    """
+    批量分析多张图片（同一作物/地点的一组图片只占用一个任务）。
+
+    所有图片在一个事件循环中并发下载（共享连接池），随后最多
+    BATCH_DIAGNOSIS_CONCURRENCY 张图片并发执行推理、RAG 查询和报告生成。
+    单张图片失败不影响其他图片；批量诊断不支持提前返回和报告流。
+
+    Args:
+        self: Celery task instance (for bind=True)
+        image_urls: 图片 URL 列表（最多 BATCH_MAX_IMAGES 张）
+        crop_type: 可选的作物类型
+        location: 可选的地理位置
+
+    Returns:
+        与 image_urls 顺序一致的列表：成功为诊断结果字典，失败为 {"error": ...}
+
+    Raises:
+        ValueError: 图片数量超过 BATCH_MAX_IMAGES
+    """
+    task_id = self.request.id
+    if len(image_urls) > BATCH_MAX_IMAGES:
+        raise ValueError(
+            f"Too many images: {len(image_urls)} (maximum: {BATCH_MAX_IMAGES})"
         )
 
-        # 3. 查询 TaxonomyService 获取详细信息
-        taxonomy = get_taxonomy_service()
+    total_start = time.time()
+    logger.info("[Task %s] Starting batch diagnosis for %d images", task_id, len(image_urls))
+
+    # 同一 URL 近期已诊断过的图片无需重新下载
+    results: List[Optional[dict]] = [
+        _cached_result_for_url(f"{task_id}[{index}]", url, crop_type, location, total_start)
+        for index, url in enumerate(image_urls)
+    ]
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    downloads = download_images_batch_sync(
+        [image_urls[index] for index in pending], max_size=10 * 1024 * 1024, timeout=30
+    )
+    download_time_ms = int((time.time() - total_start) * 1000)
+    # 图片只用于计算缓存键，算完即释放整批图片（失败项保留异常对象）
+    outcomes = dict(zip(pending, downloads))
+    del downloads
+    for index in pending:
+        if not isinstance(outcomes[index], Exception):
+            outcomes[index] = _download_cache_key(
+                image_urls[index], outcomes[index], crop_type, location
+            )
+
+    def diagnose(index: int) -> dict:
+        outcome = outcomes[index]
+        if isinstance(outcome, SSRFValidationError):
+            return {"error": f"URL 验证失败: {outcome}"}
+        if isinstance(outcome, Exception):
+            return {"error": f"图片下载失败: {outcome}"}
         try:
-            taxonomy_entry = taxonomy.get_by_model_label(
-                mock_result["model_label"]
+            return _diagnose_image(
+                f"{task_id}[{index}]",
+                outcome,
+                download_time_ms,
+                total_start,
+                crop_type=crop_type,
+                location=location,
             )
         except Exception as e:
-            logger.warning(
-                f"[Task {task_id}] Taxonomy entry not found for "
-                f"{mock_result['model_label']}: {e}"
+            logger.error(
+                "[Task %s] Diagnosis of image %d failed: %s",
+                task_id, index, e,
+                exc_info=True,
             )
-            taxonomy_entry = None
-
-        # 4. 构建诊断结果
-        result = {
-            "model_label": mock_result["model_label"],
-            "confidence": mock_result["confidence"],
-            "inference_time_ms": inference_time,
-            "timings": {
-                "image_download_ms": download_time_ms,
-                "inference_ms": inference_time,
-                "rag_query_ms": None,
-                "llm_report_ms": None,
-            },
-        }
-
-        if taxonomy_entry:
-            result.update({
-                "diagnosis_name": taxonomy_entry.zh_scientific_name,
-                "latin_name": taxonomy_entry.latin_name,
-                "category": taxonomy_entry.category,
-                "action_policy": taxonomy_entry.action_policy,
-                "taxonomy_id": taxonomy_entry.id,
-                "description": taxonomy_entry.description,
-                "risk_level": taxonomy_entry.risk_level,
-            })
-        else:
-            result.update({
-                "diagnosis_name": "未知",
-                "latin_name": "Unknown",
-                "category": "Unknown",
-                "action_policy": "HUMAN_REVIEW",
-                "taxonomy_id": None,
-            })
-
-        # 5. 添加可选参数
-        if crop_type:
-            result["crop_type"] = crop_type
-        if location:
-            result["location"] = location
-
-        # 6. 生成 LLM 报告（如果需要）
-        if taxonomy_entry and taxonomy_entry.action_policy == "RETRIEVE":
-            logger.info(
-                f"[Task {task_id}] Generating report for "
-                f"{result['diagnosis_name']}..."
-            )
-            try:
-                # 查询 RAG 服务获取相关知识
-                rag = get_rag_service()
-                query_text = f"{result.get('crop_type', '作物')} {result['diagnosis_name']}"
-
-                # RAG 查询计时
-                rag_start = time.time()
-                contexts = rag.query(query_text, top_k=3)
-                rag_time = int((time.time() - rag_start) * 1000)
-                result["timings"]["rag_query_ms"] = rag_time
-
-                logger.info(
-                    f"[Task {task_id}] Retrieved {len(contexts)} "
-                    f"documents from RAG in {rag_time}ms"
-                )
-
-                # 生成 LLM 报告
-                llm_start = time.time()
-                report = generate_diagnosis_report(
-                    diagnosis_name=result["diagnosis_name"],
-                    crop_type=result.get("crop_type", "未知"),
-                    confidence=result["confidence"],
-                    contexts=contexts,
-                    timeout=30,
-                )
-                llm_time = int((time.time() - llm_start) * 1000)
-                result["timings"]["llm_report_ms"] = llm_time
-
-                result["report"] = report
-                result["report_error"] = None
-                logger.info(
-                    f"[Task {task_id}] Report generated successfully "
-                    f"({len(report)} chars) in {llm_time}ms"
-                )
-
-            except RAGServiceNotInitializedError as e:
-                logger.warning(f"[Task {task_id}] RAG service not initialized: {str(e)}")
-                result["report"] = None
-                result["report_error"] = f"RAG service not initialized: {str(e)}"
-
-            except (ReportTimeoutError, LLMError) as e:
-                logger.error(f"[Task {task_id}] Report generation failed: {str(e)}")
-                result["report"] = None
-                result["report_error"] = str(e)
-
-            except Exception as e:
-                logger.error(
-                    f"[Task {task_id}] Unexpected error during "
-                    f"report generation: {str(e)}",
-                    exc_info=True,
-                )
-                result["report"] = None
-                result["report_error"] = f"Unexpected error: {str(e)}"
-        else:
-            # 不需要生成报告
-            result["report"] = None
-            result["report_error"] = None
-
-        # 计算总耗时
-        total_time = int((time.time() - total_start) * 1000)
-        result["timings"]["total_ms"] = total_time
-
-        logger.info(
-            f"[Task {task_id}] Diagnosis completed: {result['diagnosis_name']} "
-            f"(total: {total_time}ms)"
-        )
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(
+        max_workers=BATCH_DIAGNOSIS_CONCURRENCY, thread_name_prefix="batch-diagnosis"
+    ) as executor:
+        for index, result in zip(pending, executor.map(diagnose, pending)):
+            results[index] = result
+
+    logger.info(
+        "[Task %s] Batch diagnosis completed: %d/%d succeeded (total: %dms)",
+        task_id,
+        sum("error" not in result for result in results),
+        len(results),
+        int((time.time() - total_start) * 1000),
+    )
+    return results
+
+
+@celery_app.task(name="app.worker.diagnosis_tasks.generate_report", bind=True)
+def generate_report(
+    self,
+    diagnosis_name: str,
+    confidence: float,
+    crop_type: Optional[str] = None,
+    stream_id: Optional[str] = None,
+):
+    """
+    为已完成的诊断生成 LLM 报告（由 analyze_image 在提前返回模式下投递）。
 
-        return result
+    Args:
+        self: Celery task instance (for bind=True)
+        diagnosis_name: 诊断名称
+        confidence: 置信度
+        crop_type: 可选的作物类型
+        stream_id: 诊断任务 ID（报告流按诊断任务 ID 发布）
 
-    except Exception as e:
-        total_time = int((time.time() - total_start) * 1000)
-        logger.error(
-            f"[Task {task_id}] Diagnosis failed after {total_time}ms: {str(e)}",
-            exc_info=True,
-        )
-        # 重新抛出异常，Celery 会标记任务为 FAILURE
-        raise
+    Returns:
+        {"report": ..., "report_error": ..., "timings": {...}}
+    """
+    return _generate_report(
+        self.request.id,
+        diagnosis_name=diagnosis_name,
+        confidence=confidence,
+        crop_type=crop_type,
+        stream_id=stream_id,
+    )
@@ -15,6 +15,12 @@ Exit codes:
 
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+# Buffers output of checks running in worker threads (see run_concurrently)
+_output = threading.local()
 
 
 # ANSI color codes for terminal output
@@ -27,24 +33,33 @@ class Colors:
     RESET = "\033[0m"
 
 
+def emit(line: str) -> None:
+    """Print a line, or buffer it when called from a concurrent check."""
+    lines = getattr(_output, "lines", None)
+    if lines is None:
+        print(line)
+    else:
+        lines.append(line)
+
+
 def print_success(message: str) -> None:
     """Print a success message with green checkmark."""
-    print(f"{Colors.GREEN}✓{Colors.RESET} {message}")
+    emit(f"{Colors.GREEN}✓{Colors.RESET} {message}")
 
 
 def print_error(message: str) -> None:
     """Print an error message with red cross."""
-    print(f"{Colors.RED}✗{Colors.RESET} {message}")
+    emit(f"{Colors.RED}✗{Colors.RESET} {message}")
 
 
 def print_warning(message: str) -> None:
     """Print a warning message with yellow warning sign."""
-    print(f"{Colors.YELLOW}⚠{Colors.RESET} {message}")
+    emit(f"{Colors.YELLOW}⚠{Colors.RESET} {message}")
 
 
 def print_info(message: str) -> None:
     """Print an info message with blue info sign."""
-    print(f"{Colors.BLUE}ℹ{Colors.RESET} {message}")
+    emit(f"{Colors.BLUE}ℹ{Colors.RESET} {message}")
 
 
 def check_python_version() -> bool:
@@ -272,6 +287,41 @@ def check_config_file() -> bool:
     return env_example_exists
 
 
+def run_concurrently(
+    checks: List[Tuple[str, Callable[[], bool]]]
+) -> List[Tuple[str, bool]]:
+    """
+    Run independent checks in parallel threads.
+
+    The network checks each block for up to several seconds on an
+    unreachable service; running them together bounds the total wall time
+    by the slowest check instead of the sum. Each check's output is
+    buffered and printed in the order of the checks list.
+
+    Args:
+        checks: (name, check function) pairs
+
+    Returns:
+        (name, result) pairs in the same order as checks
+    """
+    def run(check: Callable[[], bool]) -> Tuple[bool, List[str]]:
+        _output.lines = []
+        try:
+            return check(), _output.lines
+        finally:
+            _output.lines = None
+
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        outcomes = list(executor.map(run, [check for _, check in checks]))
+
+    results = []
+    for (name, _), (result, lines) in zip(checks, outcomes):
+        for line in lines:
+            print(line)
+        results.append((name, result))
+    return results
+
+
 def main() -> int:
     """
     Run all health checks.
@@ -288,10 +338,13 @@ def main() -> int:
     results.append(("Python Version", check_python_version()))
     results.append(("Project Structure", check_project_structure()))
     results.append(("Config Files", check_config_file()))
-    results.append(("PostgreSQL", check_postgresql()))
-    results.append(("Redis", check_redis()))
-    results.append(("ChromaDB", check_chromadb()))
-    results.append(("OpenAI API", check_openai_api()))
+    # Network checks are independent and run concurrently
+    results.extend(run_concurrently([
+        ("PostgreSQL", check_postgresql),
+        ("Redis", check_redis),
+        ("ChromaDB", check_chromadb),
+        ("OpenAI API", check_openai_api),
+    ]))
 
     # Summary
     print(f"\n{Colors.BOLD}{'='*50}{Colors.RESET}")
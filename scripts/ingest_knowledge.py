@@ -40,9 +40,19 @@ from langchain_community.document_loaders import (
     UnstructuredMarkdownLoader,
 )
 from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.core.cache import SQLiteCache
+from app.services.embeddings import (
+    EMBEDDING_PROVIDER,
+    LOCAL_EMBEDDING_MODEL,
+    BatchingEmbedder,
+)
+from app.services.keyword_vectors import KEYWORD_VECTORS_PATH, KeywordVectors
+from app.services.taxonomy_service import get_taxonomy_service
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -61,6 +71,12 @@ DEFAULT_OVERLAP = 300  # 20% overlap 保持上下文连贯
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIRECTORY", "data/chroma")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # 支持硅基流动等 OpenAI 兼容 API
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# HNSW 索引参数（创建集合时写入，与 app/services/rag_service.py 保持一致）
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "400"))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "50"))
+# RAGService 的持久化查询缓存（知识库变化后需清空，与 app/services/rag_service.py 保持一致）
+RAG_DISK_CACHE_PATH = os.getenv("RAG_DISK_CACHE_PATH", "data/rag_cache.db")
 
 
 def parse_args() -> argparse.Namespace:
@@ -219,7 +235,7 @@ def split_documents(
 
 def embed_texts_concurrent(
     texts: List[str],
-    embeddings: OpenAIEmbeddings,
+    embeddings: Embeddings,
     max_workers: int = 8,
     batch_size: int = 10,
     show_progress: bool = True,
@@ -229,7 +245,7 @@ def embed_texts_concurrent(
 
     Args:
         texts: List of text strings to embed
-        embeddings: OpenAIEmbeddings instance
+        embeddings: Embeddings instance (OpenAI or local)
         max_workers: Maximum number of concurrent threads
         batch_size: Number of texts to process per batch
         show_progress: Whether to show progress logs
@@ -315,10 +331,13 @@ def create_vector_store(
     Returns:
         ChromaDB vector store instance
     """
-    logger.info(f"Initializing OpenAI Embeddings ({OPENAI_EMBEDDING_MODEL})...")
-
+    # 入库与查询必须使用同一个 embedding 模型（见 app/services/embeddings.py）
+    if EMBEDDING_PROVIDER == "local":
+        logger.info(f"Initializing local embeddings ({LOCAL_EMBEDDING_MODEL})...")
+        embeddings = BatchingEmbedder(LOCAL_EMBEDDING_MODEL)
     # 支持硅基流动等 OpenAI 兼容 API
-    if OPENAI_BASE_URL:
+    elif OPENAI_BASE_URL:
+        logger.info(f"Initializing OpenAI Embeddings ({OPENAI_EMBEDDING_MODEL})...")
         logger.info(f"Using custom base URL: {OPENAI_BASE_URL}")
         logger.info(f"Using embedding model: {OPENAI_EMBEDDING_MODEL}")
         embeddings = OpenAIEmbeddings(
@@ -326,6 +345,7 @@ def create_vector_store(
             base_url=OPENAI_BASE_URL,
         )
     else:
+        logger.info(f"Initializing OpenAI Embeddings ({OPENAI_EMBEDDING_MODEL})...")
         embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
 
     # Extract text content from chunks
@@ -356,12 +376,34 @@ def create_vector_store(
         vector_store = Chroma(
             embedding_function=embeddings,
             persist_directory=CHROMA_PERSIST_DIR,
+            collection_metadata={
+                "hnsw:M": CHROMA_HNSW_M,
+                "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF,
+            },
         )
         vector_store.add_texts(texts=texts, embeddings=embedding_vectors, metadatas=metadatas)
 
     return vector_store
 
 
+def build_keyword_vectors(embeddings: Embeddings) -> None:
+    """
+    Precompute int8-quantized query vectors for taxonomy terms.
+
+    RAGService uses them instead of calling the embedding API when a query
+    exactly matches a taxonomy name or search keyword.
+
+    Args:
+        embeddings: The embeddings instance used for ingestion (same model as queries)
+    """
+    terms = get_taxonomy_service().get_query_terms()
+    model = LOCAL_EMBEDDING_MODEL if EMBEDDING_PROVIDER == "local" else OPENAI_EMBEDDING_MODEL
+    vectors = KeywordVectors.build(terms, embeddings, model=model)
+    vectors.save(KEYWORD_VECTORS_PATH)
+    logger.info(f"Saved {len(vectors)} keyword vectors to {KEYWORD_VECTORS_PATH}")
+
+
 def main() -> None:
     """Main ingestion workflow."""
     args = parse_args()
@@ -403,7 +445,7 @@ def main() -> None:
         logger.info("Step 5: Creating ChromaDB vector store...")
         logger.info(f"Using {args.max_workers} concurrent workers for embeddings...")
         logger.info("(This may take a few minutes for large document sets...)")
-        create_vector_store(
+        vector_store = create_vector_store(
             chunks,
             append=args.append,
             max_workers=args.max_workers,
@@ -411,6 +453,16 @@ def main() -> None:
         )
         print()
 
+        if KEYWORD_VECTORS_PATH:
+            logger.info("Precomputing taxonomy keyword vectors...")
+            build_keyword_vectors(vector_store.embeddings)
+            print()
+
+        # 知识库已变化，旧的检索结果缓存失效
+        if RAG_DISK_CACHE_PATH and Path(RAG_DISK_CACHE_PATH).exists():
+            SQLiteCache(RAG_DISK_CACHE_PATH).clear()
+            logger.info(f"Cleared RAG query cache: {RAG_DISK_CACHE_PATH}")
+
         # Step 6: Summary
         elapsed_time = time.time() - start_time
         logger.info("=" * 60)
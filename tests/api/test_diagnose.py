@@ -5,8 +5,10 @@ Tests cover normal operations and extreme conditions.
 """
 
 import pytest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from app.api.main import app
+from app.api.endpoints.diagnose import _task_status_cache
 
 client = TestClient(app)
 
@@ -157,10 +159,13 @@ def test_get_task_status_not_found():
 
 def test_get_task_status_invalid_id():
     """极端条件：无效的任务 ID 格式"""
-    response = client.get("/api/v1/diagnose/tasks/invalid-uuid")
+    with patch("app.api.endpoints.diagnose._get_task_meta") as mock_meta:
+        response = client.get("/api/v1/diagnose/tasks/invalid-uuid")
 
-    # 可能返回 400 或 422
-    assert response.status_code in [200, 400, 422]
+    # 格式非法的 ID 直接返回 400，不查询结果后端
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid task_id"
+    mock_meta.assert_not_called()
 
 
 def test_get_task_status_empty_id():
@@ -321,3 +326,89 @@ def test_xss_in_location():
 
     # 应该正常接受并转义
     assert response.status_code == 200
+
+
+def test_get_task_status_uses_cache_for_finished_task():
+    """测试已完成任务的状态被缓存，重复轮询不再查询结果后端"""
+    task_id = "11111111-2222-3333-4444-555555555555"
+    _task_status_cache.clear()
+
+    meta = {"status": "FAILURE", "result": RuntimeError("图片下载失败"), "traceback": None}
+
+    with patch("app.api.endpoints.diagnose._get_task_meta", return_value=meta) as mock_meta:
+        response1 = client.get(f"/api/v1/diagnose/tasks/{task_id}")
+        response2 = client.get(f"/api/v1/diagnose/tasks/{task_id}")
+
+    assert response1.status_code == 200
+    assert response2.json() == response1.json()
+    assert response1.json()["error"] == "图片下载失败"
+    assert mock_meta.call_count == 1
+
+    _task_status_cache.clear()
+
+
+def test_get_task_status_merges_async_report():
+    """测试报告异步生成时，状态查询合并报告任务的结果"""
+    task_id = "22222222-3333-4444-5555-666666666666"
+    report_task_id = "33333333-4444-5555-6666-777777777777"
+    _task_status_cache.clear()
+
+    diagnosis = {
+        "model_label": "late_blight",
+        "confidence": 0.85,
+        "diagnosis_name": "番茄晚疫病",
+        "category": "Disease",
+        "action_policy": "RETRIEVE",
+        "inference_time_ms": 1,
+        "report": None,
+        "report_error": None,
+        "report_task_id": report_task_id,
+        "report_status": "PENDING",
+    }
+    metas = {
+        task_id: {"status": "SUCCESS", "result": diagnosis},
+        report_task_id: {"status": "PENDING", "result": None},
+    }
+
+    with patch("app.api.endpoints.diagnose._get_task_meta", side_effect=metas.get):
+        pending = client.get(f"/api/v1/diagnose/tasks/{task_id}").json()
+        metas[report_task_id] = {
+            "status": "SUCCESS",
+            "result": {"report": "# 报告", "report_error": None, "timings": {}},
+        }
+        # 报告生成中的结果只短暂缓存
+        _task_status_cache.clear()
+        ready = client.get(f"/api/v1/diagnose/tasks/{task_id}").json()
+
+    assert pending["status"] == "SUCCESS"
+    assert pending["result"]["report_status"] == "PENDING"
+    assert pending["result"]["report"] is None
+    assert ready["result"]["report_status"] == "READY"
+    assert ready["result"]["report"] == "# 报告"
+
+    _task_status_cache.clear()
+
+
+def test_stream_task_report_disabled():
+    """测试未开启报告流时返回 404"""
+    response = client.get("/api/v1/diagnose/tasks/22222222-3333-4444-5555-666666666666/stream")
+
+    assert response.status_code == 404
+
+
+def test_stream_task_report_sse():
+    """测试报告片段以 SSE 事件转发，多行片段拆成多个 data 行"""
+    from app.core.config import SETTINGS
+
+    async def fake_stream(task_id):
+        yield "chunk", "# 报告\n正文"
+        yield "end", ""
+
+    streaming_settings = SETTINGS.model_copy(update={"report_streaming": True})
+    with patch("app.api.endpoints.diagnose.SETTINGS", streaming_settings), \
+            patch("app.api.endpoints.diagnose.iter_report_stream", fake_stream):
+        response = client.get("/api/v1/diagnose/tasks/22222222-3333-4444-5555-666666666666/stream")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == "event: chunk\ndata: # 报告\ndata: 正文\n\nevent: end\ndata: \n\n"
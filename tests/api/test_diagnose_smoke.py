@@ -12,12 +12,11 @@ client = TestClient(app)
 
 def test_create_diagnosis_task_smoke():
     """冒烟测试：创建诊断任务"""
-    with patch('app.worker.diagnosis_tasks.analyze_image') as mock_analyze:
+    with patch('app.worker.celery_app.celery_app.send_task') as mock_send_task:
         # Mock Celery task
         mock_task = Mock()
         mock_task.id = "test-task-123"
-        mock_task.state = "PENDING"
-        mock_analyze.delay.return_value = mock_task
+        mock_send_task.return_value = mock_task
 
         request_data = {
             "image_url": "http://localhost:9010/smart-agriculture/test.jpg"
@@ -31,21 +30,24 @@ def test_create_diagnosis_task_smoke():
         assert data["task_id"] == "test-task-123"
         assert data["status"] == "PENDING"
 
+        # 按任务名直接投递
+        args, kwargs = mock_send_task.call_args
+        assert args[0] == "app.worker.diagnosis_tasks.analyze_image"
+        assert kwargs["kwargs"]["image_url"] == request_data["image_url"]
+
 
 def test_get_task_status_smoke():
     """冒烟测试：查询任务状态"""
-    with patch('celery.result.AsyncResult') as mock_result:
-        # Mock AsyncResult
-        mock_result_instance = Mock()
-        mock_result_instance.state = "PENDING"
-        mock_result_instance.result = None
-        mock_result.return_value = mock_result_instance
+    with patch('app.api.endpoints.diagnose._get_task_meta') as mock_meta:
+        # Mock 结果后端返回的任务元数据
+        mock_meta.return_value = {"status": "PENDING", "result": None, "traceback": None}
 
-        response = client.get("/api/v1/diagnose/tasks/test-task-123")
+        task_id = "a1b2c3d4-5678-90ab-cdef-123456789abc"
+        response = client.get(f"/api/v1/diagnose/tasks/{task_id}")
 
         assert response.status_code == 200
         data = response.json()
-        assert data["task_id"] == "test-task-123"
+        assert data["task_id"] == task_id
         assert data["status"] == "PENDING"
 
 
@@ -91,3 +91,43 @@ def test_search_returns_single_result():
     data = response.json()
     assert len(data) == 1
     assert data[0]["model_label"] == "spider_mite"
+
+
+def test_search_taxonomy_by_prefix():
+    """测试前缀搜索（以 * 结尾）"""
+    response = client.get("/api/v1/taxonomy/search?q=aphid*")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["model_label"] == "aphid_complex"
+
+
+def test_response_is_utf8_json():
+    """测试响应使用 UTF-8 原样输出中文（orjson 默认响应类）"""
+    response = client.get("/api/v1/taxonomy/2")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert "白粉病".encode("utf-8") in response.content
+
+
+def test_cors_preflight_allowed_origin():
+    """测试允许的来源可以通过 CORS 预检，且预检结果可被浏览器缓存"""
+    response = client.options(
+        "/api/v1/taxonomy/search",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "GET",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+    assert response.headers["access-control-max-age"] == "86400"
+
+
+def test_cors_rejects_unknown_origin():
+    """测试未配置的来源不会获得 CORS 授权"""
+    response = client.get(
+        "/api/v1/taxonomy/1", headers={"Origin": "http://evil.example.com"}
+    )
+    assert response.status_code == 200
+    assert "access-control-allow-origin" not in response.headers
@@ -8,11 +8,24 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
 from app.api.main import app
+from app.api.endpoints.upload import MAX_FILE_SIZE, MAX_REQUEST_SIZE, UPLOAD_CHUNK_SIZE
+from app.core import depends_storage
 from io import BytesIO
 
 client = TestClient(app)
 
 
+@pytest.fixture
+def mock_storage():
+    """用 Mock 替换 StorageService 依赖（无需真实 MinIO）"""
+    storage = Mock()
+    storage.object_exists.return_value = False
+    storage.upload_image.return_value = "http://localhost:9010/smart-agriculture/test.jpg"
+    app.dependency_overrides[depends_storage] = lambda: storage
+    yield storage
+    app.dependency_overrides.pop(depends_storage, None)
+
+
 def test_upload_image_success():
     """测试成功上传图片"""
     with patch('app.api.endpoints.upload.StorageService') as mock_storage_class:
@@ -83,7 +96,7 @@ def test_upload_oversized_file():
 
     response = client.post("/api/v1/upload", files=files)
 
-    assert response.status_code == 400
+    assert response.status_code == 413
     assert "File too large" in response.json()["detail"]
 
 
@@ -149,7 +162,8 @@ def test_upload_unicode_filename():
 
     assert response.status_code == 200
     data = response.json()
-    assert "中文文件名.jpg" in data["filename"]
+    assert data["original_filename"] == "中文文件名.jpg"
+    assert data["filename"].endswith(".jpg")
 
 
 def test_upload_very_long_filename():
@@ -179,11 +193,12 @@ def test_upload_special_characters_filename():
 
         assert response.status_code == 200
         data = response.json()
-        assert special_name in data["filename"]
+        assert data["original_filename"] == special_name
+        assert data["filename"].endswith(".jpg")
 
 
 def test_upload_multiple_files_same_name():
-    """极端条件：连续上传同名文件"""
+    """极端条件：连续上传同名同内容文件"""
     files = {"file": ("test.jpg", BytesIO(b"fake image 1"), "image/jpeg")}
 
     response1 = client.post("/api/v1/upload", files=files)
@@ -192,10 +207,11 @@ def test_upload_multiple_files_same_name():
     assert response1.status_code == 200
     assert response2.status_code == 200
 
-    # 验证文件名不同（UUID 前缀）
+    # 相同内容得到相同的对象键（内容哈希），第二次复用已有对象
     data1 = response1.json()
     data2 = response2.json()
-    assert data1["filename"] != data2["filename"]
+    assert data1["filename"] == data2["filename"]
+    assert data1["url"] == data2["url"]
 
 
 def test_upload_concurrent_requests():
@@ -228,4 +244,107 @@ def test_upload_no_extension():
 
     assert response.status_code == 200
     data = response.json()
-    assert "noextension" in data["filename"]
+    assert data["original_filename"] == "noextension"
+    assert data["filename"].endswith(".jpg")
+
+
+def test_upload_streams_file_to_storage(mock_storage):
+    """测试上传内容以文件流形式交给 StorageService（不再整体读入内存）"""
+    image_content = b"x" * (UPLOAD_CHUNK_SIZE * 2 + 123)
+    files = {"file": ("stream.jpg", BytesIO(image_content), "image/jpeg")}
+
+    response = client.post("/api/v1/upload", files=files)
+
+    assert response.status_code == 200
+    mock_storage.upload_image.assert_called_once()
+    file_data = mock_storage.upload_image.call_args[0][0]
+    assert not isinstance(file_data, bytes)
+    assert mock_storage.upload_image.call_args.kwargs["length"] == len(image_content)
+
+
+def test_upload_oversized_file_skips_storage(mock_storage):
+    """极端条件：超限文件在上传 MinIO 前被拒绝"""
+    large_content = b"x" * (MAX_FILE_SIZE + 1)
+    files = {"file": ("large.jpg", BytesIO(large_content), "image/jpeg")}
+
+    response = client.post("/api/v1/upload", files=files)
+
+    assert response.status_code == 413
+    mock_storage.upload_image.assert_not_called()
+
+
+def test_upload_stores_original_filename_as_metadata(mock_storage):
+    """测试对象键不含原始文件名，原始文件名以 URL 编码形式存入元数据"""
+    files = {"file": ("中文 照片.PNG", BytesIO(b"fake image"), "image/png")}
+
+    response = client.post("/api/v1/upload", files=files)
+
+    assert response.status_code == 200
+    object_name = mock_storage.upload_image.call_args[0][1]
+    stem, _, extension = object_name.partition(".")
+    assert len(stem) == 32 and extension == "png"
+    metadata = mock_storage.upload_image.call_args.kwargs["metadata"]
+    assert metadata == {"original-filename": "%E4%B8%AD%E6%96%87%20%E7%85%A7%E7%89%87.PNG"}
+    assert response.json()["original_filename"] == "中文 照片.PNG"
+
+
+def test_upload_rejects_large_content_length_before_reading_body(mock_storage):
+    """极端条件：Content-Length 超过上限时在解析请求体前直接返回 413"""
+    large_content = b"x" * (MAX_REQUEST_SIZE + 1)
+    files = {"file": ("large.jpg", BytesIO(large_content), "image/jpeg")}
+
+    response = client.post("/api/v1/upload", files=files)
+
+    assert response.status_code == 413
+    assert "too large" in response.json()["detail"]
+    mock_storage.upload_image.assert_not_called()
+
+
+def test_upload_uses_content_hash_as_object_key(mock_storage):
+    """测试对象键由文件内容决定：同名不同内容得到不同键"""
+    files1 = {"file": ("a.jpg", BytesIO(b"image 1"), "image/jpeg")}
+    files2 = {"file": ("a.jpg", BytesIO(b"image 2"), "image/jpeg")}
+    files3 = {"file": ("b.jpg", BytesIO(b"image 1"), "image/jpeg")}
+
+    response1 = client.post("/api/v1/upload", files=files1)
+    response2 = client.post("/api/v1/upload", files=files2)
+    response3 = client.post("/api/v1/upload", files=files3)
+
+    keys = [call.args[1] for call in mock_storage.upload_image.call_args_list]
+    assert response1.status_code == response2.status_code == response3.status_code == 200
+    assert keys[0] != keys[1]
+    assert keys[0] == keys[2]
+
+
+def test_upload_skips_put_when_object_exists(mock_storage):
+    """测试相同内容已存在时跳过上传，直接返回已有 URL"""
+    mock_storage.object_exists.return_value = True
+    existing_url = "http://localhost:9010/smart-agriculture/existing.jpg"
+    mock_storage.get_public_url.return_value = existing_url
+    files = {"file": ("dup.jpg", BytesIO(b"same image"), "image/jpeg")}
+
+    response = client.post("/api/v1/upload", files=files)
+
+    assert response.status_code == 200
+    assert response.json()["url"] == existing_url
+    mock_storage.upload_image.assert_not_called()
+
+
+def test_upload_storage_unavailable_returns_503():
+    """极端条件：MinIO 不可达（依赖初始化时连接被拒绝）时返回 503，且不泄露内部错误信息"""
+    from app.core.config import SETTINGS
+    from app.services import storage
+
+    saved = storage.StorageService._instance, storage._storage_service
+    storage.StorageService._instance, storage._storage_service = None, None
+    # 没有服务监听的端口：依赖初始化走真实的连接失败路径（urllib3 MaxRetryError）
+    settings = SETTINGS.model_copy(update={"minio_endpoint": "127.0.0.1:9"})
+    try:
+        with patch("app.services.storage.get_settings", return_value=settings):
+            files = {"file": ("test.jpg", BytesIO(b"fake image"), "image/jpeg")}
+            response = client.post("/api/v1/upload", files=files)
+    finally:
+        storage.StorageService._instance, storage._storage_service = saved
+
+    assert response.status_code == 503
+    assert response.json() == {"error": "Service unavailable"}
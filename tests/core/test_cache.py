@@ -0,0 +1,157 @@
+"""
+Unit tests for the in-process TTL cache.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.core.cache import SQLiteCache, TTLCache
+
+
+class TestTTLCache:
+    """Tests for TTLCache."""
+
+    def test_get_returns_cached_value(self):
+        """测试命中缓存返回已存储的值."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("key", "value")
+
+        assert cache.get("key") == "value"
+        assert len(cache) == 1
+
+    def test_get_missing_returns_default(self):
+        """测试未命中时返回默认值."""
+        cache = TTLCache(maxsize=10, ttl=60)
+
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+
+    def test_entry_expires_after_ttl(self):
+        """测试条目超过 TTL 后失效."""
+        cache = TTLCache(maxsize=10, ttl=1)
+
+        with patch("app.core.cache.time.monotonic", return_value=100.0):
+            cache.set("key", "value")
+        with patch("app.core.cache.time.monotonic", return_value=100.5):
+            assert cache.get("key") == "value"
+        with patch("app.core.cache.time.monotonic", return_value=101.0):
+            assert cache.get("key") is None
+
+        assert len(cache) == 0
+
+    def test_per_entry_ttl_overrides_default(self):
+        """测试单个条目的 TTL 覆盖默认 TTL."""
+        cache = TTLCache(maxsize=10, ttl=1)
+
+        with patch("app.core.cache.time.monotonic", return_value=100.0):
+            cache.set("short", 1)
+            cache.set("long", 2, ttl=300)
+        with patch("app.core.cache.time.monotonic", return_value=200.0):
+            assert cache.get("short") is None
+            assert cache.get("long") == 2
+
+    def test_evicts_least_recently_used(self):
+        """测试超过容量时淘汰最久未使用的条目."""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # a 变为最近使用
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_pop_and_clear(self):
+        """测试 pop 与 clear."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        assert cache.pop("a") == 1
+        assert cache.pop("a", "gone") == "gone"
+
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_invalid_maxsize(self):
+        """测试非法容量."""
+        with pytest.raises(ValueError):
+            TTLCache(maxsize=0)
+
+
+class TestSQLiteCache:
+    """Tests for SQLiteCache."""
+
+    def test_get_returns_cached_value(self, tmp_path):
+        """测试命中缓存返回已存储的值，且重新打开文件后仍然存在."""
+        path = str(tmp_path / "cache.db")
+        cache = SQLiteCache(path, maxsize=10, ttl=60)
+        cache.set("key", b"value")
+        cache.close()
+
+        reopened = SQLiteCache(path, maxsize=10, ttl=60)
+        assert reopened.get("key") == b"value"
+        assert reopened.get("missing") is None
+        assert len(reopened) == 1
+
+    def test_entry_expires_after_ttl(self, tmp_path):
+        """测试条目超过 TTL 后失效."""
+        cache = SQLiteCache(str(tmp_path / "cache.db"), maxsize=10, ttl=1)
+
+        with patch("app.core.cache.time.time", return_value=100.0):
+            cache.set("key", b"value")
+        with patch("app.core.cache.time.time", return_value=100.5):
+            assert cache.get("key") == b"value"
+        with patch("app.core.cache.time.time", return_value=101.0):
+            assert cache.get("key") is None
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """测试超过容量时淘汰最久未使用的条目."""
+        cache = SQLiteCache(str(tmp_path / "cache.db"), maxsize=2, ttl=60)
+
+        with patch("app.core.cache.time.time", return_value=100.0):
+            cache.set("a", b"1")
+        with patch("app.core.cache.time.time", return_value=101.0):
+            cache.set("b", b"2")
+        with patch("app.core.cache.time.time", return_value=102.0):
+            cache.get("a")  # a 变为最近使用
+        with patch("app.core.cache.time.time", return_value=103.0):
+            cache.set("c", b"3")
+            assert cache.get("a") == b"1"
+            assert cache.get("b") is None
+            assert cache.get("c") == b"3"
+
+    def test_clear(self, tmp_path):
+        """测试 clear."""
+        cache = SQLiteCache(str(tmp_path / "cache.db"), maxsize=10, ttl=60)
+        cache.set("a", b"1")
+        cache.clear()
+
+        assert len(cache) == 0
+
+    def test_storage_errors_are_misses(self, tmp_path):
+        """测试数据库不可用时读写降级为未命中，不抛异常."""
+        # 路径是目录，无法作为 SQLite 文件打开
+        cache = SQLiteCache(str(tmp_path), maxsize=10, ttl=60)
+
+        cache.set("a", b"1")
+        assert cache.get("a") is None
+
+    def test_unwritable_directory_is_a_miss(self, tmp_path):
+        """测试缓存目录无法创建（OSError）时同样降级为未命中，不抛异常."""
+        blocker = tmp_path / "blocker"
+        blocker.write_bytes(b"")
+        # 父路径是普通文件，os.makedirs 抛出 NotADirectoryError
+        cache = SQLiteCache(str(blocker / "data" / "cache.db"), maxsize=10, ttl=60)
+
+        cache.set("a", b"1")
+        cache.clear()
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_invalid_maxsize(self, tmp_path):
+        """测试非法容量."""
+        with pytest.raises(ValueError):
+            SQLiteCache(str(tmp_path / "cache.db"), maxsize=0)
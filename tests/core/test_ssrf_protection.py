@@ -13,11 +13,20 @@ from app.core.ssrf_protection import (
     ALLOWED_IMAGE_TYPES,
     ImageDownloadError,
     SSRFValidationError,
+    _dns_cache,
     download_image_securely,
     validate_image_url,
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_dns_cache():
+    """每个测试使用独立的 DNS 缓存（测试中 mock 的解析结果互不影响）."""
+    _dns_cache.clear()
+    yield
+    _dns_cache.clear()
+
+
 class TestValidateImageUrl:
     """Tests for validate_image_url function."""
 
@@ -222,6 +231,35 @@ class TestValidateImageUrl:
 
             assert "禁止访问私有地址" in str(exc_info.value)
 
+    def test_validate_non_strict_picks_first_public_ip(self):
+        """测试非严格模式跳过内网 IP，找到第一个公网 IP 后不再检查其余记录."""
+        from app.core.ssrf_protection import _ip_to_int
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [
+                (2, 1, 6, "", ("192.168.1.1", 0)),   # 私有（跳过）
+                (2, 1, 6, "", ("93.184.216.34", 0)),  # 公网（选中）
+                (2, 1, 6, "", ("93.184.216.35", 0)),
+                (2, 1, 6, "", ("10.0.0.1", 0)),
+            ]
+
+            with patch("app.core.ssrf_protection._ip_to_int", wraps=_ip_to_int) as mock_to_int:
+                ip, _ = validate_image_url("https://cdn.example.com/image.jpg", strict=False)
+
+        assert ip == "93.184.216.34"
+        assert mock_to_int.call_count == 2
+
+    def test_validate_non_strict_all_private_rejected(self):
+        """测试非严格模式下所有 IP 都是内网地址时仍拒绝."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [
+                (2, 1, 6, "", ("192.168.1.1", 0)),
+                (2, 1, 6, "", ("10.0.0.1", 0)),
+            ]
+
+            with pytest.raises(SSRFValidationError, match="所有 IP 地址"):
+                validate_image_url("https://internal.example.com/image.jpg", strict=False)
+
     def test_validate_ipv6_address(self):
         """测试 IPv6 公网地址验证."""
         with patch("socket.getaddrinfo") as mock_getaddrinfo:
@@ -247,6 +285,274 @@ class TestValidateImageUrl:
 
         assert "私有地址" in str(exc_info.value)
 
+    @pytest.mark.parametrize(
+        "host",
+        [
+            "100.64.0.1",  # CGNAT
+            "198.18.0.1",  # 基准测试网段
+            "224.0.0.1",  # 多播
+            "240.0.0.1",  # 保留
+            "[fd00::1]",  # IPv6 ULA
+            "[fe80::1]",  # IPv6 链路本地
+            "[::ffff:127.0.0.1]",  # IPv4 映射
+            "[2001:db8::1]",  # 文档网段
+        ],
+    )
+    def test_validate_blocks_reserved_literals_before_dns(self, host):
+        """测试保留/内网 IP 字面量在 DNS 解析前即被拒绝."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            with pytest.raises(SSRFValidationError):
+                validate_image_url(f"http://{host}/image.jpg")
+
+            mock_getaddrinfo.assert_not_called()
+
+    def test_validate_localhost_subdomain_blocked(self):
+        """测试阻止 *.localhost."""
+        with pytest.raises(SSRFValidationError) as exc_info:
+            validate_image_url("http://api.localhost/image.jpg")
+
+        assert "localhost/回环地址" in str(exc_info.value)
+
+    @pytest.mark.parametrize(
+        "resolved_ip",
+        [
+            "100.64.1.1",  # CGNAT
+            "192.0.2.10",  # TEST-NET-1
+            "198.51.100.7",  # TEST-NET-2
+            "192.88.99.1",  # 6to4 中继
+            "255.255.255.255",  # 广播
+            "64:ff9b::a00:1",  # NAT64（内嵌 10.0.0.1）
+            "2001::1",  # Teredo
+            "::ffff:10.0.0.1",  # IPv4 映射
+            "4000::1",  # 2000::/3 之外的未分配空间
+        ],
+    )
+    def test_validate_blocks_special_purpose_resolved_ips(self, resolved_ip):
+        """测试域名解析到特殊用途网段时被拒绝."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(10, 1, 6, "", (resolved_ip, 0))]
+
+            with pytest.raises(SSRFValidationError, match="禁止访问"):
+                validate_image_url("https://special.example.com/image.jpg")
+
+    def test_validate_allows_public_ipv6(self):
+        """测试全球单播 IPv6 地址允许访问."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [
+                (10, 1, 6, "", ("2606:2800:220:1:248:1893:25c8:1946", 0, 0, 0))
+            ]
+
+            ip, _ = validate_image_url("https://example.com/image.jpg")
+
+        assert ip == "2606:2800:220:1:248:1893:25c8:1946"
+
+    def test_ip_to_int(self):
+        """测试 IP 字符串转整数（IPv4 严格解析，IPv6 支持 scope）."""
+        from app.core.ssrf_protection import _ip_to_int
+
+        assert _ip_to_int("93.184.216.34") == (4, 0x5DB8D822)
+        assert _ip_to_int("::1") == (6, 1)
+        assert _ip_to_int("fe80::1%eth0") == (6, int("fe800000000000000000000000000001", 16))
+        assert _ip_to_int("127.1") is None
+        assert _ip_to_int("not-an-ip") is None
+
+    def test_overlapping_forbidden_networks_rejected(self):
+        """测试禁止网段表不允许重叠（bisect 查找要求区间互不相交）."""
+        from app.core.ssrf_protection import _build_range_table
+
+        with pytest.raises(ValueError):
+            _build_range_table((("10.0.0.0/8", "a"), ("10.1.0.0/16", "b")))
+
+
+class TestDNSCache:
+    """测试 DNS 解析缓存."""
+
+    def test_repeated_validation_resolves_once(self):
+        """测试同一主机名在 TTL 内只解析一次."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+            validate_image_url("https://example.com/a.jpg")
+            ip, hostname = validate_image_url("https://example.com/b.jpg")
+
+            assert ip == "93.184.216.34"
+            assert mock_getaddrinfo.call_count == 1
+
+    def test_resolution_requests_tcp_records_only(self):
+        """测试 DNS 查询只请求 TCP 记录（避免按 socktype/proto 重复返回）."""
+        import socket
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+            validate_image_url("https://example.com/a.jpg")
+
+        kwargs = mock_getaddrinfo.call_args[1]
+        assert kwargs["type"] == socket.SOCK_STREAM
+        assert kwargs["proto"] == socket.IPPROTO_TCP
+
+    def test_cached_ips_are_rechecked(self):
+        """测试缓存命中时仍会重新执行内网地址检查."""
+        _dns_cache.set("rebind.example.com", ["10.0.0.1"])
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            with pytest.raises(SSRFValidationError):
+                validate_image_url("https://rebind.example.com/a.jpg")
+
+            mock_getaddrinfo.assert_not_called()
+
+    def test_resolution_failure_not_cached(self):
+        """测试解析失败不会被缓存."""
+        import socket
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.side_effect = socket.gaierror("Name or service not known")
+            with pytest.raises(SSRFValidationError):
+                validate_image_url("https://flaky.example.com/a.jpg")
+
+            mock_getaddrinfo.side_effect = None
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("93.184.216.34", 0))]
+            ip, _ = validate_image_url("https://flaky.example.com/a.jpg")
+
+            assert ip == "93.184.216.34"
+            assert mock_getaddrinfo.call_count == 2
+
+
+    def test_ip_literal_skips_dns(self):
+        """测试 IP 字面量主机名不触发 DNS 查询，且不写入缓存."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            ip, hostname = validate_image_url("https://93.184.216.34/a.jpg")
+            ip6, _ = validate_image_url("https://[2606:2800:220:1:248:1893:25c8:1946]/a.jpg")
+
+            assert ip == "93.184.216.34"
+            assert hostname == "93.184.216.34"
+            assert ip6 == "2606:2800:220:1:248:1893:25c8:1946"
+            mock_getaddrinfo.assert_not_called()
+            assert len(_dns_cache) == 0
+
+    def test_private_ip_literal_still_blocked(self):
+        """测试跳过 DNS 的私有 IP 字面量仍被拒绝."""
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            with pytest.raises(SSRFValidationError):
+                validate_image_url("http://[fd00::1]/a.jpg")
+
+            mock_getaddrinfo.assert_not_called()
+
+class TestValidateImageUrlAsync:
+    """Tests for validate_image_url_async and DNS timeouts."""
+
+    def test_validate_async_public_url_success(self):
+        """测试异步验证公网 URL 成功."""
+        import asyncio
+
+        from app.core.ssrf_protection import validate_image_url_async
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+            ip, hostname = asyncio.run(
+                validate_image_url_async("https://example.com/image.jpg")
+            )
+
+        assert ip == "93.184.216.34"
+        assert hostname == "example.com"
+
+    def test_validate_async_private_ip_blocked(self):
+        """测试异步验证阻止解析到私有地址的域名."""
+        import asyncio
+
+        from app.core.ssrf_protection import validate_image_url_async
+
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("192.168.1.1", 0))]
+
+            with pytest.raises(SSRFValidationError):
+                asyncio.run(validate_image_url_async("https://internal.example.com/a.jpg"))
+
+    def test_validate_sync_dns_deadline(self):
+        """测试同步路径 DNS 查询超过单次超时时间."""
+        import time
+
+        def slow_getaddrinfo(*args, **kwargs):
+            time.sleep(0.5)
+            return [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+        with patch("socket.getaddrinfo", side_effect=slow_getaddrinfo), \
+                patch("app.core.ssrf_protection.DNS_TIMEOUT", 0.05):
+            with pytest.raises(SSRFValidationError) as exc_info:
+                validate_image_url("https://slow.example.com/a.jpg")
+
+        assert "DNS 查询超时" in str(exc_info.value)
+
+    def test_hanging_lookups_do_not_starve_healthy_hosts(self):
+        """测试多个挂起的 DNS 查询（黑洞域名）不会让正常域名的查询排队超时."""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        release = threading.Event()
+
+        def getaddrinfo(host, *args, **kwargs):
+            if host.startswith("blackhole"):
+                release.wait(5)
+            return [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+        hung_hosts = [f"https://blackhole{i}.example.com/a.jpg" for i in range(8)]
+        try:
+            with patch("socket.getaddrinfo", side_effect=getaddrinfo), \
+                    patch("app.core.ssrf_protection.DNS_TIMEOUT", 0.2):
+                with ThreadPoolExecutor(max_workers=len(hung_hosts)) as callers:
+                    hung = [callers.submit(validate_image_url, url) for url in hung_hosts]
+                    for future in hung:
+                        with pytest.raises(SSRFValidationError, match="DNS 查询超时"):
+                            future.result()
+
+                # 挂起的查询仍占用线程，正常域名的查询不受影响
+                ip, _ = validate_image_url("https://healthy.example.com/a.jpg")
+        finally:
+            release.set()
+
+        assert ip == "93.184.216.34"
+
+    def test_dns_timeout_cancels_queued_lookup(self):
+        """测试仍在排队的 DNS 查询超时后被取消，不再占用线程执行."""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        release = threading.Event()
+        started = []
+
+        def getaddrinfo(host, *args, **kwargs):
+            started.append(host)
+            release.wait(5)
+            return [(2, 1, 6, "", ("93.184.216.34", 0))]
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            with patch("socket.getaddrinfo", side_effect=getaddrinfo), \
+                    patch("app.core.ssrf_protection._dns_executor", executor), \
+                    patch("app.core.ssrf_protection.DNS_TIMEOUT", 0.1):
+                for host in ("first", "queued"):
+                    with pytest.raises(SSRFValidationError):
+                        validate_image_url(f"https://{host}.example.com/a.jpg")
+                release.set()
+                executor.shutdown(wait=True)
+        finally:
+            release.set()
+
+        assert started == ["first.example.com"]
+
+    def test_validate_does_not_touch_default_socket_timeout(self):
+        """测试验证过程不修改进程级 socket 默认超时."""
+        import socket
+
+        socket.setdefaulttimeout(None)
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [(2, 1, 6, "", ("93.184.216.34", 0))]
+            with patch("socket.setdefaulttimeout") as mock_setdefaulttimeout:
+                validate_image_url("https://example.com/image.jpg")
+
+        mock_setdefaulttimeout.assert_not_called()
+
 
 class TestDownloadImageSecurely:
     """Tests for download_image_securely function."""
@@ -286,6 +592,42 @@ class TestDownloadImageSecurely:
         headers = call_args[1]["headers"]
         assert headers["Host"] == "example.com"
 
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_download_content_length_underreported(self, mock_validate, mock_get_session):
+        """测试 Content-Length 少报时仍返回完整数据（预分配缓冲区自动扩展）."""
+        mock_validate.return_value = ("93.184.216.34", "example.com")
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "image/png", "Content-Length": "4"}
+        mock_response.iter_content = lambda chunk_size: [b"abc", b"defgh", b"ij"]
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        image_data = download_image_securely("https://example.com/photo.png")
+
+        assert image_data == b"abcdefghij"
+        assert type(image_data) is bytes
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    def test_download_parses_url_once(self, mock_get_session):
+        """测试下载流程只解析一次 URL（验证与重建目标 URL 共用解析结果）."""
+        from urllib.parse import urlparse
+
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.iter_content = lambda chunk_size: [b"data"]
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        with patch("app.core.ssrf_protection.urlparse", wraps=urlparse) as mock_urlparse:
+            download_image_securely("https://93.184.216.34/photo.jpg")
+
+        assert mock_urlparse.call_count == 1
+
     @patch("app.core.ssrf_protection._get_http_session")
     @patch("app.core.ssrf_protection.validate_image_url")
     def test_download_blocks_non_image_content_type(self, mock_validate, mock_get_session):
@@ -331,6 +673,23 @@ class TestDownloadImageSecurely:
 
         assert "文件过大" in str(exc_info.value)
 
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_download_checks_content_length_before_content_type(
+        self, mock_validate, mock_get_session
+    ):
+        """测试 Content-Length 超限时先于 Content-Type 检查被拒绝."""
+        mock_validate.return_value = ("93.184.216.34", "example.com")
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "text/html", "Content-Length": "999999999"}
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        with pytest.raises(ImageDownloadError, match="文件过大"):
+            download_image_securely("https://example.com/page")
+
     @patch("app.core.ssrf_protection._get_http_session")
     @patch("app.core.ssrf_protection.validate_image_url")
     def test_download_enforces_size_limit_during_stream(self, mock_validate, mock_get_session):
@@ -481,10 +840,16 @@ class TestDownloadImageSecurely:
     @patch("app.core.ssrf_protection._get_http_session")
     @patch("app.core.ssrf_protection.validate_image_url")
     def test_download_follows_redirects(self, mock_validate, mock_get_session):
-        """测试允许 HTTP 重定向."""
-        mock_validate.return_value = ("93.184.216.34", "example.com")
+        """测试手动跟随重定向：每一跳都重新验证并发往验证通过的 IP."""
+        mock_validate.side_effect = [
+            ("93.184.216.34", "example.com"),
+            ("151.101.1.1", "cdn.example.net"),
+        ]
+
+        mock_redirect = Mock()
+        mock_redirect.status_code = 302
+        mock_redirect.headers = {"Location": "https://cdn.example.net/img/photo.png"}
 
-        # 模拟重定向链
         mock_response_final = Mock()
         mock_response_final.status_code = 200
         mock_response_final.headers = {
@@ -496,14 +861,76 @@ class TestDownloadImageSecurely:
 
         # Mock Session
         mock_session = Mock()
-        mock_session.get.return_value = mock_response_final
+        mock_session.get.side_effect = [mock_redirect, mock_response_final]
         mock_get_session.return_value = mock_session
 
         image_data = download_image_securely("https://example.com/redirect.jpg")
 
-        assert len(image_data) > 0
-        # 验证 allow_redirects=True
-        assert mock_session.get.call_args[1]["allow_redirects"] is True
+        assert image_data == b"data"
+        mock_redirect.close.assert_called_once()
+        # 重定向目标重新验证
+        assert mock_validate.call_args_list[1][0][0] == "https://cdn.example.net/img/photo.png"
+        # 第二跳发往新验证的 IP，且不让 requests 自动跟随重定向
+        second_call = mock_session.get.call_args_list[1]
+        assert second_call[0][0] == "https://151.101.1.1:443/img/photo.png"
+        assert second_call[1]["headers"]["Host"] == "cdn.example.net"
+        assert second_call[1]["allow_redirects"] is False
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    def test_download_redirect_to_private_address_blocked(self, mock_get_session):
+        """测试重定向到内网地址时被拒绝（重定向 SSRF 绕过）."""
+        mock_redirect = Mock()
+        mock_redirect.status_code = 302
+        mock_redirect.headers = {"Location": "http://169.254.169.254/latest/meta-data/"}
+        mock_session = Mock()
+        mock_session.get.return_value = mock_redirect
+        mock_get_session.return_value = mock_session
+
+        with pytest.raises(ImageDownloadError, match="URL 验证失败"):
+            download_image_securely("https://93.184.216.34/photo.jpg")
+
+        assert mock_session.get.call_count == 1
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_download_too_many_redirects(self, mock_validate, mock_get_session):
+        """测试重定向次数超过 MAX_REDIRECTS 时失败."""
+        from app.core.ssrf_protection import MAX_REDIRECTS
+
+        mock_validate.return_value = ("93.184.216.34", "example.com")
+        mock_redirect = Mock()
+        mock_redirect.status_code = 301
+        mock_redirect.headers = {"Location": "/loop.jpg"}
+        mock_session = Mock()
+        mock_session.get.return_value = mock_redirect
+        mock_get_session.return_value = mock_session
+
+        with pytest.raises(ImageDownloadError, match="重定向次数过多"):
+            download_image_securely("https://example.com/loop.jpg")
+
+        assert mock_session.get.call_count == MAX_REDIRECTS + 1
+
+    def test_async_download_redirect_revalidated(self):
+        """测试异步下载同样手动跟随重定向并重新验证."""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from app.core.ssrf_protection import download_image_securely_async
+
+        mock_redirect = Mock()
+        mock_redirect.status_code = 307
+        mock_redirect.headers = {"Location": "http://10.0.0.8/internal.jpg"}
+        mock_redirect.aclose = AsyncMock()
+        mock_client = Mock()
+        mock_client.send = AsyncMock(return_value=mock_redirect)
+
+        with pytest.raises(ImageDownloadError, match="URL 验证失败"):
+            asyncio.run(
+                download_image_securely_async("https://93.184.216.34/a.jpg", client=mock_client)
+            )
+
+        assert mock_client.send.await_args[1]["follow_redirects"] is False
+        mock_redirect.aclose.assert_awaited_once()
 
 
 class TestDNSRebindingProtection:
@@ -568,6 +995,156 @@ class TestDNSRebindingProtection:
         headers = call_args[1]["headers"]
         assert headers["Host"] == "cdn.example.com"
 
+    def test_https_adapter_uses_hostname_for_tls(self):
+        """测试 HTTPS 请求发往 IP 时，SNI 与证书校验使用 Host 头中的主机名."""
+        from app.core.ssrf_protection import _PinnedHostAdapter
+
+        adapter = _PinnedHostAdapter()
+        request = requests.Request(
+            "GET", "https://93.184.216.34:443/photo.jpg", headers={"Host": "cdn.example.com"}
+        ).prepare()
+
+        host_params, pool_kwargs = adapter.build_connection_pool_key_attributes(request, True)
+
+        assert host_params["host"] == "93.184.216.34"
+        assert pool_kwargs["server_hostname"] == "cdn.example.com"
+        assert pool_kwargs["assert_hostname"] == "cdn.example.com"
+
+    def test_http_adapter_leaves_tls_settings_alone(self):
+        """测试 HTTP 请求不设置 TLS 主机名."""
+        from app.core.ssrf_protection import _PinnedHostAdapter
+
+        adapter = _PinnedHostAdapter()
+        request = requests.Request(
+            "GET", "http://93.184.216.34:80/photo.jpg", headers={"Host": "cdn.example.com"}
+        ).prepare()
+
+        _, pool_kwargs = adapter.build_connection_pool_key_attributes(request, True)
+
+        assert "server_hostname" not in pool_kwargs
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_ipv6_target_url_bracketed(self, mock_validate, mock_get_session):
+        """测试解析到 IPv6 时目标 URL 中的地址加方括号."""
+        mock_validate.return_value = ("2606:2800:220:1:248:1893:25c8:1946", "example.com")
+
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.iter_content = lambda chunk_size: [b"data"]
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        download_image_securely("https://example.com/photo.jpg?size=large")
+
+        request_url = mock_session.get.call_args[0][0]
+        assert request_url == (
+            "https://[2606:2800:220:1:248:1893:25c8:1946]:443/photo.jpg?size=large"
+        )
+
+    def test_async_https_passes_sni_hostname(self):
+        """测试异步 HTTPS 下载通过 sni_hostname 扩展保留原始主机名."""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from app.core.ssrf_protection import download_image_securely_async
+
+        mock_response = Mock()
+        mock_response.extensions = {}
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.raise_for_status = Mock()
+
+        async def aiter_bytes(chunk_size):
+            yield b"data"
+
+        mock_response.aiter_bytes = aiter_bytes
+        mock_response.aclose = AsyncMock()
+        mock_client = Mock()
+        mock_client.send = AsyncMock(return_value=mock_response)
+
+        async def fake_validate(url, parsed=None):
+            return "93.184.216.34", "cdn.example.com"
+
+        with patch("app.core.ssrf_protection.validate_image_url_async", fake_validate):
+            data = asyncio.run(
+                download_image_securely_async("https://cdn.example.com/a.jpg", client=mock_client)
+            )
+
+        assert data == b"data"
+        method, url = mock_client.build_request.call_args[0]
+        kwargs = mock_client.build_request.call_args[1]
+        assert (method, url) == ("GET", "https://93.184.216.34:443/a.jpg")
+        assert kwargs["extensions"] == {"sni_hostname": "cdn.example.com"}
+        # 流式发送，读取完毕后关闭响应
+        assert mock_client.send.await_args[1]["stream"] is True
+        mock_response.aclose.assert_awaited_once()
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_peer_ip_mismatch_rejected(self, mock_validate, mock_get_session):
+        """测试实际连接的对端 IP 与验证的 IP 不一致时拒绝读取响应体."""
+        mock_validate.return_value = ("93.184.216.34", "example.com")
+
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.raw._connection.sock.getpeername.return_value = ("127.0.0.1", 80)
+        mock_response.iter_content = Mock()
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        with pytest.raises(ImageDownloadError, match="对端地址"):
+            download_image_securely("https://example.com/photo.jpg")
+        mock_response.iter_content.assert_not_called()
+        # 拒绝时关闭响应，连接不会滞留在连接池外
+        mock_response.close.assert_called_once()
+
+    @patch("app.core.ssrf_protection._get_http_session")
+    @patch("app.core.ssrf_protection.validate_image_url")
+    def test_peer_ip_match_allowed(self, mock_validate, mock_get_session):
+        """测试对端 IP 与验证的 IP 一致时正常下载."""
+        mock_validate.return_value = ("93.184.216.34", "example.com")
+
+        mock_response = Mock()
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.raw._connection.sock.getpeername.return_value = ("93.184.216.34", 443)
+        mock_response.iter_content = lambda chunk_size: [b"data"]
+        mock_response.raise_for_status = Mock()
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+        mock_get_session.return_value = mock_session
+
+        assert download_image_securely("https://example.com/photo.jpg") == b"data"
+
+    def test_async_peer_ip_mismatch_rejected(self):
+        """测试异步下载时对端 IP 不一致同样被拒绝，并关闭响应."""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from app.core.ssrf_protection import download_image_securely_async
+
+        network_stream = Mock()
+        network_stream.get_extra_info.return_value = ("10.0.0.5", 443)
+        mock_response = Mock()
+        mock_response.extensions = {"network_stream": network_stream}
+        mock_response.headers = {"Content-Type": "image/jpeg"}
+        mock_response.raise_for_status = Mock()
+        mock_response.aclose = AsyncMock()
+        mock_client = Mock()
+        mock_client.send = AsyncMock(return_value=mock_response)
+
+        async def fake_validate(url, parsed=None):
+            return "93.184.216.34", "example.com"
+
+        with patch("app.core.ssrf_protection.validate_image_url_async", fake_validate), \
+                patch("app.core.ssrf_protection._get_async_client", return_value=mock_client):
+            with pytest.raises(ImageDownloadError, match="对端地址"):
+                asyncio.run(download_image_securely_async("https://example.com/photo.jpg"))
+        mock_response.aclose.assert_awaited_once()
+
 
 class TestHTTPSessionManagement:
     """测试 HTTP Session 管理和连接池."""
@@ -586,6 +1163,21 @@ class TestHTTPSessionManagement:
 
         close_http_session()
 
+    def test_session_singleton_across_threads(self):
+        """测试多线程并发首次获取 Session 时只创建一个实例."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from app.core.ssrf_protection import _get_http_session, close_http_session
+
+        close_http_session()  # 重置
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sessions = list(pool.map(lambda _: _get_http_session(), range(32)))
+
+        assert all(s is sessions[0] for s in sessions)
+
+        close_http_session()
+
     def test_session_initialization(self):
         """测试 Session 正确初始化."""
         from app.core.ssrf_protection import _get_http_session, close_http_session
@@ -652,3 +1244,108 @@ class TestHTTPSessionManagement:
             mock_session.get.assert_called_once()
 
         close_http_session()
+
+
+class TestAsyncClientManagement:
+    """测试异步 HTTP Client 管理和连接池."""
+
+    def test_async_client_pool_limits(self):
+        """测试异步 Client 单例及连接池配置."""
+        import asyncio
+
+        from app.core.ssrf_protection import (
+            ASYNC_POOL_MAX_CONNECTIONS,
+            ASYNC_POOL_MAX_KEEPALIVE,
+            _get_async_client,
+            aclose_async_client,
+        )
+
+        async def scenario():
+            client = _get_async_client()
+            assert _get_async_client() is client
+
+            pool = client._transport._pool
+            assert pool._max_connections == ASYNC_POOL_MAX_CONNECTIONS
+            assert pool._max_keepalive_connections == ASYNC_POOL_MAX_KEEPALIVE
+
+            await aclose_async_client()
+            assert client.is_closed
+            # 关闭后重新获取应该是新实例
+            new_client = _get_async_client()
+            assert new_client is not client
+            await aclose_async_client()
+
+        asyncio.run(scenario())
+
+
+class TestDownloadImagesBatch:
+    """测试批量并发下载."""
+
+    def test_batch_preserves_order_and_isolates_failures(self):
+        """测试结果与输入顺序一致，单个失败不影响其他 URL."""
+        import asyncio
+
+        from app.core.ssrf_protection import download_images_batch
+
+        async def fake_download(url, **kwargs):
+            if "bad" in url:
+                raise ImageDownloadError(f"下载失败: {url}")
+            await asyncio.sleep(0)
+            return url.encode()
+
+        urls = [
+            "https://a.example.com/1.jpg",
+            "https://bad.example.com/2.jpg",
+            "https://c.example.com/3.jpg",
+        ]
+        with patch("app.core.ssrf_protection.download_image_securely_async", fake_download):
+            results = asyncio.run(download_images_batch(urls))
+
+        assert results[0] == urls[0].encode()
+        assert isinstance(results[1], ImageDownloadError)
+        assert results[2] == urls[2].encode()
+
+    def test_batch_respects_max_concurrency(self):
+        """测试同时进行的下载数不超过 max_concurrency."""
+        import asyncio
+
+        from app.core.ssrf_protection import download_images_batch
+
+        active = 0
+        peak = 0
+
+        async def fake_download(url, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return b"data"
+
+        urls = [f"https://example.com/{i}.jpg" for i in range(10)]
+        with patch("app.core.ssrf_protection.download_image_securely_async", fake_download):
+            results = asyncio.run(download_images_batch(urls, max_concurrency=3))
+
+        assert results == [b"data"] * 10
+        assert peak == 3
+
+    def test_batch_sync_uses_dedicated_client(self):
+        """测试同步入口为本批次创建独立 Client 并在结束后关闭."""
+        from app.core.ssrf_protection import download_images_batch_sync
+
+        clients = []
+
+        async def fake_download(url, client=None, **kwargs):
+            clients.append(client)
+            return b"data"
+
+        with patch("app.core.ssrf_protection.download_image_securely_async", fake_download):
+            results = download_images_batch_sync([
+                "https://a.example.com/1.jpg",
+                "https://b.example.com/2.jpg",
+            ])
+
+        assert results == [b"data", b"data"]
+        assert clients[0] is not None and clients[0] is clients[1]
+        assert clients[0].is_closed
+        assert download_images_batch_sync([]) == []
@@ -0,0 +1,91 @@
+"""
+Unit tests for the local batching embedder.
+"""
+
+import asyncio
+import threading
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services.embeddings import BatchingEmbedder
+
+
+class FakeModel:
+    """Stand-in for SentenceTransformer that records each encode() batch."""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def encode(self, texts, batch_size, convert_to_numpy, normalize_embeddings):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+class TestBatchingEmbedder:
+    """Tests for BatchingEmbedder."""
+
+    def test_embed_query_returns_vector(self):
+        """测试单个查询返回对应向量."""
+        embedder = BatchingEmbedder(model=FakeModel(), max_wait=0)
+
+        assert embedder.embed_query("番茄") == [2.0, 1.0]
+
+    def test_concurrent_queries_are_batched(self):
+        """测试并发查询被合并为一次 encode 调用."""
+        model = FakeModel()
+        embedder = BatchingEmbedder(model=model, max_batch_size=8, max_wait=0.5)
+        texts = ["a" * (i + 1) for i in range(8)]
+        results = {}
+
+        def worker(text):
+            results[text] = embedder.embed_query(text)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        # 每个调用方拿到自己的向量
+        assert results == {t: [float(len(t)), 1.0] for t in texts}
+        # 达到 max_batch_size 立即编码，无需等满 max_wait
+        assert len(model.batches) < len(texts)
+        assert sum(len(b) for b in model.batches) == len(texts)
+
+    def test_encode_error_propagates_to_callers(self):
+        """测试编码失败时异常传递给调用方，且后台线程继续工作."""
+        model = FakeModel(fail=True)
+        embedder = BatchingEmbedder(model=model, max_wait=0)
+
+        with pytest.raises(RuntimeError, match="model crashed"):
+            embedder.embed_query("番茄")
+
+        model.fail = False
+        assert embedder.embed_query("番茄") == [2.0, 1.0]
+
+    def test_aembed_query(self):
+        """测试异步接口."""
+        embedder = BatchingEmbedder(model=FakeModel(), max_wait=0)
+
+        assert asyncio.run(embedder.aembed_query("番茄")) == [2.0, 1.0]
+
+    def test_embed_documents_encodes_directly(self):
+        """测试文档批量编码不经过队列."""
+        model = FakeModel()
+        embedder = BatchingEmbedder(model=model)
+
+        assert embedder.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+        assert embedder.embed_documents([]) == []
+        assert model.batches == [["a", "bb"]]
+        assert embedder._worker is None
+
+    def test_missing_dependency_raises_import_error(self):
+        """测试未安装 sentence-transformers 时给出安装提示."""
+        with patch.dict("sys.modules", {"sentence_transformers": None}):
+            with pytest.raises(ImportError, match="sentence-transformers"):
+                BatchingEmbedder("BAAI/bge-small-zh-v1.5")
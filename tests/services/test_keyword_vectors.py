@@ -0,0 +1,59 @@
+"""
+Unit tests for precomputed keyword vectors.
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.services.keyword_vectors import KeywordVectors, quantize
+
+
+def test_quantize_preserves_direction():
+    """测试 int8 量化后与原向量的余弦相似度接近 1."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(8, 256)).astype(np.float32)
+
+    quantized, scales = quantize(vectors)
+    restored = quantized.astype(np.float32) * scales[:, None]
+
+    assert quantized.dtype == np.int8
+    cosine = (vectors * restored).sum(axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(restored, axis=1)
+    )
+    assert cosine.min() > 0.999
+
+
+def test_quantize_zero_vector():
+    """测试全零向量不会除零."""
+    quantized, scales = quantize(np.zeros((1, 4), dtype=np.float32))
+
+    assert not quantized.any()
+    assert np.isfinite(scales).all()
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    """测试保存后可按同一模型加载并查询."""
+    path = str(tmp_path / "vectors.npz")
+    embedder = MagicMock()
+    embedder.embed_documents.return_value = [[0.6, 0.8, 0.0], [0.0, -1.0, 0.5]]
+
+    KeywordVectors.build(["白粉病", "蚜虫"], embedder, model="bge").save(path)
+    vectors = KeywordVectors.load(path, model="bge")
+
+    embedder.embed_documents.assert_called_once_with(["白粉病", "蚜虫"])
+    assert len(vectors) == 2
+    assert "蚜虫" in vectors
+    assert np.allclose(vectors.get("白粉病"), [0.6, 0.8, 0.0], atol=0.01)
+    assert vectors.get("晚疫病") is None
+
+
+def test_load_rejects_other_model_or_missing_file(tmp_path):
+    """测试模型不一致或文件不存在时返回 None."""
+    path = str(tmp_path / "vectors.npz")
+    embedder = MagicMock()
+    embedder.embed_documents.return_value = [[1.0, 0.0]]
+    KeywordVectors.build(["白粉病"], embedder, model="bge").save(path)
+
+    assert KeywordVectors.load(path, model="text-embedding-3-small") is None
+    assert KeywordVectors.load(str(tmp_path / "missing.npz"), model="bge") is None
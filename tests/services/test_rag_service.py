@@ -4,24 +4,37 @@ Unit tests for RAG Service
 Tests the vector retrieval functionality from ChromaDB.
 """
 
+import asyncio
 import datetime
 import os
-from unittest.mock import MagicMock, Mock, patch
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, Mock, call, patch
 
+import numpy as np
 import pytest
 from langchain_core.documents import Document
 
+from app.services.keyword_vectors import KeywordVectors
 from app.services.rag_service import (
     RAGService,
+    _SemanticQueryCache,
     RAGServiceNotInitializedError,
     get_rag_service,
     reset_rag_service,
 )
 
+# 测试用查询向量（OpenAIEmbeddings.embed_query 的返回值）
+QUERY_VECTOR = [0.6, 0.8, 0.0]
+
 
 @pytest.fixture(autouse=True)
-def reset_singleton():
-    """Reset RAG service singleton before each test."""
+def reset_singleton(tmp_path, monkeypatch):
+    """Reset RAG service singleton (and use a fresh disk cache) for each test."""
+    monkeypatch.setattr(
+        "app.services.rag_service.RAG_DISK_CACHE_PATH", str(tmp_path / "rag_cache.db")
+    )
+    monkeypatch.setattr("app.services.rag_service.KEYWORD_VECTORS_PATH", "")
     reset_rag_service()
     yield
     reset_rag_service()
@@ -87,6 +100,58 @@ class TestRAGServiceInit:
         assert "ChromaDB not initialized" in str(exc_info.value)
         assert "ingest_knowledge.py" in str(exc_info.value)
 
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_concurrent_first_use_loads_chroma_once(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试多线程同时首次访问时单例与 ChromaDB 只创建一次."""
+        mock_exists.return_value = True
+
+        def slow_chroma(**kwargs):
+            time.sleep(0.05)
+            return MagicMock()
+
+        mock_chroma_cls.side_effect = slow_chroma
+        barrier = threading.Barrier(8)
+        services, dbs = [], []
+
+        def worker():
+            barrier.wait()
+            service = get_rag_service()
+            services.append(service)
+            dbs.append(service._get_chroma_db())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert len(set(map(id, services))) == 1
+        assert len(set(map(id, dbs))) == 1
+        assert mock_chroma_cls.call_count == 1
+        assert mock_embeddings_cls.call_count == 1
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_warm_up_loads_chroma_before_first_query(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试 warm_up 预先加载 ChromaDB，之后的查询不再重复加载."""
+        mock_exists.return_value = True
+        mock_chroma_cls.return_value.similarity_search.return_value = []
+
+        service = get_rag_service()
+        service.warm_up()
+
+        assert mock_chroma_cls.call_count == 1
+        service.query("番茄晚疫病")
+        assert mock_chroma_cls.call_count == 1
+        assert mock_embeddings_cls.call_count == 1
+
 
 class TestQuery:
     """Tests for query method."""
@@ -100,8 +165,9 @@ class TestQuery:
         """Test successful query returns relevant documents."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = sample_documents[:2]
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:2]
         mock_chroma_cls.return_value = mock_db
 
         # Execute query
@@ -111,7 +177,7 @@ class TestQuery:
         # Verify
         assert len(results) == 2
         assert results[0].page_content == "番茄晚疫病由致病疫霉引起"
-        mock_db.similarity_search.assert_called_once_with("番茄晚疫病", k=2)
+        mock_db.similarity_search_by_vector.assert_called_once_with(QUERY_VECTOR, k=2)
 
     @patch("app.services.rag_service.Chroma")
     @patch("app.services.rag_service.OpenAIEmbeddings")
@@ -122,8 +188,9 @@ class TestQuery:
         """Test query with metadata filter."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = [
+        mock_db.similarity_search_by_vector.return_value = [
             Document(
                 page_content="番茄晚疫病由致病疫霉引起",
                 metadata={"source": "data/knowledge/diseases/late_blight.md"},
@@ -141,8 +208,8 @@ class TestQuery:
 
         # Verify
         assert len(results) == 1
-        mock_db.similarity_search.assert_called_once_with(
-            "番茄晚疫病",
+        mock_db.similarity_search_by_vector.assert_called_once_with(
+            QUERY_VECTOR,
             k=3,
             filter={"category": "diseases"},
         )
@@ -156,8 +223,9 @@ class TestQuery:
         """Test query returns empty list when no matches found."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         # Execute query
@@ -166,7 +234,7 @@ class TestQuery:
 
         # Verify
         assert results == []
-        mock_db.similarity_search.assert_called_once()
+        mock_db.similarity_search_by_vector.assert_called_once()
 
     def test_query_empty_string_raises_error(self):
         """Test that empty query string raises ValueError."""
@@ -195,8 +263,9 @@ class TestQuery:
         """Test that top_k parameter correctly limits results."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = sample_documents[:1]
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
         mock_chroma_cls.return_value = mock_db
 
         # Execute query with different top_k values
@@ -204,13 +273,13 @@ class TestQuery:
 
         results = service.query("番茄", top_k=1)
         assert len(results) == 1
-        mock_db.similarity_search.assert_called_with("番茄", k=1)
+        mock_db.similarity_search_by_vector.assert_called_with(QUERY_VECTOR, k=1)
 
         # Reset mock
         mock_db.reset_mock()
 
         results = service.query("番茄", top_k=5)
-        mock_db.similarity_search.assert_called_with("番茄", k=5)
+        mock_db.similarity_search_by_vector.assert_called_with(QUERY_VECTOR, k=5)
 
     @patch("app.services.rag_service.Chroma")
     @patch("app.services.rag_service.OpenAIEmbeddings")
@@ -221,8 +290,9 @@ class TestQuery:
         """Test that ChromaDB instance is cached after first load."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         # Execute multiple queries
@@ -246,8 +316,9 @@ class TestErrorHandling:
         """Test that exceptions from ChromaDB are propagated."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.side_effect = Exception("Database connection failed")
+        mock_db.similarity_search_by_vector.side_effect = Exception("Database connection failed")
         mock_chroma_cls.return_value = mock_db
 
         # Execute query
@@ -270,8 +341,9 @@ class TestQueryFilterMetadata:
         """测试 filter_metadata 包含列表值（原问题场景）."""
         # Setup mocks
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         # Execute query with list values (previously caused TypeError)
@@ -283,8 +355,8 @@ class TestQueryFilterMetadata:
 
         # Verify the filter was correctly passed to ChromaDB
         assert results == []
-        mock_db.similarity_search.assert_called_once()
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        mock_db.similarity_search_by_vector.assert_called_once()
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == {"tags": ["disease", "urgent"], "category": "pests"}
 
     @patch("app.services.rag_service.Chroma")
@@ -295,8 +367,9 @@ class TestQueryFilterMetadata:
     ):
         """测试 filter_metadata 包含嵌套字典."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -306,8 +379,8 @@ class TestQueryFilterMetadata:
         )
 
         assert results == []
-        mock_db.similarity_search.assert_called_once()
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        mock_db.similarity_search_by_vector.assert_called_once()
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == {"meta": {"severity": "high", "confidence": 0.95}}
 
     @patch("app.services.rag_service.Chroma")
@@ -318,17 +391,18 @@ class TestQueryFilterMetadata:
     ):
         """测试空字典 filter_metadata（空字典为假值，不传递 filter 参数）."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
         results = service.query("番茄", filter_metadata={})
 
         assert results == []
-        mock_db.similarity_search.assert_called_once()
+        mock_db.similarity_search_by_vector.assert_called_once()
         # 空字典在 Python 中为假值，不会传递 filter 参数
-        call_args = mock_db.similarity_search.call_args
+        call_args = mock_db.similarity_search_by_vector.call_args
         assert call_args.kwargs == {} or "filter" not in call_args.kwargs
 
     @patch("app.services.rag_service.Chroma")
@@ -339,8 +413,9 @@ class TestQueryFilterMetadata:
     ):
         """测试 filter_metadata 包含 None 值."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -349,8 +424,8 @@ class TestQueryFilterMetadata:
         )
 
         assert results == []
-        mock_db.similarity_search.assert_called_once()
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        mock_db.similarity_search_by_vector.assert_called_once()
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == {"category": None, "severity": "high"}
 
     @patch("app.services.rag_service.Chroma")
@@ -361,8 +436,9 @@ class TestQueryFilterMetadata:
     ):
         """测试 filter_metadata 包含 Unicode 字符."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -376,8 +452,8 @@ class TestQueryFilterMetadata:
         )
 
         assert results == []
-        mock_db.similarity_search.assert_called_once()
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        mock_db.similarity_search_by_vector.assert_called_once()
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == {
             "中文": "病害",
             "emoji": "🍅🌿",
@@ -437,8 +513,9 @@ class TestQueryFilterMetadata:
     ):
         """测试相同 filter_metadata 能正确命中缓存（第二次查询不调用 similarity_search）."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = sample_documents[:1]
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -453,7 +530,7 @@ class TestQueryFilterMetadata:
         assert results1 == results2
 
         # 验证 similarity_search 只被调用了一次（第二次从缓存获取）
-        assert mock_db.similarity_search.call_count == 1
+        assert mock_db.similarity_search_by_vector.call_count == 1
 
     @patch("app.services.rag_service.Chroma")
     @patch("app.services.rag_service.OpenAIEmbeddings")
@@ -463,8 +540,9 @@ class TestQueryFilterMetadata:
     ):
         """测试 filter_metadata 的键顺序不影响缓存（sort_keys=True）."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -479,10 +557,10 @@ class TestQueryFilterMetadata:
         service.query("番茄", filter_metadata=filter2)
 
         # 验证只调用了一次 similarity_search（第二次查询命中缓存）
-        assert mock_db.similarity_search.call_count == 1
+        assert mock_db.similarity_search_by_vector.call_count == 1
 
         # 验证使用的是正确排序后的 filter 参数
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == {"a": 1, "b": 2, "c": 3}
 
     @patch("app.services.rag_service.Chroma")
@@ -493,8 +571,9 @@ class TestQueryFilterMetadata:
     ):
         """测试复杂的嵌套 filter_metadata 结构."""
         mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
         mock_db = MagicMock()
-        mock_db.similarity_search.return_value = []
+        mock_db.similarity_search_by_vector.return_value = []
         mock_chroma_cls.return_value = mock_db
 
         service = get_rag_service()
@@ -514,6 +593,368 @@ class TestQueryFilterMetadata:
         results = service.query("番茄", filter_metadata=complex_filter)
 
         assert results == []
-        mock_db.similarity_search.assert_called_once()
-        call_kwargs = mock_db.similarity_search.call_args.kwargs
+        mock_db.similarity_search_by_vector.assert_called_once()
+        call_kwargs = mock_db.similarity_search_by_vector.call_args.kwargs
         assert call_kwargs["filter"] == complex_filter
+
+
+class TestHNSWTuning:
+    """Tests for HNSW index parameters."""
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_collection_created_with_hnsw_metadata(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试加载 ChromaDB 时传入 HNSW 参数."""
+        mock_exists.return_value = True
+
+        RAGService()._get_chroma_db()
+
+        assert mock_chroma_cls.call_args.kwargs["collection_metadata"] == {
+            "hnsw:M": 16,
+            "hnsw:construction_ef": 400,
+            "hnsw:search_ef": 50,
+        }
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_ef_search_only_grows(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试 ef_search 按 top_k 上调，且不会重复写入集合配置."""
+        mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = []
+        mock_db._collection.configuration = {"hnsw": {"ef_search": 10}}
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        service.query("番茄", top_k=3)
+        service.query("番茄", top_k=4)
+        service.query("番茄", top_k=10)
+        service.query("番茄", top_k=2)
+
+        modify = mock_db._collection.modify
+        assert modify.call_args_list == [
+            call(configuration={"hnsw": {"ef_search": 50}}),
+            call(configuration={"hnsw": {"ef_search": 100}}),
+        ]
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_sufficient_ef_search_is_not_rewritten(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试集合已有足够的 ef_search 时不修改配置."""
+        mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = []
+        mock_db._collection.configuration = {"hnsw": {"ef_search": 50}}
+        mock_chroma_cls.return_value = mock_db
+
+        get_rag_service().query("番茄", top_k=3)
+
+        mock_db._collection.modify.assert_not_called()
+
+
+class TestSemanticQueryCache:
+    """Tests for the embedding-keyed second-tier cache."""
+
+    def test_similar_query_hits(self, sample_documents):
+        """测试相似度超过阈值的查询命中缓存."""
+        cache = _SemanticQueryCache(maxsize=10, threshold=0.92)
+        cache.set([1.0, 0.0, 0.0], 3, None, sample_documents)
+
+        assert cache.get([0.99, 0.05, 0.0], 3, None) is sample_documents
+        assert cache.get([0.0, 1.0, 0.0], 3, None) is None
+
+    def test_top_k_and_filter_must_match(self, sample_documents):
+        """测试 top_k 或过滤条件不同时不命中."""
+        cache = _SemanticQueryCache(maxsize=10, threshold=0.92)
+        cache.set([1.0, 0.0, 0.0], 3, '{"category": "diseases"}', sample_documents)
+
+        assert cache.get([1.0, 0.0, 0.0], 5, '{"category": "diseases"}') is None
+        assert cache.get([1.0, 0.0, 0.0], 3, None) is None
+        assert cache.get([1.0, 0.0, 0.0], 3, '{"category": "diseases"}') is sample_documents
+
+    def test_returns_closest_match(self, sample_documents):
+        """测试多个条目超过阈值时返回最相似的一个."""
+        cache = _SemanticQueryCache(maxsize=10, threshold=0.9)
+        cache.set([1.0, 0.1, 0.0], 3, None, sample_documents[:1])
+        cache.set([1.0, 0.0, 0.0], 3, None, sample_documents[:2])
+
+        assert cache.get([1.0, 0.0, 0.0], 3, None) == sample_documents[:2]
+
+    def test_evicts_least_recently_used(self, sample_documents):
+        """测试超过容量时淘汰最久未使用的条目."""
+        cache = _SemanticQueryCache(maxsize=2, threshold=0.99)
+        cache.set([1.0, 0.0, 0.0], 3, None, sample_documents[:1])
+        cache.set([0.0, 1.0, 0.0], 3, None, sample_documents[:2])
+        cache.get([1.0, 0.0, 0.0], 3, None)  # 第一条变为最近使用
+        cache.set([0.0, 0.0, 1.0], 3, None, sample_documents)
+
+        assert len(cache) == 2
+        assert cache.get([1.0, 0.0, 0.0], 3, None) == sample_documents[:1]
+        assert cache.get([0.0, 1.0, 0.0], 3, None) is None
+
+    def test_zero_vector_is_ignored(self, sample_documents):
+        """测试零向量既不写入也不命中."""
+        cache = _SemanticQueryCache(maxsize=10)
+        cache.set([0.0, 0.0, 0.0], 3, None, sample_documents)
+
+        assert len(cache) == 0
+        assert cache.get([0.0, 0.0, 0.0], 3, None) is None
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_paraphrased_query_skips_vector_search(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, sample_documents
+    ):
+        """测试措辞不同但向量相近的查询复用结果，不再检索 ChromaDB."""
+        mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.side_effect = [
+            [0.6, 0.8, 0.0],
+            [0.61, 0.79, 0.0],
+        ]
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        results1 = service.query("番茄晚疫病症状")
+        results2 = service.query("番茄晚疫病的症状")
+
+        assert results1 == results2
+        assert mock_db.similarity_search_by_vector.call_count == 1
+        assert mock_embeddings_cls.return_value.embed_query.call_count == 2
+
+class TestEmbeddingProvider:
+    """Tests for EMBEDDING_PROVIDER selection."""
+
+    @patch("app.services.rag_service.EMBEDDING_PROVIDER", "local")
+    @patch("app.services.rag_service.BatchingEmbedder")
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_local_embedding_provider(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, mock_batching_cls
+    ):
+        """测试 EMBEDDING_PROVIDER=local 时使用本地批量编码器."""
+        mock_exists.return_value = True
+
+        RAGService()._get_chroma_db()
+
+        mock_embeddings_cls.assert_not_called()
+        mock_batching_cls.assert_called_once()
+        assert (
+            mock_chroma_cls.call_args.kwargs["embedding_function"]
+            is mock_batching_cls.return_value
+        )
+
+
+class TestKeywordVectors:
+    """Tests for precomputed taxonomy term vectors."""
+
+    @pytest.fixture
+    def keyword_vectors_path(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "keyword_vectors.npz")
+        embedder = MagicMock()
+        embedder.embed_documents.return_value = [QUERY_VECTOR]
+        KeywordVectors.build(["白粉病"], embedder, model="text-embedding-3-small").save(path)
+        monkeypatch.setattr("app.services.rag_service.KEYWORD_VECTORS_PATH", path)
+        return path
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_taxonomy_term_skips_embedding_call(
+        self,
+        mock_exists,
+        mock_embeddings_cls,
+        mock_chroma_cls,
+        keyword_vectors_path,
+        sample_documents,
+    ):
+        """测试查询文本为分类术语时使用预计算向量，不调用 embedding API."""
+        mock_exists.return_value = True
+        mock_embeddings = mock_embeddings_cls.return_value
+        mock_embeddings.embed_query.return_value = [0.0, 0.0, 1.0]
+        mock_embeddings.aembed_query = AsyncMock(return_value=[0.0, 0.0, 1.0])
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
+        mock_db.asimilarity_search_by_vector = AsyncMock(return_value=sample_documents[:1])
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        service.query("白粉病", top_k=1)
+        asyncio.run(service.query_async("白粉病", top_k=2))
+        service.query("番茄晚疫病", top_k=1)
+
+        mock_embeddings.aembed_query.assert_not_awaited()
+        mock_embeddings.embed_query.assert_called_once_with("番茄晚疫病")
+        vector = mock_db.similarity_search_by_vector.call_args_list[0].args[0]
+        assert np.allclose(vector, QUERY_VECTOR, atol=0.01)
+
+    @patch("app.services.rag_service.EMBEDDING_PROVIDER", "local")
+    @patch("app.services.rag_service.BatchingEmbedder")
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_vectors_from_other_model_are_ignored(
+        self, mock_exists, mock_chroma_cls, mock_batching_cls, keyword_vectors_path
+    ):
+        """测试其他嵌入模型生成的预计算向量不会被加载."""
+        mock_exists.return_value = True
+        service = RAGService()
+        service._get_chroma_db()
+
+        assert service._keyword_vectors is None
+
+
+class TestQueryAsync:
+    """Tests for query_async."""
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_query_async_searches_by_vector(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, sample_documents
+    ):
+        """测试异步查询只计算一次查询向量并按向量检索."""
+        mock_exists.return_value = True
+        mock_embeddings = mock_embeddings_cls.return_value
+        mock_embeddings.aembed_query = AsyncMock(return_value=QUERY_VECTOR)
+        mock_db = MagicMock()
+        mock_db.asimilarity_search_by_vector = AsyncMock(
+            return_value=sample_documents[:1]
+        )
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        results = asyncio.run(
+            service.query_async(
+                "番茄晚疫病", top_k=2, filter_metadata={"category": "diseases"}
+            )
+        )
+
+        assert results == sample_documents[:1]
+        mock_embeddings.aembed_query.assert_awaited_once_with("番茄晚疫病")
+        mock_db.asimilarity_search_by_vector.assert_awaited_once_with(
+            QUERY_VECTOR, k=2, filter={"category": "diseases"}
+        )
+        mock_db.asimilarity_search.assert_not_called()
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_query_async_shares_semantic_cache(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, sample_documents
+    ):
+        """测试同步查询写入的语义缓存可被异步查询命中."""
+        mock_exists.return_value = True
+        mock_embeddings = mock_embeddings_cls.return_value
+        mock_embeddings.embed_query.return_value = QUERY_VECTOR
+        mock_embeddings.aembed_query = AsyncMock(return_value=QUERY_VECTOR)
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
+        mock_db.asimilarity_search_by_vector = AsyncMock()
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        service.query("番茄晚疫病")
+        results = asyncio.run(service.query_async("番茄晚疫病的症状"))
+
+        assert results == sample_documents[:1]
+        mock_db.asimilarity_search_by_vector.assert_not_awaited()
+
+
+class TestDiskCache:
+    """Tests for the persistent query cache."""
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_results_survive_service_restart(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, sample_documents
+    ):
+        """测试服务重建（如 worker 回收）后从磁盘缓存命中，不再计算向量或检索."""
+        mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:2]
+        mock_chroma_cls.return_value = mock_db
+
+        get_rag_service().query("番茄晚疫病", top_k=2)
+        reset_rag_service()
+        results = get_rag_service().query("番茄晚疫病", top_k=2)
+
+        assert [doc.page_content for doc in results] == [
+            doc.page_content for doc in sample_documents[:2]
+        ]
+        assert [doc.metadata for doc in results] == [
+            doc.metadata for doc in sample_documents[:2]
+        ]
+        assert mock_db.similarity_search_by_vector.call_count == 1
+        assert mock_embeddings_cls.return_value.embed_query.call_count == 1
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_filter_is_part_of_disk_key(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls
+    ):
+        """测试不同过滤条件不共用磁盘缓存条目."""
+        mock_exists.return_value = True
+        mock_embeddings_cls.return_value.embed_query.return_value = QUERY_VECTOR
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = []
+        mock_chroma_cls.return_value = mock_db
+
+        get_rag_service().query("番茄", filter_metadata={"category": "diseases"})
+        reset_rag_service()
+        get_rag_service().query("番茄", filter_metadata={"category": "pests"})
+
+        assert mock_db.similarity_search_by_vector.call_count == 2
+
+    @patch("app.services.rag_service.Chroma")
+    @patch("app.services.rag_service.OpenAIEmbeddings")
+    @patch("app.services.rag_service.os.path.exists")
+    def test_semantic_hit_not_persisted(
+        self, mock_exists, mock_embeddings_cls, mock_chroma_cls, sample_documents
+    ):
+        """测试语义缓存的近似命中不写入磁盘缓存（重启后近似查询重新检索）."""
+        mock_exists.return_value = True
+        mock_embeddings = mock_embeddings_cls.return_value
+        mock_embeddings.embed_query.side_effect = [
+            [0.6, 0.8, 0.0],
+            [0.61, 0.79, 0.0],
+            [0.61, 0.79, 0.0],
+        ]
+        mock_embeddings.aembed_query = AsyncMock(return_value=[0.61, 0.79, 0.0])
+        mock_db = MagicMock()
+        mock_db.similarity_search_by_vector.return_value = sample_documents[:1]
+        mock_chroma_cls.return_value = mock_db
+
+        service = get_rag_service()
+        service.query("番茄 晚疫病")
+        service.query("番茄 早疫病")
+        asyncio.run(service.query_async("番茄 早疫病"))
+        assert mock_db.similarity_search_by_vector.call_count == 1
+
+        # 精确查询的结果仍持久化；近似命中的查询在新进程中重新检索
+        assert service._disk_get("番茄 晚疫病", 3, None) is not None
+        assert service._disk_get("番茄 早疫病", 3, None) is None
+        reset_rag_service()
+        get_rag_service().query("番茄 早疫病")
+        assert mock_db.similarity_search_by_vector.call_count == 2
+
+    @patch("app.services.rag_service.RAG_DISK_CACHE_PATH", "")
+    def test_disk_cache_can_be_disabled(self):
+        """测试 RAG_DISK_CACHE_PATH 为空时禁用磁盘缓存."""
+        assert RAGService()._disk_cache is None
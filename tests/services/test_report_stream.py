@@ -0,0 +1,97 @@
+"""
+Unit tests for report streaming over Redis Streams.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import redis
+
+from app.services.report_stream import (
+    EVENT_IDLE,
+    iter_report_stream,
+    publish_report_stream,
+    report_stream_key,
+)
+
+
+def _published(client):
+    return [call.args[1] for call in client.xadd.call_args_list]
+
+
+def test_publish_appends_chunks_and_end_event():
+    """测试每个分块写入报告流，结束时写入 end 事件并设置过期时间."""
+    client = MagicMock()
+
+    report = publish_report_stream("task-1", iter(["# 报告", "\n正文"]), client=client)
+
+    assert report == "# 报告\n正文"
+    assert client.xadd.call_args.args[0] == report_stream_key("task-1")
+    assert _published(client) == [
+        {"event": "chunk", "data": "# 报告"},
+        {"event": "chunk", "data": "\n正文"},
+        {"event": "end", "data": ""},
+    ]
+    client.expire.assert_called_once()
+
+
+def test_publish_sets_expiry_after_first_chunk():
+    """测试第一条写入后立即设置过期时间（worker 中途崩溃时流也会过期）."""
+    client = MagicMock()
+    expired_before_second_chunk = []
+
+    def chunks():
+        yield "# 报告"
+        expired_before_second_chunk.append(client.expire.called)
+        yield "\n正文"
+
+    publish_report_stream("task-1", chunks(), client=client)
+
+    assert expired_before_second_chunk == [True]
+    client.expire.assert_called_once()
+
+
+def test_publish_error_event_and_reraise():
+    """测试生成失败时写入 error 事件并重新抛出异常."""
+    client = MagicMock()
+
+    def chunks():
+        yield "# 报告"
+        raise RuntimeError("LLM call timed out")
+
+    with pytest.raises(RuntimeError):
+        publish_report_stream("task-1", chunks(), client=client)
+
+    assert _published(client)[-1] == {"event": "error", "data": "LLM call timed out"}
+
+
+def test_publish_survives_redis_failure():
+    """测试 Redis 不可用时停止发布，但仍返回完整报告."""
+    client = MagicMock()
+    client.xadd.side_effect = redis.ConnectionError("down")
+
+    report = publish_report_stream("task-1", iter(["a", "b", "c"]), client=client)
+
+    assert report == "abc"
+    assert client.xadd.call_count == 1
+    client.expire.assert_not_called()
+
+
+def test_iter_report_stream_until_end():
+    """测试从头读取报告流，空闲时产生 idle 事件，读到 end 后结束."""
+    client = MagicMock()
+    client.xread = AsyncMock(side_effect=[
+        [],
+        [("report_stream:task-1", [("1-0", {"event": "chunk", "data": "# 报告"})])],
+        [("report_stream:task-1", [("2-0", {"event": "end", "data": ""})])],
+    ])
+
+    async def collect():
+        return [event async for event in iter_report_stream("task-1", client=client, block_ms=10)]
+
+    events = asyncio.run(collect())
+
+    assert events == [(EVENT_IDLE, ""), ("chunk", "# 报告"), ("end", "")]
+    # 之后的读取从上次读到的条目 ID 继续
+    assert client.xread.await_args_list[2].args[0] == {"report_stream:task-1": "1-0"}
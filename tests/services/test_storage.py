@@ -6,13 +6,17 @@ Tests cover singleton pattern, file upload, bucket management, and error handlin
 
 import pytest
 from minio.error import S3Error
+from app.core.config import SETTINGS
+from app.services import storage
 from app.services.storage import (
     StorageService,
     StorageConnectionError,
     get_storage_service,
+    peek_storage_service,
 )
 from unittest.mock import Mock, patch, MagicMock
 import io
+import urllib3
 
 
 @patch("app.services.storage.Minio")
@@ -33,6 +37,33 @@ def test_get_storage_service():
     assert isinstance(service, StorageService)
 
 
+@patch("app.services.storage.Minio")
+def test_peek_storage_service_does_not_initialize(mock_minio):
+    """Test that peek returns None until the singleton exists, without connecting."""
+    mock_minio.return_value.bucket_exists.return_value = True
+    saved = StorageService._instance, storage._storage_service
+    StorageService._instance, storage._storage_service = None, None
+    try:
+        assert peek_storage_service() is None
+        mock_minio.assert_not_called()
+
+        service = get_storage_service()
+        assert peek_storage_service() is service
+    finally:
+        StorageService._instance, storage._storage_service = saved
+
+
+def test_create_http_client_pool_settings():
+    """Test that the shared MinIO connection pool is sized for concurrency."""
+    http = StorageService._create_http_client(maxsize=32)
+
+    assert isinstance(http, urllib3.PoolManager)
+    assert http.connection_pool_kw["maxsize"] == 32
+    assert http.connection_pool_kw["block"] is False
+    assert http.connection_pool_kw["retries"].total == 2
+    assert http.connection_pool_kw["timeout"].connect_timeout == 2.0
+
+
 @patch("app.services.storage.Minio")
 def test_upload_image_success(mock_minio):
     """Test successful image upload."""
@@ -100,11 +131,114 @@ def test_get_public_url_http(mock_minio):
     service = StorageService()
     service._client = mock_client
 
-    url = service._get_public_url("test.jpg")
+    url = service.get_public_url("test.jpg")
     assert url.startswith("http://")
     assert "test.jpg" in url
 
 
+@patch("app.services.storage.Minio")
+def test_object_exists(mock_minio):
+    """Test object existence check via stat_object."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+
+    service = StorageService()
+    service._client = mock_client
+
+    assert service.object_exists("test.jpg") is True
+    mock_client.stat_object.assert_called_once_with(service.bucket_name, "test.jpg")
+
+    mock_client.stat_object.side_effect = S3Error(
+        code="NoSuchKey",
+        message="Object does not exist",
+        resource="/test.jpg",
+        request_id="123",
+        host_id="456",
+        response=Mock(),
+    )
+    assert service.object_exists("test.jpg") is False
+
+
+@patch("app.services.storage.Minio")
+def test_object_exists_other_error_raises_storage_error(mock_minio):
+    """Test that non-404 stat errors raise StorageConnectionError."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+
+    service = StorageService()
+    service._client = mock_client
+    mock_client.stat_object.side_effect = S3Error(
+        code="AccessDenied",
+        message="Access Denied",
+        resource="/test.jpg",
+        request_id="123",
+        host_id="456",
+        response=Mock(),
+    )
+
+    with pytest.raises(StorageConnectionError):
+        service.object_exists("test.jpg")
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_measures_seekable_stream(mock_minio):
+    """Test that a seekable stream is sent with its size (single PUT)."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+
+    service = StorageService()
+    service._client = mock_client
+
+    file_data = io.BytesIO(b"0123456789")
+    file_data.seek(3)
+    service.upload_image(file_data, "test.jpg")
+
+    call_kwargs = mock_client.put_object.call_args.kwargs
+    assert call_kwargs["length"] == 7
+    assert call_kwargs["part_size"] == 0
+    # 测量后恢复原位置
+    assert file_data.tell() == 3
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_uses_explicit_length(mock_minio):
+    """Test that an explicit length is passed through unchanged."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+
+    service = StorageService()
+    service._client = mock_client
+
+    service.upload_image(io.BytesIO(b"fake image data"), "test.jpg", length=15)
+
+    call_kwargs = mock_client.put_object.call_args.kwargs
+    assert call_kwargs["length"] == 15
+    assert call_kwargs["part_size"] == 0
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_unseekable_stream_uses_multipart(mock_minio):
+    """Test that an unseekable stream of unknown size falls back to multipart."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+
+    service = StorageService()
+    service._client = mock_client
+
+    file_data = Mock()
+    file_data.seekable.return_value = False
+    service.upload_image(file_data, "test.jpg")
+
+    call_kwargs = mock_client.put_object.call_args.kwargs
+    assert call_kwargs["length"] == -1
+    assert call_kwargs["part_size"] == 5 * 1024 * 1024
+
+
 @patch("app.services.storage.Minio")
 def test_upload_image_failure_raises_storage_error(mock_minio):
     """Test that upload failure raises StorageConnectionError."""
@@ -136,3 +270,105 @@ def test_upload_image_failure_raises_storage_error(mock_minio):
         service.upload_image(file_data, "test.jpg")
 
     assert "Failed to upload file 'test.jpg' to MinIO" in str(exc_info.value)
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_content_addressed_filename(mock_minio):
+    """Test that omitting the filename derives a content hash key and uploads once."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+    # 第一次不存在，上传后第二次命中
+    mock_client.stat_object.side_effect = [
+        S3Error(
+            code="NoSuchKey",
+            message="Object does not exist",
+            resource="/image.png",
+            request_id="req",
+            host_id="host",
+            response=None,
+        ),
+        Mock(),
+    ]
+
+    service = StorageService()
+    service._client = mock_client
+
+    url = service.upload_image(io.BytesIO(b"fake image data"), content_type="image/png")
+    same_url = service.upload_image(io.BytesIO(b"fake image data"), content_type="image/png")
+
+    filename = mock_client.put_object.call_args.kwargs["object_name"]
+    assert filename.endswith(".png")
+    assert len(filename) == len("0" * 32 + ".png")
+    assert url == same_url
+    mock_client.put_object.assert_called_once()
+    assert mock_client.put_object.call_args.kwargs["length"] == len(b"fake image data")
+    assert mock_client.put_object.call_args.kwargs["data"].read() == b"fake image data"
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_skips_existing_content(mock_minio):
+    """Test that an already stored image is not uploaded again."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    mock_client.bucket_exists.return_value = True
+    mock_client.stat_object.return_value = Mock()
+
+    service = StorageService()
+    service._client = mock_client
+
+    url = service.upload_image(io.BytesIO(b"fake image data"))
+
+    mock_client.put_object.assert_not_called()
+    assert url.endswith(".jpg")
+
+
+@pytest.fixture
+def unreachable_minio():
+    """Fresh StorageService singleton configured with an endpoint nothing listens on."""
+    saved = StorageService._instance, storage._storage_service
+    StorageService._instance, storage._storage_service = None, None
+    settings = SETTINGS.model_copy(update={"minio_endpoint": "127.0.0.1:9"})
+    with patch("app.services.storage.get_settings", return_value=settings):
+        yield
+    StorageService._instance, storage._storage_service = saved
+
+
+def test_unreachable_minio_raises_storage_error(unreachable_minio):
+    """Test that an unreachable MinIO (urllib3 MaxRetryError) raises StorageConnectionError."""
+    with pytest.raises(StorageConnectionError) as exc_info:
+        StorageService()
+
+    assert isinstance(exc_info.value.__context__, urllib3.exceptions.MaxRetryError)
+
+
+def _max_retry_error():
+    return urllib3.exceptions.MaxRetryError(
+        pool=None, url="/bucket/test.jpg", reason=ConnectionRefusedError()
+    )
+
+
+@patch("app.services.storage.Minio")
+def test_upload_image_connection_error_raises_storage_error(mock_minio):
+    """Test that a connection failure during upload raises StorageConnectionError."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    service = StorageService()
+    service._client = mock_client
+    mock_client.put_object.side_effect = _max_retry_error()
+
+    with pytest.raises(StorageConnectionError):
+        service.upload_image(io.BytesIO(b"fake image data"), "test.jpg")
+
+
+@patch("app.services.storage.Minio")
+def test_object_exists_connection_error_raises_storage_error(mock_minio):
+    """Test that a connection failure during stat raises StorageConnectionError."""
+    mock_client = Mock()
+    mock_minio.return_value = mock_client
+    service = StorageService()
+    service._client = mock_client
+    mock_client.stat_object.side_effect = _max_retry_error()
+
+    with pytest.raises(StorageConnectionError):
+        service.object_exists("test.jpg")
@@ -4,8 +4,11 @@ Unit tests for TaxonomyService.
 Tests cover loading, querying, error handling, and singleton behavior.
 """
 
-from unittest.mock import mock_open, patch
+import threading
+import time
+from unittest.mock import patch
 
+import orjson
 import pytest
 
 from app.services.taxonomy_service import (
@@ -20,8 +23,10 @@ from app.services.taxonomy_service import (
 def reset_singleton():
     """Reset the singleton instance before and after each test."""
     TaxonomyService._instance = None
+    TaxonomyService._loaded = None
     yield
     TaxonomyService._instance = None
+    TaxonomyService._loaded = None
 
 
 
@@ -57,6 +62,18 @@ def test_get_by_name():
     assert entry.id == 2
 
 
+def test_get_many_by_ids():
+    """Test batch lookup keeps the requested order and rejects unknown IDs."""
+    service = TaxonomyService()
+    entries = service.get_many_by_ids([3, 1, 3])
+    assert [entry.id for entry in entries] == [3, 1, 3]
+    assert entries[0] is service.get_by_id(3)
+    assert service.get_many_by_ids([]) == []
+
+    with pytest.raises(TaxonomyNotFoundError, match="999"):
+        service.get_many_by_ids([1, 999])
+
+
 def test_get_search_keywords():
     """Test getting search keywords."""
     service = TaxonomyService()
@@ -64,6 +81,16 @@ def test_get_search_keywords():
     assert keywords == ["红蜘蛛", "二斑叶螨"]
 
 
+def test_get_query_terms():
+    """Test that query terms cover names and keywords without duplicates."""
+    service = TaxonomyService()
+    terms = service.get_query_terms()
+
+    assert len(terms) == len(set(terms))
+    assert service.get_by_id(3).zh_scientific_name in terms
+    assert {"红蜘蛛", "二斑叶螨"} <= set(terms)
+
+
 def test_invalid_id_raises_error():
     """Test that invalid ID raises error."""
     service = TaxonomyService()
@@ -108,6 +135,59 @@ def test_search_keywords_empty_when_none():
     keywords = service.get_search_keywords(0)
     assert keywords == []
 
+def test_reload_reuses_parsed_data():
+    """Test that re-creating the singleton does not re-parse an unchanged file."""
+    first = TaxonomyService()
+    TaxonomyService._instance = None
+
+    with patch.object(TaxonomyService, "_load") as mock_load:
+        second = TaxonomyService()
+
+    mock_load.assert_not_called()
+    assert second is not first
+    assert second.get_by_id(2) is first.get_by_id(2)
+
+
+def test_reload_after_file_change():
+    """Test that a changed file (different mtime/size) is parsed again."""
+    TaxonomyService()
+    key, indexes = TaxonomyService._loaded
+    TaxonomyService._loaded = ((key[0] - 1, key[1]), indexes)
+    TaxonomyService._instance = None
+
+    with patch.object(TaxonomyService, "_load", return_value=indexes) as mock_load:
+        TaxonomyService()
+
+    mock_load.assert_called_once()
+    assert TaxonomyService._loaded[0] == key
+
+
+def test_concurrent_first_use_loads_once():
+    """Test that concurrent first calls share one instance and one load."""
+    barrier = threading.Barrier(8)
+    services = []
+    real_load = TaxonomyService._load
+
+    def slow_load(json_path):
+        time.sleep(0.05)
+        return real_load(json_path)
+
+    def worker():
+        barrier.wait()
+        services.append(TaxonomyService())
+
+    with patch.object(TaxonomyService, "_load", side_effect=slow_load) as mock_load:
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+    assert len(services) == 8
+    assert all(service is services[0] for service in services)
+    mock_load.assert_called_once()
+
+
 # --- Validation Tests ---
 
 VALID_METADATA = {
@@ -134,10 +214,9 @@ def test_validation_negative_id():
     }
 
     # We patch Path.exists to force it to try opening the file
-    # We patch open/json.load to return our bad data
+    # We patch Path.read_bytes to return our bad data
     with patch("pathlib.Path.exists", return_value=True), \
-         patch("builtins.open", mock_open()), \
-         patch("json.load", return_value=bad_data):
+         patch("pathlib.Path.read_bytes", return_value=orjson.dumps(bad_data)):
 
         with pytest.raises(TaxonomyValidationError) as exc:
             TaxonomyService()
@@ -164,8 +243,7 @@ def test_validation_invalid_action_policy():
     }
 
     with patch("pathlib.Path.exists", return_value=True), \
-         patch("builtins.open", mock_open()), \
-         patch("json.load", return_value=bad_data):
+         patch("pathlib.Path.read_bytes", return_value=orjson.dumps(bad_data)):
 
         with pytest.raises(TaxonomyValidationError) as exc:
             TaxonomyService()
@@ -191,8 +269,7 @@ def test_validation_missing_field():
     }
 
     with patch("pathlib.Path.exists", return_value=True), \
-         patch("builtins.open", mock_open()), \
-         patch("json.load", return_value=bad_data):
+         patch("pathlib.Path.read_bytes", return_value=orjson.dumps(bad_data)):
 
         with pytest.raises(TaxonomyValidationError) as exc:
             TaxonomyService()
@@ -200,3 +277,57 @@ def test_validation_missing_field():
         msg = str(exc.value)
         assert "Field required" in msg
         assert "zh_scientific_name" in msg
+
+
+# --- Lookup Tests ---
+
+def test_get_by_name_or_label():
+    """Test that name and label resolve to the same entry through one index."""
+    service = TaxonomyService()
+    by_name = service.get_by_name_or_label("白粉病")
+    by_label = service.get_by_name_or_label("powdery_mildew")
+    assert by_name == by_label
+    assert [entry.id for entry in by_name] == [2]
+
+
+def test_get_by_name_or_label_returns_copy():
+    """Test that mutating the result does not affect the index."""
+    service = TaxonomyService()
+    service.get_by_name_or_label("白粉病").clear()
+    assert len(service.get_by_name_or_label("白粉病")) == 1
+    assert service.get_by_name_or_label("不存在") == []
+
+
+def test_lookup_by_name():
+    """Test lookup by Chinese scientific name."""
+    service = TaxonomyService()
+    results = service.lookup("白粉病")
+    assert [entry.id for entry in results] == [2]
+
+
+def test_lookup_by_model_label():
+    """Test lookup by model label."""
+    service = TaxonomyService()
+    results = service.lookup("spider_mite")
+    assert [entry.id for entry in results] == [3]
+
+
+def test_lookup_not_found_returns_empty_list():
+    """Test that lookup returns an empty list instead of raising."""
+    service = TaxonomyService()
+    assert service.lookup("不存在的病害") == []
+
+
+def test_lookup_prefix():
+    """Test prefix lookup with a trailing '*'."""
+    service = TaxonomyService()
+    assert [entry.id for entry in service.lookup("powdery*")] == [2]
+    assert [entry.id for entry in service.lookup("un*")] == [4]
+    assert service.lookup("zzz*") == []
+
+
+def test_lookup_prefix_deduplicates_entries():
+    """Test that an entry matched by several keys is returned once."""
+    service = TaxonomyService()
+    results = service.lookup("*")
+    assert sorted(entry.id for entry in results) == [0, 1, 2, 3, 4]
@@ -4,20 +4,44 @@ Unit tests for LLM Chains
 Tests the report generation functionality using mocked LLM calls.
 """
 
+import asyncio
+import threading
+import time
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
 from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 
 from app.worker.chains import (
+    CONTEXT_MAX_CHARS_PER_DOC,
+    GenerateReport,
+    _build_report_chain,
+    _compiled_prompt,
+    _get_chat_model,
+    _get_llm,
+    _get_simplified_report_chain,
+    _raise_llm_error,
     generate_diagnosis_report,
+    generate_diagnosis_report_async,
+    generate_diagnosis_report_stream,
     _format_contexts,
     _get_confidence_warning,
     LLMError,
     ReportTimeoutError,
+    SIMPLIFIED_REPORT_PROMPT,
+    SIMPLIFIED_REPORT_SYSTEM,
 )
 
 
+@pytest.fixture(autouse=True)
+def report_cache_path(tmp_path, monkeypatch):
+    """Use a fresh report cache file for each test."""
+    path = str(tmp_path / "report_cache.db")
+    monkeypatch.setattr("app.worker.chains.REPORT_CACHE_PATH", path)
+    return path
+
+
 @pytest.fixture
 def sample_contexts():
     """Sample document contexts for testing."""
@@ -63,6 +87,45 @@ class TestFormatContexts:
         assert "test.md" in result
         assert "Test content" in result
 
+    def test_format_contexts_skips_duplicates(self, sample_contexts):
+        """测试重复片段只保留一次，编号连续."""
+        duplicate = Document(
+            page_content=sample_contexts[0].page_content,
+            metadata={"source": "other.md"},
+        )
+        result = _format_contexts([sample_contexts[0], duplicate, sample_contexts[1]])
+
+        assert "other.md" not in result
+        assert "### 资料 2: data/knowledge/diseases/late_blight.md" in result
+        assert "资料 3" not in result
+
+    def test_format_contexts_skips_overlapping_chunks(self):
+        """测试同一资料在不同偏移处切分的重叠片段被视为重复."""
+        article = "".join(f"第{i}段：番茄晚疫病在低温高湿条件下易流行，需及时喷药。" for i in range(10))
+        first = Document(page_content=article[:300], metadata={"source": "a.md"})
+        overlapping = Document(page_content=article[30:330], metadata={"source": "b.md"})
+        different = Document(page_content="蚜虫刺吸汁液，可用吡虫啉防治。" * 5, metadata={"source": "c.md"})
+
+        result = _format_contexts([first, overlapping, different])
+
+        assert "a.md" in result
+        assert "b.md" not in result
+        assert "### 资料 2: c.md" in result
+
+    def test_format_contexts_caps_length(self):
+        """测试单个片段与总长度都被截断."""
+        docs = [
+            Document(page_content=f"{i}" * 2000, metadata={"source": f"{i}.md"})
+            for i in range(6)
+        ]
+        result = _format_contexts(docs)
+
+        assert "0" * CONTEXT_MAX_CHARS_PER_DOC in result
+        assert "0" * (CONTEXT_MAX_CHARS_PER_DOC + 1) not in result
+        # 4 个 800 字符的片段达到总上限
+        assert "### 资料 4: 3.md" in result
+        assert "4.md" not in result
+
 
 class TestConfidenceWarning:
     """Tests for _get_confidence_warning helper function."""
@@ -198,6 +261,26 @@ class TestLLMErrorHandling:
         with pytest.raises(ReportTimeoutError):
             raise ReportTimeoutError("Test timeout")
 
+    @pytest.mark.parametrize(
+        "message, expected_type, expected_text",
+        [
+            ("Request timed out", ReportTimeoutError, "LLM call timed out"),
+            ("Read Timeout", ReportTimeoutError, "LLM call timed out"),
+            ("Error code: 429 - Rate limit reached", LLMError, "API rate limit exceeded"),
+            ("Error code: 401 - invalid key", LLMError, "API authentication failed"),
+            ("context length 14290 exceeded", LLMError, "Report generation failed"),
+        ],
+    )
+    def test_raise_llm_error_classifies_message(self, message, expected_type, expected_text):
+        """测试按异常消息归类为超时、限流、认证或通用错误."""
+        original = Exception(message)
+
+        with pytest.raises(expected_type, match=expected_text) as exc_info:
+            _raise_llm_error(original)
+
+        assert type(exc_info.value) is expected_type
+        assert exc_info.value.__cause__ is original
+
     # Note: Full integration tests with actual LLM calls would be in
     # tests/integration/test_chains_integration.py to avoid API costs
     # and complexity in unit tests. The error handling logic is
@@ -208,7 +291,6 @@ class TestPromptGeneration:
     """Tests for prompt generation."""
 
     @patch("app.worker.chains._get_llm")
-    @patch("app.worker.chains.PromptTemplate")
     @patch("app.worker.chains.StrOutputParser")
     @patch("app.worker.chains._format_contexts")
     @patch("app.worker.chains._get_confidence_warning")
@@ -217,7 +299,6 @@ class TestPromptGeneration:
         mock_warning,
         mock_format,
         mock_parser,
-        mock_template,
         mock_get_llm,
         sample_contexts,
     ):
@@ -276,3 +357,308 @@ class TestPromptGeneration:
 
         # Verify format was called with contexts
         mock_format.assert_called_once_with(sample_contexts)
+
+
+class TestLLMCache:
+    """Tests for shared ChatOpenAI instances."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        _get_chat_model.cache_clear()
+        _build_report_chain.cache_clear()
+        yield
+        _get_chat_model.cache_clear()
+        _build_report_chain.cache_clear()
+
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_generate_report_instances_share_llm(self, mock_chat_cls):
+        """测试相同模型与温度的 GenerateReport 共用同一个 ChatOpenAI."""
+        first = GenerateReport(model_name="gpt-4o-mini", temperature=0.3)
+        second = GenerateReport(model_name="gpt-4o-mini", temperature=0.3)
+        other = GenerateReport(model_name="gpt-4o-mini", temperature=0.5)
+
+        assert first.llm is second.llm
+        assert mock_chat_cls.call_count == 2
+        assert other.llm is mock_chat_cls.return_value
+        mock_chat_cls.assert_called_with(model="gpt-4o-mini", temperature=0.5)
+
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_get_llm_cached_per_timeout(self, mock_chat_cls):
+        """测试 _get_llm 按 timeout 缓存实例."""
+        mock_chat_cls.side_effect = lambda **kwargs: Mock(kwargs=kwargs)
+
+        default_llm = _get_llm()
+        assert _get_llm() is default_llm
+        custom_llm = _get_llm(timeout=5)
+
+        assert custom_llm is not default_llm
+        assert _get_llm(timeout=5) is custom_llm
+        assert custom_llm.kwargs["timeout"] == 5
+        assert mock_chat_cls.call_count == 2
+
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_report_chain_compiled_once_per_type(self, mock_chat_cls):
+        """测试报告链按诊断类型编译一次并复用."""
+        disease_chain = _build_report_chain("Disease", "gpt-4o-mini", 0.3)
+
+        assert _build_report_chain("Disease", "gpt-4o-mini", 0.3) is disease_chain
+        assert _build_report_chain("Pest", "gpt-4o-mini", 0.3) is not disease_chain
+
+        with pytest.raises(ValueError):
+            _build_report_chain("Unknown", "gpt-4o-mini", 0.3)
+
+    @patch("app.worker.chains._build_report_chain")
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_generate_uses_cached_chain(self, mock_chat_cls, mock_build):
+        """测试 generate 使用缓存的报告链."""
+        mock_build.return_value.invoke.return_value = "# 报告"
+        generator = GenerateReport(model_name="gpt-4o-mini", temperature=0.3)
+
+        report = generator.generate("Disease", "白粉病", "powdery_mildew", [])
+
+        assert report == "# 报告"
+        mock_build.assert_called_once_with("Disease", "gpt-4o-mini", 0.3)
+        inputs = mock_build.return_value.invoke.call_args[0][0]
+        assert inputs["diagnosis_name"] == "白粉病"
+
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_format_context_dedupes_and_falls_back(self, mock_chat_cls):
+        """测试 GenerateReport 的上下文去重与空结果提示."""
+        generator = GenerateReport()
+        doc = Document(page_content="番茄晚疫病由致病疫霉引起。")
+
+        result = generator._format_context([doc, doc])
+
+        assert result.count("【上下文片段") == 1
+        assert generator._format_context([]) == "未检索到相关上下文信息。"
+
+    @patch("app.worker.chains._build_report_chain")
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_generate_batch_groups_by_type(self, mock_chat_cls, mock_build):
+        """测试批量生成按类型分组调用 batch，并按输入顺序返回."""
+        chains = {"Disease": MagicMock(), "Pest": MagicMock()}
+        mock_build.side_effect = lambda diagnosis_type, *args: chains[diagnosis_type]
+        chains["Disease"].batch.side_effect = lambda inputs, config: [
+            f"病害:{x['diagnosis_name']}" for x in inputs
+        ]
+        chains["Pest"].batch.side_effect = lambda inputs, config: [
+            f"虫害:{x['diagnosis_name']}" for x in inputs
+        ]
+        generator = GenerateReport()
+
+        reports = generator.generate_batch([
+            {"diagnosis_type": "Disease", "diagnosis_name": "白粉病", "documents": []},
+            {"diagnosis_type": "Pest", "diagnosis_name": "蚜虫类", "documents": []},
+            {"diagnosis_type": "Disease", "diagnosis_name": "晚疫病", "documents": []},
+        ])
+
+        assert reports == ["病害:白粉病", "虫害:蚜虫类", "病害:晚疫病"]
+        chains["Disease"].batch.assert_called_once()
+        assert chains["Disease"].batch.call_args.kwargs["config"] == {"max_concurrency": 2}
+        chains["Pest"].batch.assert_called_once()
+
+    @patch("app.worker.chains._build_report_chain")
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_generate_batch_submits_longest_context_first(self, mock_chat_cls, mock_build):
+        """测试同类型批量生成时长上下文优先提交，结果仍按输入顺序返回."""
+        chain = MagicMock()
+        mock_build.return_value = chain
+        chain.batch.side_effect = lambda inputs, config: [x["diagnosis_name"] for x in inputs]
+        short_doc = [Document(page_content="短", metadata={})]
+        long_doc = [Document(page_content="长" * 500, metadata={})]
+        generator = GenerateReport()
+
+        reports = generator.generate_batch([
+            {"diagnosis_type": "Disease", "diagnosis_name": "a", "documents": short_doc},
+            {"diagnosis_type": "Disease", "diagnosis_name": "b", "documents": long_doc},
+            {"diagnosis_type": "Disease", "diagnosis_name": "c", "documents": []},
+        ])
+
+        submitted = [x["diagnosis_name"] for x in chain.batch.call_args.args[0]]
+        assert submitted == ["b", "a", "c"]
+        assert reports == ["a", "b", "c"]
+
+    @patch("app.worker.chains.ChatOpenAI")
+    def test_report_chain_reuses_compiled_prompt(self, mock_chat_cls):
+        """测试不同模型参数的报告链共用同一个已编译的提示词."""
+        chain_a = _build_report_chain("Pest", "gpt-4o-mini", 0.3)
+        chain_b = _build_report_chain("Pest", "gpt-4o", 0.3)
+
+        assert chain_a.first is _compiled_prompt("Pest")
+        assert chain_b.first is chain_a.first
+
+    def test_simplified_report_chain_cached_per_llm(self):
+        """测试简化报告链按 LLM 实例缓存."""
+        llm_a = MagicMock()
+        llm_b = MagicMock()
+
+        chain = _get_simplified_report_chain(llm_a)
+
+        assert _get_simplified_report_chain(llm_a) is chain
+        assert _get_simplified_report_chain(llm_b) is not chain
+
+
+class TestReportCache:
+    """Tests for the persistent report cache."""
+
+    @pytest.fixture
+    def fake_llm(self):
+        with patch("app.worker.chains._get_llm") as mock_get_llm:
+            llm = FakeListChatModel(responses=["# 报告一", "# 报告二", "# 报告三"])
+            mock_get_llm.return_value = llm
+            yield llm
+
+    def test_repeated_diagnosis_uses_cache(self, fake_llm, sample_contexts):
+        """测试相同诊断与上下文第二次直接返回缓存的报告（含异步路径）."""
+        kwargs = dict(
+            diagnosis_name="番茄晚疫病", crop_type="番茄", confidence=0.92, contexts=sample_contexts
+        )
+
+        first = generate_diagnosis_report(**kwargs)
+        second = generate_diagnosis_report(**kwargs)
+        third = asyncio.run(generate_diagnosis_report_async(**kwargs))
+
+        assert first == second == third == "# 报告一"
+
+    def test_stream_yields_chunks_and_caches(self, fake_llm, sample_contexts):
+        """测试流式生成分块返回报告，完成后写入缓存供非流式路径复用."""
+        chunks = list(generate_diagnosis_report_stream("番茄晚疫病", "番茄", 0.92, sample_contexts))
+
+        assert len(chunks) > 1
+        assert "".join(chunks) == "# 报告一"
+        assert generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts) == "# 报告一"
+        # 缓存命中时整份报告作为一个分块返回
+        assert list(generate_diagnosis_report_stream("番茄晚疫病", "番茄", 0.92, sample_contexts)) == [
+            "# 报告一"
+        ]
+
+    def test_stream_closed_early_releases_inflight(self, fake_llm, sample_contexts):
+        """测试调用方提前关闭流时不缓存残缺报告，后续请求重新生成."""
+        stream = generate_diagnosis_report_stream("番茄晚疫病", "番茄", 0.92, sample_contexts)
+        next(stream)
+        stream.close()
+
+        assert generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts) == "# 报告二"
+
+    @patch("app.worker.chains._open_report_cache")
+    def test_cache_write_failure_still_releases_inflight(
+        self, mock_open_cache, fake_llm, sample_contexts
+    ):
+        """测试缓存写入失败时仍返回报告，并释放在途记录（后续相同请求不会阻塞）."""
+        from app.worker import chains
+
+        mock_open_cache.return_value.get.return_value = None
+        mock_open_cache.return_value.set.side_effect = OSError("read-only file system")
+
+        assert generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts) == "# 报告一"
+        assert chains._inflight_reports == {}
+        assert "".join(
+            generate_diagnosis_report_stream("番茄晚疫病", "番茄", 0.92, sample_contexts)
+        ) == "# 报告二"
+        assert chains._inflight_reports == {}
+
+    def test_different_context_misses(self, fake_llm, sample_contexts):
+        """测试检索上下文不同则重新生成."""
+        first = generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts)
+        second = generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts[:1])
+
+        assert (first, second) == ("# 报告一", "# 报告二")
+
+    def test_low_confidence_not_cached(self, fake_llm, sample_contexts):
+        """测试低置信度的报告不写入缓存."""
+        first = generate_diagnosis_report("番茄晚疫病", "番茄", 0.55, sample_contexts)
+        second = generate_diagnosis_report("番茄晚疫病", "番茄", 0.55, sample_contexts)
+
+        assert (first, second) == ("# 报告一", "# 报告二")
+
+    @patch("app.worker.chains._get_simplified_report_chain")
+    @patch("app.worker.chains._get_llm")
+    def test_concurrent_identical_requests_share_one_call(
+        self, mock_get_llm, mock_get_chain, sample_contexts
+    ):
+        """测试相同报告并发请求只调用一次 LLM，其余请求等待其结果."""
+        started = threading.Event()
+
+        def slow_invoke(inputs):
+            started.set()
+            time.sleep(0.1)
+            return "# 报告"
+
+        mock_get_chain.return_value.invoke.side_effect = slow_invoke
+        reports = []
+
+        def worker():
+            reports.append(generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        threads[0].start()
+        started.wait(timeout=5)
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert reports == ["# 报告"] * 4
+        assert mock_get_chain.return_value.invoke.call_count == 1
+
+    @patch("app.worker.chains._get_simplified_report_chain")
+    @patch("app.worker.chains._get_llm")
+    def test_waiters_receive_owner_error(self, mock_get_llm, mock_get_chain, sample_contexts):
+        """测试生成失败时等待中的请求得到同样的分类错误，且失败不会残留在途记录."""
+        started = threading.Event()
+
+        def failing_invoke(inputs):
+            started.set()
+            time.sleep(0.1)
+            raise Exception("Request timed out")
+
+        mock_get_chain.return_value.invoke.side_effect = failing_invoke
+        errors = []
+
+        def worker():
+            try:
+                generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts)
+            except ReportTimeoutError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        threads[0].start()
+        started.wait(timeout=5)
+        threads[1].start()
+        for t in threads:
+            t.join(timeout=5)
+
+        assert len(errors) == 2
+        assert mock_get_chain.return_value.invoke.call_count == 1
+
+        mock_get_chain.return_value.invoke.side_effect = None
+        mock_get_chain.return_value.invoke.return_value = "# 重试成功"
+        assert generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts) == "# 重试成功"
+
+    def test_custom_llm_not_cached(self, sample_contexts):
+        """测试传入自定义 LLM 时不读写缓存."""
+        llm = FakeListChatModel(responses=["# 自定义一", "# 自定义二"])
+
+        first = generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts, llm=llm)
+        second = generate_diagnosis_report("番茄晚疫病", "番茄", 0.92, sample_contexts, llm=llm)
+
+        assert (first, second) == ("# 自定义一", "# 自定义二")
+
+
+class TestSimplifiedReportPrompt:
+    """Tests for the diagnosis report prompt layout."""
+
+    def test_static_instructions_precede_dynamic_fields(self):
+        """测试静态说明全部位于系统消息，动态字段只出现在最后的用户消息."""
+        messages = SIMPLIFIED_REPORT_PROMPT.invoke({
+            "crop_type": "番茄",
+            "diagnosis_name": "番茄晚疫病",
+            "confidence": 0.923,
+            "confidence_warning": "",
+            "context_section": "### 资料 1: test.md",
+        }).to_messages()
+
+        assert [m.type for m in messages] == ["system", "human"]
+        assert messages[0].content == SIMPLIFIED_REPORT_SYSTEM
+        assert "番茄晚疫病" in messages[1].content
+        assert "92.3%" in messages[1].content
@@ -16,6 +16,14 @@ from app.worker.chains import LLMError, ReportTimeoutError
 from app.worker.diagnosis_tasks import analyze_image
 
 
+@pytest.fixture(autouse=True)
+def diagnosis_cache_path(tmp_path, monkeypatch):
+    """每个测试使用独立的诊断缓存文件"""
+    path = str(tmp_path / "diagnosis_cache.db")
+    monkeypatch.setattr("app.worker.diagnosis_tasks.DIAGNOSIS_CACHE_PATH", path)
+    return path
+
+
 def create_mock_task():
     """创建一个 mock Celery 任务实例（辅助函数）"""
     task = Mock()
@@ -742,3 +750,92 @@ def test_analyze_image_with_report_low_confidence():
                     # 注意：confidence 是从 mock_result 中随机选择的，可能是低值
                     assert "confidence" in call_args[1]
 
+
+
+def _worker_sender(queues):
+    sender = Mock()
+    sender.app.amqp.queues.consume_from = {name: Mock() for name in queues}
+    return sender
+
+
+@pytest.fixture
+def fresh_rag_service(tmp_path, monkeypatch):
+    """独立的 RAG 服务单例（预热测试走真实的加载流程）"""
+    from app.services.rag_service import reset_rag_service
+
+    monkeypatch.setattr(
+        "app.services.rag_service.RAG_DISK_CACHE_PATH", str(tmp_path / "rag_cache.db")
+    )
+    monkeypatch.setattr("app.services.rag_service.KEYWORD_VECTORS_PATH", "")
+    reset_rag_service()
+    yield tmp_path
+    reset_rag_service()
+
+
+def test_warm_up_services_on_diagnosis_worker(fresh_rag_service, monkeypatch):
+    """测试诊断 worker 启动时预先加载分类服务和 ChromaDB."""
+    from app.services.rag_service import get_rag_service
+    from app.worker.diagnosis_tasks import _warm_up_services
+
+    monkeypatch.setattr("app.services.rag_service.CHROMA_PERSIST_DIR", str(fresh_rag_service))
+    with patch('app.worker.diagnosis_tasks.get_taxonomy_service') as mock_taxonomy, \
+         patch('app.services.rag_service.OpenAIEmbeddings') as mock_embeddings, \
+         patch('app.services.rag_service.Chroma') as mock_chroma:
+        _warm_up_services(sender=_worker_sender(["diagnosis"]))
+
+    mock_taxonomy.assert_called_once()
+    mock_embeddings.assert_called_once()
+    mock_chroma.assert_called_once()
+    assert get_rag_service()._chroma_db is mock_chroma.return_value
+
+
+def test_warm_up_services_skips_other_queues():
+    """测试不消费诊断队列的 worker 不做预热."""
+    from app.worker.diagnosis_tasks import _warm_up_services
+
+    with patch('app.worker.diagnosis_tasks.get_rag_service') as mock_rag:
+        _warm_up_services(sender=_worker_sender(["default"]))
+
+    mock_rag.assert_not_called()
+
+
+def test_warm_up_services_failure_is_logged(fresh_rag_service, monkeypatch, caplog):
+    """测试 ChromaDB 未初始化时预热失败只记录日志，不影响 worker 启动."""
+    from app.worker.diagnosis_tasks import _warm_up_services
+
+    monkeypatch.setattr(
+        "app.services.rag_service.CHROMA_PERSIST_DIR", str(fresh_rag_service / "missing")
+    )
+    with patch('app.worker.diagnosis_tasks.get_taxonomy_service'), \
+         patch('app.services.rag_service.Chroma') as mock_chroma, \
+         caplog.at_level("WARNING", logger="app.worker.diagnosis_tasks"):
+        _warm_up_services(sender=_worker_sender(["diagnosis"]))
+
+    mock_chroma.assert_not_called()
+    assert "Service warm-up failed" in caplog.text
+    assert "ChromaDB not initialized" in caplog.text
+
+
+def test_timer_logs_elapsed_time(caplog):
+    """测试计时器在 INFO 级别记录耗时."""
+    from app.worker.diagnosis_tasks import _timer
+
+    with caplog.at_level("INFO", logger="app.worker.diagnosis_tasks"):
+        with _timer("task-1", "image_download"):
+            pass
+
+    assert "[Task task-1] image_download completed in" in caplog.text
+
+
+def test_timer_skipped_when_info_disabled():
+    """测试 INFO 级别关闭时计时器不计时也不记录."""
+    from app.worker.diagnosis_tasks import _timer
+
+    with patch('app.worker.diagnosis_tasks.logger') as mock_logger, \
+         patch('app.worker.diagnosis_tasks.time.perf_counter_ns') as mock_clock:
+        mock_logger.isEnabledFor.return_value = False
+        with _timer("task-1", "image_download"):
+            pass
+
+    mock_clock.assert_not_called()
+    mock_logger.info.assert_not_called()
@@ -6,11 +6,22 @@ Tests for RAG and LLM integration in diagnosis tasks.
 
 from unittest.mock import Mock, patch
 
+import pytest
 from langchain_core.documents import Document
 
+from app.core.config import SETTINGS
 from app.services.rag_service import RAGServiceNotInitializedError
 from app.worker.chains import LLMError, ReportTimeoutError
-from app.worker.diagnosis_tasks import analyze_image
+from app.core.ssrf_protection import ImageDownloadError
+from app.worker.diagnosis_tasks import analyze_image, analyze_images_batch, generate_report
+
+
+@pytest.fixture(autouse=True)
+def diagnosis_cache_path(tmp_path, monkeypatch):
+    """每个测试使用独立的诊断缓存文件"""
+    path = str(tmp_path / "diagnosis_cache.db")
+    monkeypatch.setattr("app.worker.diagnosis_tasks.DIAGNOSIS_CACHE_PATH", path)
+    return path
 
 
 def test_analyze_image_with_report():
@@ -262,3 +273,294 @@ def test_analyze_image_llm_api_error():
                     # 验证任务未失败
                     assert result["diagnosis_name"] == "番茄晚疫病"
                     assert result["taxonomy_id"] == 1
+
+
+# Settings 实例不可变，测试时替换为开启提前返回的副本
+EARLY_RETURN_SETTINGS = SETTINGS.model_copy(update={"diagnosis_early_return": True})
+
+
+def _mock_retrieve_taxonomy():
+    """创建返回 RETRIEVE 策略条目的 TaxonomyService mock（辅助函数）"""
+    mock_taxonomy = Mock()
+    mock_entry = Mock()
+    mock_entry.zh_scientific_name = "番茄晚疫病"
+    mock_entry.latin_name = "Phytophthora infestans"
+    mock_entry.category = "Disease"
+    mock_entry.action_policy = "RETRIEVE"
+    mock_entry.id = 1
+    mock_entry.description = "致病疫霉引起的病害"
+    mock_entry.risk_level = "high"
+    mock_taxonomy.get_by_model_label.return_value = mock_entry
+    return mock_taxonomy
+
+
+def test_analyze_image_early_return_dispatches_report():
+    """测试提前返回模式：诊断结果立即返回，报告交给后续任务生成"""
+    report_task = Mock()
+    report_task.id = "report-task-1"
+
+    with patch('app.worker.diagnosis_tasks.SETTINGS', EARLY_RETURN_SETTINGS), \
+            patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img"), \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report') as mock_generate, \
+            patch.object(generate_report, "apply_async", return_value=report_task) as mock_dispatch:
+        async_result = analyze_image.apply(
+            args=["http://example.com/test.jpg"],
+            kwargs={"crop_type": "番茄"}
+        )
+        result, result_task_id = async_result.result, async_result.id
+
+    # 诊断任务本身不调用 LLM
+    mock_generate.assert_not_called()
+    assert mock_dispatch.call_args[1]["kwargs"] == {
+        "diagnosis_name": "番茄晚疫病",
+        "confidence": result["confidence"],
+        "crop_type": "番茄",
+        "stream_id": result_task_id,
+    }
+    assert result["report"] is None
+    assert result["report_error"] is None
+    assert result["report_task_id"] == "report-task-1"
+    assert result["report_status"] == "PENDING"
+
+
+def test_analyze_image_early_return_dispatch_failure_falls_back():
+    """测试报告任务投递失败时改为同步生成报告"""
+    with patch('app.worker.diagnosis_tasks.SETTINGS', EARLY_RETURN_SETTINGS), \
+            patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img"), \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告"), \
+            patch.object(generate_report, "apply_async",
+                         side_effect=ConnectionError("broker down")):
+        mock_get_rag.return_value.query.return_value = []
+        result = analyze_image.apply(args=["http://example.com/test.jpg"]).result
+
+    assert result["report"] == "# 报告"
+    assert "report_task_id" not in result
+
+
+def test_generate_report_task():
+    """测试报告任务返回报告与耗时"""
+    with patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告") as mock_generate:
+        mock_get_rag.return_value.query.return_value = []
+        result = generate_report.apply(
+            kwargs={"diagnosis_name": "番茄晚疫病", "confidence": 0.9, "crop_type": "番茄"}
+        ).result
+
+    mock_get_rag.return_value.query.assert_called_once_with("番茄 番茄晚疫病", top_k=3)
+    assert mock_generate.call_args[1]["crop_type"] == "番茄"
+    assert result["report"] == "# 报告"
+    assert result["report_error"] is None
+    assert result["timings"]["llm_report_ms"] >= 0
+
+
+def test_analyze_image_streams_report_when_enabled():
+    """测试开启报告流时，报告分块发布到以诊断任务 ID 为键的报告流"""
+    streaming_settings = SETTINGS.model_copy(update={"report_streaming": True})
+
+    with patch('app.worker.diagnosis_tasks.SETTINGS', streaming_settings), \
+            patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img"), \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report') as mock_generate, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report_stream',
+                  return_value=iter(["# 报告", "\n正文"])), \
+            patch('app.worker.diagnosis_tasks.publish_report_stream',
+                  side_effect=lambda stream_id, chunks: "".join(chunks)) as mock_publish:
+        mock_get_rag.return_value.query.return_value = []
+        async_result = analyze_image.apply(args=["http://example.com/test.jpg"])
+
+    mock_generate.assert_not_called()
+    assert mock_publish.call_args[0][0] == async_result.id
+    assert async_result.result["report"] == "# 报告\n正文"
+
+
+def test_analyze_image_repeated_image_uses_cache():
+    """测试相同图片再次诊断时直接返回缓存结果，不再调用 RAG 和 LLM"""
+    with patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img"), \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告") as mock_generate:
+        mock_get_rag.return_value.query.return_value = []
+        first = analyze_image.apply(args=["http://example.com/a.jpg?sig=1"]).result
+        second = analyze_image.apply(args=["http://example.com/a.jpg?sig=2"]).result
+        other_crop = analyze_image.apply(
+            args=["http://example.com/a.jpg"], kwargs={"crop_type": "黄瓜"}
+        ).result
+
+    assert mock_generate.call_count == 2
+    assert second["model_label"] == first["model_label"]
+    assert second["report"] == "# 报告"
+    assert second["timings"]["llm_report_ms"] is None
+    assert other_crop["crop_type"] == "黄瓜"
+
+
+def test_analyze_image_report_error_not_cached():
+    """测试报告生成失败的结果不缓存，重试时重新生成"""
+    with patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img"), \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  side_effect=[LLMError("rate limit"), "# 报告"]):
+        mock_get_rag.return_value.query.return_value = []
+        first = analyze_image.apply(args=["http://example.com/a.jpg"]).result
+        second = analyze_image.apply(args=["http://example.com/a.jpg"]).result
+
+    assert first["report_error"] is not None
+    assert second["report"] == "# 报告"
+
+
+def test_analyze_images_batch():
+    """测试批量诊断：结果与 URL 顺序一致，单张失败不影响其他图片，不提前返回"""
+    urls = ["http://example.com/a.jpg", "http://example.com/b.jpg", "http://example.com/c.jpg"]
+
+    with patch('app.worker.diagnosis_tasks.SETTINGS', EARLY_RETURN_SETTINGS), \
+            patch('app.worker.diagnosis_tasks.download_images_batch_sync',
+                  return_value=[b"img-a", ImageDownloadError("404"), b"img-c"]) as mock_download, \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告") as mock_generate, \
+            patch.object(generate_report, "apply_async") as mock_dispatch:
+        mock_get_rag.return_value.query.return_value = []
+        results = analyze_images_batch.apply(
+            args=[urls], kwargs={"crop_type": "番茄"}
+        ).result
+
+    assert mock_download.call_args[0][0] == urls
+    assert len(results) == 3
+    assert results[0]["report"] == "# 报告"
+    assert results[0]["crop_type"] == "番茄"
+    assert "图片下载失败" in results[1]["error"]
+    assert results[2]["report"] == "# 报告"
+    assert mock_generate.call_count == 2
+    mock_dispatch.assert_not_called()
+
+
+def test_analyze_images_batch_too_many_images():
+    """测试批量诊断图片数量超限"""
+    from app.worker.diagnosis_tasks import BATCH_MAX_IMAGES
+
+    urls = [f"http://example.com/{i}.jpg" for i in range(BATCH_MAX_IMAGES + 1)]
+    async_result = analyze_images_batch.apply(args=[urls])
+
+    assert isinstance(async_result.result, ValueError)
+
+
+def test_analyze_image_same_url_skips_download():
+    """测试同一 URL 再次诊断时（诊断已缓存）不再下载图片"""
+    with patch('app.worker.diagnosis_tasks.download_image_securely',
+               return_value=b"img") as mock_download, \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告"):
+        mock_get_rag.return_value.query.return_value = []
+        first = analyze_image.apply(args=["http://example.com/a.jpg"]).result
+        second = analyze_image.apply(args=["http://example.com/a.jpg"]).result
+        # 作物类型不同，诊断未缓存，仍需下载
+        analyze_image.apply(args=["http://example.com/a.jpg"], kwargs={"crop_type": "黄瓜"})
+
+    assert mock_download.call_count == 2
+    assert second["report"] == first["report"]
+    assert second["timings"]["image_download_ms"] == 0
+
+
+def test_analyze_image_same_url_downloads_again_after_url_ttl(monkeypatch):
+    """测试 URL 映射过期后重新下载图片（外部 URL 的内容可能已变化）"""
+    monkeypatch.setattr("app.worker.diagnosis_tasks.DIAGNOSIS_URL_CACHE_TTL", 0)
+    with patch('app.worker.diagnosis_tasks.download_image_securely',
+               side_effect=[b"img-old", b"img-new"]) as mock_download, \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告"):
+        mock_get_rag.return_value.query.return_value = []
+        analyze_image.apply(args=["http://example.com/a.jpg"])
+        analyze_image.apply(args=["http://example.com/a.jpg"])
+
+    assert mock_download.call_count == 2
+
+
+def test_analyze_images_batch_skips_cached_urls():
+    """测试批量诊断只下载未缓存的 URL"""
+    with patch('app.worker.diagnosis_tasks.download_image_securely', return_value=b"img-a"), \
+            patch('app.worker.diagnosis_tasks.download_images_batch_sync',
+                  return_value=[b"img-b"]) as mock_download, \
+            patch('app.worker.diagnosis_tasks.get_taxonomy_service',
+                  return_value=_mock_retrieve_taxonomy()), \
+            patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告"):
+        mock_get_rag.return_value.query.return_value = []
+        analyze_image.apply(args=["http://example.com/a.jpg"])
+        results = analyze_images_batch.apply(
+            args=[["http://example.com/a.jpg", "http://example.com/b.jpg"]]
+        ).result
+
+    assert mock_download.call_args[0][0] == ["http://example.com/b.jpg"]
+    assert results[0]["timings"]["image_download_ms"] == 0
+    assert results[1]["report"] == "# 报告"
+
+
+def test_generate_report_keeps_crop_in_query():
+    """测试不同作物的同一病害使用不同的 RAG 查询"""
+    with patch('app.worker.diagnosis_tasks.get_rag_service') as mock_get_rag, \
+            patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                  return_value="# 报告"):
+        mock_get_rag.return_value.query.return_value = []
+        generate_report.apply(
+            kwargs={"diagnosis_name": "白粉病", "confidence": 0.9, "crop_type": "黄瓜"}
+        )
+        generate_report.apply(
+            kwargs={"diagnosis_name": "白粉病", "confidence": 0.9, "crop_type": "番茄"}
+        )
+
+    queries = [call.args[0] for call in mock_get_rag.return_value.query.call_args_list]
+    assert queries == ["黄瓜 白粉病", "番茄 白粉病"]
+
+
+def test_generate_report_uses_precomputed_query_vector(tmp_path, monkeypatch):
+    """测试未提供作物类型时 RAG 查询命中预计算的分类术语向量，不调用 embedding API"""
+    from app.services.keyword_vectors import KeywordVectors
+    from app.services.rag_service import reset_rag_service
+    from app.worker.diagnosis_tasks import _generate_report
+
+    vectors_path = str(tmp_path / "keyword_vectors.npz")
+    embedder = Mock()
+    embedder.embed_documents.return_value = [[0.6, 0.8, 0.0]]
+    KeywordVectors.build(["番茄晚疫病"], embedder, model="text-embedding-3-small").save(
+        vectors_path
+    )
+    monkeypatch.setattr("app.services.rag_service.KEYWORD_VECTORS_PATH", vectors_path)
+    monkeypatch.setattr("app.services.rag_service.CHROMA_PERSIST_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        "app.services.rag_service.RAG_DISK_CACHE_PATH", str(tmp_path / "rag_cache.db")
+    )
+    reset_rag_service()
+    try:
+        with patch('app.services.rag_service.OpenAIEmbeddings') as mock_embeddings_cls, \
+                patch('app.services.rag_service.Chroma') as mock_chroma_cls, \
+                patch('app.worker.diagnosis_tasks.generate_diagnosis_report',
+                      return_value="# 报告"):
+            mock_chroma_cls.return_value.similarity_search_by_vector.return_value = []
+            result = _generate_report("task-1", diagnosis_name="番茄晚疫病", confidence=0.9)
+    finally:
+        reset_rag_service()
+
+    assert result["report"] == "# 报告"
+    mock_chroma_cls.return_value.similarity_search_by_vector.assert_called_once()
+    mock_embeddings_cls.return_value.embed_query.assert_not_called()